@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import pandas as pd
+from datetime import datetime, timedelta
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing.database_manager import DatabaseManager, HistoricalWeather, decode_metric_frame
+from processing.db_backends import get_backend
+from processing.engine_registry import pool_options
+from processing.weather_rollups import WeatherRollupManager, rollup_statistics
+from processing.partition_manager import HistoricalPartitionManager
+from processing.city_catalog import city_id_map
+from analysis.data_analyzer import historical_data_query, evaluate_alerts
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def async_pool_options():
+    """异步引擎的连接池参数：与同步连接池的配置一致，连接数由 DB_ASYNC_POOL_SIZE 单独配置"""
+    options = pool_options()
+    # 异步引擎使用SQLAlchemy默认的异步连接池
+    options.pop('poolclass')
+    options['pool_size'] = int(os.getenv('DB_ASYNC_POOL_SIZE', 20))
+    return options
+
+class AsyncWeatherDataAccess:
+    """基于SQLAlchemy asyncio扩展的异步数据访问层
+    
+    使用与 WeatherDataAnalyzer 相同的查询（historical_data_query、汇总表查询）和结果处理，
+    通过异步驱动（SQLite为aiosqlite，MySQL为aiomysql）执行：等待数据库返回期间事件循环可以处理其他请求，
+    一个线程即可同时执行多个慢查询，并发查询数由异步连接池（DB_ASYNC_POOL_SIZE，默认20）限制。
+    城市ID映射和分区列表仍由同步的 DatabaseManager 维护，只在需要刷新时放到线程中执行。
+    """
+    
+    def __init__(self, backend=None, **engine_options):
+        """
+        Args:
+            backend: 数据库后端，默认按 DB_BACKEND 配置
+            engine_options: 额外的异步引擎参数（覆盖默认的连接池参数）
+        """
+        # 先创建异步引擎：未安装异步驱动时直接抛出ImportError
+        backend = backend or get_backend()
+        self.engine = backend.create_async_engine(**{**async_pool_options(), **engine_options})
+        self.db_manager = DatabaseManager(backend)
+        
+        # 城市名称到 city_id 的进程内映射（与同步访问共用）
+        self.city_ids = city_id_map(self.db_manager.engine)
+        
+        # 历史天气表按时间分区（HISTORICAL_PARTITIONING）时用于裁剪查询的分区
+        self.partitions = HistoricalPartitionManager(self.db_manager) if os.getenv('HISTORICAL_PARTITIONING') else None
+        
+        # 汇总表查询
+        self.rollups = WeatherRollupManager(self.db_manager)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def _city_id(self, city_name):
+        """按名称查找城市ID，映射需要刷新时在线程中查询，不阻塞事件循环"""
+        if self.city_ids.stale():
+            await asyncio.to_thread(self.city_ids.snapshot)
+        return self.city_ids.lookup(city_name)
+    
+    async def _fetch(self, statement):
+        """执行查询并返回DataFrame"""
+        async with self.engine.connect() as conn:
+            result = await conn.execute(statement)
+            return pd.DataFrame(result.all(), columns=list(result.keys()))
+    
+    async def get_historical_data(self, city_name=None, start_date=None, end_date=None):
+        """异步获取历史气象数据（字段和索引与 WeatherDataAnalyzer.get_historical_data 一致）"""
+        try:
+            city_id = None
+            if city_name:
+                city_id = await self._city_id(city_name)
+                if city_id is None:
+                    logger.warning(f"城市 {city_name} 不在站点目录中")
+                    return pd.DataFrame()
+            
+            weather = HistoricalWeather
+            if self.partitions is not None:
+                # 首次确定分区列表时需要查询数据库
+                weather = await asyncio.to_thread(self.partitions.source, start_date, end_date)
+            
+            df = decode_metric_frame(await self._fetch(historical_data_query(weather, city_id, start_date, end_date)), HistoricalWeather)
+            if not df.empty:
+                df.set_index('timestamp', inplace=True)
+            return df
+        except Exception as e:
+            logger.error(f"异步获取历史数据失败: {e}")
+            return pd.DataFrame()
+    
+    async def check_weather_alerts(self, city_name, thresholds):
+        """异步检查天气预警（规则与 WeatherDataAnalyzer.check_weather_alerts 一致）
+        
+        Returns:
+            list: 触发的预警列表
+        """
+        try:
+            # 获取最新数据（最近24小时）
+            end_date = datetime.now()
+            start_date = end_date - timedelta(days=1)
+            
+            df = await self.get_historical_data(city_name, start_date, end_date)
+            if df.empty:
+                return []
+            
+            return evaluate_alerts(city_name, df, thresholds)
+        except Exception as e:
+            logger.error(f"异步检查天气预警失败: {e}")
+            return []
+    
+    async def read_rollups(self, metric, grain, city_name=None):
+        """异步读取按天/按月汇总的统计值（结果与 WeatherRollupManager.read 一致）
+        
+        Args:
+            metric: 指标名称
+            grain: 时间粒度（day/month）
+            city_name: 城市名称，为空时读取所有城市
+        """
+        try:
+            city_id = None
+            if city_name:
+                city_id = await self._city_id(city_name)
+                if city_id is None:
+                    return pd.DataFrame()
+            
+            return rollup_statistics(await self._fetch(self.rollups.read_query(metric, grain, city_id)))
+        except Exception as e:
+            logger.error(f"异步读取汇总数据失败: {e}")
+            return pd.DataFrame()
+    
+    async def close(self):
+        """释放异步连接池和同步数据库连接"""
+        await self.engine.dispose()
+        self.db_manager.close()
+
+async def run_concurrent(city_names, concurrency):
+    """同时发起多个历史数据查询，返回各查询的行数和总耗时"""
+    async with AsyncWeatherDataAccess() as access:
+        start = time.perf_counter()
+        frames = await asyncio.gather(*[
+            access.get_historical_data(city_names[i % len(city_names)]) for i in range(concurrency)
+        ])
+        return [len(frame) for frame in frames], time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='在一个线程中并发执行多个历史数据查询（异步数据访问层示例）')
+    parser.add_argument('--city', action='append', help='查询的城市（可重复指定，默认北京）')
+    parser.add_argument('--concurrency', type=int, default=20, help='同时发起的查询数')
+    args = parser.parse_args()
+    
+    rows, elapsed = asyncio.run(run_concurrent(args.city or ['beijing'], args.concurrency))
+    logger.info(f"{len(rows)} 个并发查询完成，共 {sum(rows)} 行，耗时 {elapsed:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
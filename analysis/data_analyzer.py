@@ -3,8 +3,14 @@ import numpy as np
 import logging
 from datetime import datetime, timedelta
 import os
+from sqlalchemy import select
 from sqlalchemy.orm import sessionmaker
-from processing.database_manager import DatabaseManager, HistoricalWeather, City, DataSource
+from processing.database_manager import DatabaseManager, HistoricalWeather, City, DataSource, raw_metric_columns, decode_metric_frame, CLUSTERED_LAYOUT
+from processing.parquet_lake import ParquetLake
+from processing.weather_rollups import WeatherRollupManager
+from processing.partition_manager import HistoricalPartitionManager
+from processing.city_catalog import city_id_map
+from processing.hot_window import HOT_WINDOW_ENABLED, HOT_WINDOW_HOURS, HOT_METRICS, hot_window, window_statistics
 from statsmodels.tsa.arima.model import ARIMA
 from sklearn.metrics import mean_squared_error
 from math import sqrt
@@ -13,79 +19,213 @@ from math import sqrt
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 最近观测的字段（热数据窗口和数据库查询结果一致）
+RECENT_COLUMNS = ['city_id', 'source_id'] + HOT_METRICS
+
+def historical_data_query(weather=HistoricalWeather, city_id=None, start_date=None, end_date=None):
+    """get_historical_data 的查询：按城市和时间范围读取历史数据
+    
+    查询字段都在 (city_id, timestamp) 开头的覆盖索引（聚簇主键布局下为主键）中，
+    指定城市时按索引顺序读取时间范围内的行，不回表也不额外排序。
+    
+    Args:
+        weather: 历史数据表模型（按时间分区时为分区查询来源）
+        city_id: 城市ID（由城市ID映射解析城市名称得到），为空时读取所有城市
+    """
+    # 按列读取原始数值，再整列换算为浮点数，避免逐行构造ORM对象和Decimal
+    # 聚簇主键布局下没有自增id字段
+    id_columns = [] if CLUSTERED_LAYOUT else [weather.id]
+    query = select(
+        *id_columns,
+        weather.city_id,
+        City.city_name,
+        weather.source_id,
+        DataSource.source_name,
+        weather.timestamp,
+        *raw_metric_columns(weather),
+        weather.status
+    ).join(
+        City, weather.city_id == City.city_id
+    ).join(
+        DataSource, weather.source_id == DataSource.source_id
+    )
+    
+    if city_id is not None:
+        # 单个城市按索引顺序读取即为时间顺序（预警取最后一行作为最新数据）
+        query = query.where(weather.city_id == city_id).order_by(weather.timestamp)
+    
+    if start_date:
+        query = query.where(weather.timestamp >= start_date)
+    
+    if end_date:
+        query = query.where(weather.timestamp <= end_date)
+    
+    return query
+
+def evaluate_alerts(city_name, df, thresholds):
+    """按阈值检查最新一条数据，返回触发的预警列表（同步和异步数据访问共用）
+    
+    Args:
+        city_name: 城市名称
+        df: 按时间排序、以时间为索引的历史数据
+        thresholds: 预警阈值配置
+    """
+    alerts = []
+    for metric, rule in thresholds.items():
+        if metric in df.columns:
+            operator = rule['operator']
+            threshold = rule['threshold']
+            
+            # 检查最新数据
+            latest_value = float(df[metric].iloc[-1])
+            latest_time = df.index[-1]
+            
+            alert_triggered = False
+            if operator == '>' and latest_value > threshold:
+                alert_triggered = True
+            elif operator == '<' and latest_value < threshold:
+                alert_triggered = True
+            elif operator == '>=' and latest_value >= threshold:
+                alert_triggered = True
+            elif operator == '<=' and latest_value <= threshold:
+                alert_triggered = True
+            elif operator == '==' and latest_value == threshold:
+                alert_triggered = True
+            
+            if alert_triggered:
+                alerts.append({
+                    'city_name': city_name,
+                    'metric': metric,
+                    'value': latest_value,
+                    'threshold': threshold,
+                    'operator': operator,
+                    'time': latest_time,
+                    'alert_level': 'high' if abs(latest_value - threshold) > threshold * 0.1 else 'medium'
+                })
+    
+    return alerts
+
 class WeatherDataAnalyzer:
-    def __init__(self):
-        # 初始化数据库连接管理器
-        self.db_manager = DatabaseManager()
+    def __init__(self, db_manager=None):
+        # 初始化数据库连接管理器（为空时按环境配置连接）
+        self.db_manager = db_manager or DatabaseManager()
+        
+        # 开启后历史数据从Parquet数据湖读取，不再扫描业务库
+        self.parquet_lake = ParquetLake() if os.getenv('ANALYZER_USE_PARQUET_LAKE', '0') == '1' else None
+        
+        # 历史天气表按时间分区（HISTORICAL_PARTITIONING）时用于裁剪查询的分区
+        self.partitions = HistoricalPartitionManager(self.db_manager) if os.getenv('HISTORICAL_PARTITIONING') else None
         
-    def _get_session(self):
-        """获取数据库会话，确保每次都是新的会话"""
-        return self.db_manager.get_session()
+        # 按天/按月的分析优先读取汇总表，没有汇总数据时回退到原始数据
+        self.rollups = WeatherRollupManager(self.db_manager) if os.getenv('ANALYZER_USE_ROLLUPS', '1') == '1' else None
+        
+        # 城市名称到 city_id 的进程内映射，查询直接按 city_id 过滤
+        self.city_ids = city_id_map(self.db_manager.engine)
+        
+        # 天气预警允许的最大副本延迟（秒），副本延迟超过该值时预警读取主库
+        self.alert_max_lag = float(os.getenv('ALERT_MAX_REPLICA_LAG', 60))
+        
+        # 热数据窗口（HOT_WINDOW=1 时开启）：最新值和最近若干小时的数据优先从内存读取，未命中时查询数据库并预热
+        self.hot_window = hot_window(self.db_manager.engine) if HOT_WINDOW_ENABLED and HOT_WINDOW_HOURS > 0 else None
+    
+    def _session_scope(self, max_lag=None):
+        """只读查询的会话范围，每次调用使用独立的会话（配置了只读副本时读取副本）
+        
+        分析器不保存会话等可变状态，同一个实例可以被多个线程（如看板的并发回调）同时使用。
+        
+        Args:
+            max_lag: 允许的最大副本延迟（秒），为空时不检查延迟
+        """
+        return self.db_manager.session_scope(read_only=True, max_lag=max_lag)
     
     def close(self):
         """关闭数据库连接"""
         self.db_manager.close()
     
-    def get_historical_data(self, city_name=None, start_date=None, end_date=None):
-        """获取历史气象数据"""
-        session = None
+    def get_historical_data(self, city_name=None, start_date=None, end_date=None, max_lag=None):
+        """获取历史气象数据
+        
+        Args:
+            max_lag: 允许的最大副本延迟（秒），对数据新鲜度有要求的调用（如预警）指定
+        """
+        if self.parquet_lake is not None:
+            return self.get_historical_data_from_lake(city_name, start_date, end_date)
+        
         try:
-            session = self._get_session()
-            query = session.query(HistoricalWeather, City, DataSource).join(
-                City, HistoricalWeather.city_id == City.city_id
-            ).join(
-                DataSource, HistoricalWeather.source_id == DataSource.source_id
-            )
-            
+            city_id = None
             if city_name:
-                query = query.filter(City.city_name == city_name)
-            
-            if start_date:
-                query = query.filter(HistoricalWeather.timestamp >= start_date)
-            
-            if end_date:
-                query = query.filter(HistoricalWeather.timestamp <= end_date)
-            
-            results = query.all()
-            
-            # 转换为DataFrame
-            data = []
-            for weather, city, source in results:
-                data.append({
-                    'id': weather.id,
-                    'city_id': city.city_id,
-                    'city_name': city.city_name,
-                    'source_id': source.source_id,
-                    'source_name': source.source_name,
-                    'timestamp': weather.timestamp,
-                    'temperature': float(weather.temperature),
-                    'pressure': float(weather.pressure),
-                    'humidity': float(weather.humidity),
-                    'precipitation': float(weather.precipitation),
-                    'wind_speed': float(weather.wind_speed),
-                    'wind_direction': float(weather.wind_direction),
-                    'status': weather.status
-                })
-            
-            df = pd.DataFrame(data)
+                city_id = self.city_ids.lookup(city_name)
+                if city_id is None:
+                    logger.warning(f"城市 {city_name} 不在站点目录中")
+                    return pd.DataFrame()
+            
+            # 按时间分区时只读取与时间范围相交的分区
+            weather = self.partitions.source(start_date, end_date) if self.partitions is not None else HistoricalWeather
+            with self._session_scope(max_lag) as session:
+                result = session.execute(historical_data_query(weather, city_id, start_date, end_date))
+                
+                # 转换为DataFrame
+                df = decode_metric_frame(pd.DataFrame(result.all(), columns=list(result.keys())), HistoricalWeather)
             if not df.empty:
                 df.set_index('timestamp', inplace=True)
-            
-            session.commit()
             return df
         except Exception as e:
-            if session:
-                session.rollback()
             logger.error(f"获取历史数据失败: {e}")
             return pd.DataFrame()
-        finally:
-            if session:
-                session.close()
+    
+    def get_historical_data_from_lake(self, city_name=None, start_date=None, end_date=None):
+        """从Parquet数据湖获取历史气象数据（字段与 get_historical_data 一致，不含自增id）"""
+        try:
+            # 城市名称取自城市ID映射，数据源名称只需查询一张小表
+            names = self.city_ids.snapshot().names
+            cities = pd.DataFrame({'city_id': list(names.keys()), 'city_name': list(names.values())})
+            with self._session_scope() as session:
+                sources = pd.DataFrame(session.query(DataSource.source_id, DataSource.source_name).all(),
+                                       columns=['source_id', 'source_name'])
+            
+            city_ids = None
+            if city_name:
+                city_id = self.city_ids.lookup(city_name)
+                city_ids = [city_id] if city_id is not None else []
+            
+            df = self.parquet_lake.read('historical_weather', city_ids, start_date, end_date)
+            if df.empty:
+                return pd.DataFrame()
+            
+            df = df.merge(cities, on='city_id').merge(sources, on='source_id')
+            df = df[['city_id', 'city_name', 'source_id', 'source_name', 'timestamp', 'temperature', 'pressure',
+                     'humidity', 'precipitation', 'wind_speed', 'wind_direction', 'status']]
+            df.set_index('timestamp', inplace=True)
+            return df
+        except Exception as e:
+            logger.error(f"从数据湖获取历史数据失败: {e}")
+            return pd.DataFrame()
     
     # ------------------------------
     # 多维度数据分析功能
     # ------------------------------
     
+    def _read_rollups(self, metric, time_period, city_name=None):
+        """读取按天/按月汇总的统计值，时间段以 resample 的标签表示（天为当天，月为月末）
+        
+        Returns:
+            汇总DataFrame，没有可用的汇总数据时返回None
+        """
+        grains = {'daily': 'day', 'monthly': 'month'}
+        if self.rollups is None or time_period not in grains:
+            return None
+        try:
+            df = self.rollups.read(metric, grains[time_period], city_name)
+        except Exception as e:
+            logger.warning(f"读取汇总数据失败，改为读取原始数据: {e}")
+            return None
+        if df.empty:
+            return None
+        
+        if time_period == 'monthly':
+            df['bucket_start'] = df['bucket_start'] + pd.offsets.MonthEnd(0)
+        return df.rename(columns={'bucket_start': 'timestamp'})
+    
     def time_dimension_analysis(self, city_name, metric='temperature', time_period='daily'):
         """时间维度分析
         
@@ -98,6 +238,14 @@ class WeatherDataAnalyzer:
             分析结果DataFrame
         """
         try:
+            # 按天/按月优先使用汇总数据
+            rollups = self._read_rollups(metric, time_period, city_name)
+            if rollups is not None:
+                result = rollups.set_index('timestamp')[['mean', 'max', 'min', 'std']]
+                result = result.asfreq('D' if time_period == 'daily' else 'ME')
+                result.columns = ['平均值', '最大值', '最小值', '标准差']
+                return result
+            
             # 获取数据
             df = self.get_historical_data(city_name)
             if df.empty:
@@ -145,6 +293,11 @@ class WeatherDataAnalyzer:
             分析结果DataFrame
         """
         try:
+            # 按天/按月优先使用汇总数据
+            rollups = self._read_rollups(metric, time_period)
+            if rollups is not None:
+                return rollups.pivot(index='timestamp', columns='city_name', values='mean')
+            
             # 获取所有城市数据
             df = self.get_historical_data()
             if df.empty:
@@ -154,7 +307,7 @@ class WeatherDataAnalyzer:
             if time_period == 'daily':
                 result = df.groupby(['city_name', pd.Grouper(freq='D')])[metric].mean().unstack(0)
             elif time_period == 'monthly':
-                result = df.groupby(['city_name', pd.Grouper(freq='M')])[metric].mean().unstack(0)
+                result = df.groupby(['city_name', pd.Grouper(freq='ME')])[metric].mean().unstack(0)
             else:
                 return pd.DataFrame()
             
@@ -418,6 +571,72 @@ class WeatherDataAnalyzer:
             logger.error(f"导出分析结果失败: {e}")
             return False
     
+    # ------------------------------
+    # 最新观测
+    # ------------------------------
+    
+    def _hot_city_id(self, city_name):
+        """热数据窗口开启时返回城市ID，否则返回None"""
+        return self.city_ids.lookup(city_name) if self.hot_window is not None else None
+    
+    def _recent_data(self, city_name, start_date, end_date, city_id=None):
+        """从数据库读取时间范围内的观测（只保留 RECENT_COLUMNS 字段）
+        
+        Args:
+            city_id: 热数据窗口中的城市ID，不为空时用查询结果预热该城市的缓冲区（end_date 须为当前时间）
+        """
+        df = self.get_historical_data(city_name, start_date, end_date, max_lag=self.alert_max_lag)
+        df = df[RECENT_COLUMNS] if not df.empty else df
+        if city_id is not None:
+            self.hot_window.prime(city_id, df, start_date)
+        return df
+    
+    def _latest_frame(self, city_name, start_date, end_date):
+        """时间范围内最新一条观测的单行DataFrame，热数据窗口无法确定时查询数据库"""
+        city_id = self._hot_city_id(city_name)
+        if city_id is not None:
+            df = self.hot_window.latest(city_id, start_date, end_date)
+            if df is not None:
+                return df
+        return self._recent_data(city_name, start_date, end_date, city_id).tail(1)
+    
+    def get_recent_data(self, city_name, hours=24):
+        """获取最近若干小时的观测，热数据窗口未覆盖整个时间范围时查询数据库
+        
+        Returns:
+            以时间为索引的DataFrame，字段为 city_id、source_id 和各气象指标
+        """
+        end_date = datetime.now()
+        start_date = end_date - timedelta(hours=hours)
+        city_id = self._hot_city_id(city_name)
+        if city_id is not None:
+            df = self.hot_window.frame(city_id, start_date, end_date)
+            if df is not None:
+                return df
+        return self._recent_data(city_name, start_date, end_date, city_id)
+    
+    def get_latest_observation(self, city_name, hours=24):
+        """获取最近若干小时内最新的一条观测
+        
+        Returns:
+            以字段名为索引的Series（name为观测时间），没有观测时返回None
+        """
+        end_date = datetime.now()
+        df = self._latest_frame(city_name, end_date - timedelta(hours=hours), end_date)
+        return df.iloc[-1] if not df.empty else None
+    
+    def recent_statistics(self, city_name, hours=24):
+        """最近若干小时各指标的统计值（count/mean/min/max/std），热数据窗口未覆盖时查询数据库"""
+        end_date = datetime.now()
+        start_date = end_date - timedelta(hours=hours)
+        city_id = self._hot_city_id(city_name)
+        if city_id is not None:
+            result = self.hot_window.statistics(city_id, start_date, end_date)
+            if result is not None:
+                return result
+        df = self._recent_data(city_name, start_date, end_date, city_id)
+        return window_statistics(df[HOT_METRICS].to_numpy() if not df.empty else [])
+    
     # ------------------------------
     # 极端天气预警功能
     # ------------------------------
@@ -439,44 +658,12 @@ class WeatherDataAnalyzer:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=1)
             
-            df = self.get_historical_data(city_name, start_date, end_date)
+            # 预警只检查最新一条数据：优先从热数据窗口读取，无法确定时查询数据库（只读副本延迟过大时读取主库）
+            df = self._latest_frame(city_name, start_date, end_date)
             if df.empty:
                 return []
             
-            alerts = []
-            for metric, rule in thresholds.items():
-                if metric in df.columns:
-                    operator = rule['operator']
-                    threshold = rule['threshold']
-                    
-                    # 检查最新数据
-                    latest_value = float(df[metric].iloc[-1])
-                    latest_time = df.index[-1]
-                    
-                    alert_triggered = False
-                    if operator == '>' and latest_value > threshold:
-                        alert_triggered = True
-                    elif operator == '<' and latest_value < threshold:
-                        alert_triggered = True
-                    elif operator == '>=' and latest_value >= threshold:
-                        alert_triggered = True
-                    elif operator == '<=' and latest_value <= threshold:
-                        alert_triggered = True
-                    elif operator == '==' and latest_value == threshold:
-                        alert_triggered = True
-                    
-                    if alert_triggered:
-                        alerts.append({
-                            'city_name': city_name,
-                            'metric': metric,
-                            'value': latest_value,
-                            'threshold': threshold,
-                            'operator': operator,
-                            'time': latest_time,
-                            'alert_level': 'high' if abs(latest_value - threshold) > threshold * 0.1 else 'medium'
-                        })
-            
-            return alerts
+            return evaluate_alerts(city_name, df, thresholds)
         except Exception as e:
             logger.error(f"检查天气预警失败: {e}")
             return []
@@ -0,0 +1,312 @@
+import os
+import re
+import sys
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, text
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing.database_manager import (DatabaseManager, HistoricalWeather, ExtremeEvent, City, WEATHER_METRICS,
+                                         CLUSTERED_LAYOUT, COVERING_INDEXES)
+from processing.data_storage import existing_keys_query
+from processing.weather_rollups import WeatherRollupManager
+from processing.partition_manager import HistoricalPartitionManager
+from processing.city_catalog import city_id_map
+from analysis.data_analyzer import historical_data_query
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 种子数据的时间范围，避开真实数据所在的时间段
+SEED_START = datetime(1990, 1, 1)
+SEED_HOURS = 24 * 180
+
+# 行数很少的维表，按主键/唯一键关联时全表扫描也不算退化
+SMALL_TABLES = ('cities', 'data_sources')
+
+# 执行计划需要检查的表
+CHECKED_TABLES = ('historical_weather', 'weather_rollups', 'extreme_events')
+
+# 典型查询：
+# - name: 名称
+# - statement: 查询语句（与业务代码使用同一个构建函数）
+# - covering: 必须只读索引、不回表的表
+# - ordered_scan: 是否允许按索引顺序扫描（ORDER BY ... LIMIT 只读取索引开头的少量行）
+CanonicalQuery = namedtuple('CanonicalQuery', ['name', 'statement', 'covering', 'ordered_scan'])
+
+class QueryPlanChecker:
+    """对分析、看板和预警的典型查询执行 EXPLAIN，检查是否退化为全表扫描或额外排序
+    
+    - SQLite: EXPLAIN QUERY PLAN，检查表是否以 SCAN 方式读取、是否出现 USE TEMP B-TREE
+    - MySQL: EXPLAIN，检查 type 是否为 ALL/index、Extra 中是否有 Using filesort/Using temporary
+    
+    执行计划依赖表中数据的统计信息，检查前应在有代表性数据的库上执行 ANALYZE（seed 会写入数据并收集统计信息）。
+    """
+    
+    def __init__(self, db_manager=None):
+        self.db_manager = db_manager or DatabaseManager()
+        self.engine = self.db_manager.engine
+        self.dialect = self.engine.dialect.name
+        if self.dialect not in ('mysql', 'sqlite'):
+            raise ValueError(f"不支持的数据库方言: {self.dialect}")
+        
+        self.rollups = WeatherRollupManager(self.db_manager)
+        self.partitions = HistoricalPartitionManager(self.db_manager) if os.getenv('HISTORICAL_PARTITIONING') else None
+    
+    # ------------------------------
+    # 种子数据
+    # ------------------------------
+    
+    def seed(self, hours=SEED_HOURS, city_names=None):
+        """写入逐小时历史数据、汇总和极端事件，并收集统计信息
+        
+        用于空库或测试库；种子时间段内已有数据时只收集统计信息。
+        
+        Returns:
+            写入的历史数据行数
+        """
+        session = self.db_manager.get_session()
+        try:
+            cities = session.execute(select(City.city_id, City.city_name).order_by(City.city_id)).all()
+            if city_names:
+                cities = [city for city in cities if city.city_name in city_names]
+            city_ids = [city.city_id for city in cities]
+            
+            end = SEED_START + timedelta(hours=hours)
+            weather = self.partitions.source(SEED_START, end) if self.partitions is not None else HistoricalWeather
+            existing = session.execute(
+                select(func.count()).select_from(weather).where(weather.timestamp >= SEED_START, weather.timestamp < end)
+            ).scalar()
+            session.commit()
+            
+            written = 0
+            if not existing and city_ids:
+                frame = self._seed_frame(hours, city_ids)
+                if self.partitions is not None:
+                    self.partitions.ensure_partitions(frame['timestamp'])
+                    targets = self.partitions.split_by_partition(frame)
+                else:
+                    targets = [(HistoricalWeather.__table__, frame)]
+                
+                for table, part in targets:
+                    session.execute(table.insert(), self._records(part))
+                self.rollups.apply(session, frame)
+                session.execute(self.db_manager.insert_ignore_statement(ExtremeEvent), self._seed_events(hours, city_ids))
+                session.commit()
+                written = len(frame)
+                logger.info(f"写入种子数据 {written} 行（{len(city_ids)} 个城市 x {hours} 小时）")
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        
+        self.analyze()
+        return written
+    
+    def _seed_frame(self, hours, city_ids):
+        """生成各城市交替写入的逐小时观测"""
+        rng = np.random.default_rng(42)
+        timestamps = pd.date_range(SEED_START, periods=hours, freq='h')
+        row_count = hours * len(city_ids)
+        frame = pd.DataFrame({
+            'city_id': np.tile(city_ids, hours),
+            'source_id': 1,
+            'timestamp': np.repeat(timestamps, len(city_ids)),
+            'status': 1
+        })
+        for metric, (precision, scale, _) in WEATHER_METRICS.items():
+            frame[metric] = rng.uniform(0, 10 ** (precision - scale - 1), row_count).round(scale)
+        return frame
+    
+    def _records(self, frame):
+        """DataFrame转换为executemany参数列表（数值转为Python类型）"""
+        records = frame.astype(object).to_dict('records')
+        for record in records:
+            record['timestamp'] = record['timestamp'].to_pydatetime()
+        return records
+    
+    def _seed_events(self, hours, city_ids):
+        """每个城市每周一个高温事件"""
+        return [
+            {'city_id': city_id, 'source_id': 1, 'event_type': '高温', 'event_level': 1 + week % 5,
+             'start_time': SEED_START + timedelta(weeks=week), 'end_time': SEED_START + timedelta(weeks=week, hours=6),
+             'max_temperature': 38.0, 'status': 1}
+            for city_id in city_ids for week in range(hours // (24 * 7))
+        ]
+    
+    def analyze(self):
+        """收集表的统计信息，供优化器选择索引"""
+        with self.engine.begin() as conn:
+            if self.dialect == 'mysql':
+                conn.execute(text(f"ANALYZE TABLE {', '.join(CHECKED_TABLES + SMALL_TABLES)}"))
+            else:
+                conn.execute(text("ANALYZE"))
+    
+    # ------------------------------
+    # 典型查询与执行计划
+    # ------------------------------
+    
+    def canonical_queries(self, city_name='beijing', start=None, end=None):
+        """分析、看板和预警使用的典型查询
+        
+        Args:
+            city_name: 查询的城市
+            start, end: 看板查询的时间范围，默认为种子数据的第一个月
+        """
+        city_id = city_id_map(self.db_manager.engine).lookup(city_name)
+        if city_id is None:
+            raise ValueError(f"城市 {city_name} 不在站点目录中")
+        start = start or SEED_START
+        end = end or start + timedelta(days=30)
+        # 预警读取最近24小时
+        alert_end = SEED_START + timedelta(hours=SEED_HOURS)
+        alert_start = alert_end - timedelta(days=1)
+        
+        def weather(low, high):
+            return self.partitions.source(low, high) if self.partitions is not None else HistoricalWeather
+        
+        bounds = pd.DataFrame({'min': [pd.Timestamp(start)] * 2, 'max': [pd.Timestamp(end)] * 2}, index=[1, 2])
+        # 读取整行指标的查询只在聚簇主键布局或开启覆盖索引时要求不回表
+        row_covering = ('historical_weather',) if CLUSTERED_LAYOUT or COVERING_INDEXES else ()
+        return [
+            CanonicalQuery('dashboard_city_range', historical_data_query(weather(start, end), city_id, start, end),
+                           covering=row_covering, ordered_scan=False),
+            CanonicalQuery('analyzer_city_history', historical_data_query(weather(None, None), city_id),
+                           covering=row_covering, ordered_scan=False),
+            CanonicalQuery('weather_alerts_24h', historical_data_query(weather(alert_start, alert_end), city_id, alert_start, alert_end),
+                           covering=row_covering, ordered_scan=False),
+            CanonicalQuery('rollup_daily_city', self.rollups.read_query('temperature', 'day', city_id),
+                           covering=(), ordered_scan=False),
+            CanonicalQuery('rollup_monthly_regional', self.rollups.read_query('temperature', 'month'),
+                           covering=(), ordered_scan=False),
+            CanonicalQuery('ingest_existing_keys', existing_keys_query(HistoricalWeather, bounds),
+                           covering=('historical_weather',), ordered_scan=False),
+            CanonicalQuery('latest_city_history', select(HistoricalWeather).where(HistoricalWeather.city_id == 1)
+                           .order_by(HistoricalWeather.timestamp.desc()).limit(10),
+                           covering=(), ordered_scan=False),
+            CanonicalQuery('latest_history', select(HistoricalWeather).order_by(HistoricalWeather.timestamp.desc()).limit(10),
+                           covering=(), ordered_scan=True),
+            CanonicalQuery('latest_extreme_events', select(ExtremeEvent).order_by(ExtremeEvent.start_time.desc()).limit(10),
+                           covering=(), ordered_scan=True)
+        ]
+    
+    def explain(self, statement):
+        """返回查询的执行计划（每步一个字典）"""
+        sql = str(statement.compile(self.engine, compile_kwargs={'literal_binds': True}))
+        with self.engine.connect() as conn:
+            if self.dialect == 'sqlite':
+                # EXPLAIN 不检查表结构是否变化：先执行一次普通查询，使连接重新加载其他连接修改过的表结构；
+                # 驱动又按SQL文本缓存预编译语句，语句中带上结构版本号，建删索引后重新生成执行计划
+                conn.exec_driver_sql("SELECT COUNT(*) FROM sqlite_master").scalar()
+                version = conn.exec_driver_sql("PRAGMA schema_version").scalar()
+                result = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql} /* schema {version} */")
+            else:
+                result = conn.exec_driver_sql(f"EXPLAIN {sql}")
+            return [dict(row._mapping) for row in result]
+    
+    def _checked_table(self, name):
+        """执行计划中的表名对应的需检查的表（SQLite的时间段表按原表计），不需要检查时返回None"""
+        for table in CHECKED_TABLES:
+            if name == table or re.fullmatch(rf'{table}_p\d+', name or ''):
+                return table
+        return None
+    
+    def plan_problems(self, plan, query):
+        """检查执行计划，返回问题说明列表（为空表示通过）"""
+        if self.dialect == 'sqlite':
+            return self._sqlite_problems(plan, query)
+        return self._mysql_problems(plan, query)
+    
+    def _sqlite_problems(self, plan, query):
+        problems = []
+        # 子查询（如分区视图合并的时间段表）的中间结果以子查询名出现，不是对原表的扫描
+        subqueries = {match.group(1) for step in plan
+                      for match in [re.match(r'(?:CO-ROUTINE|MATERIALIZE) (\S+)', step['detail'])] if match}
+        for step in plan:
+            detail = step['detail']
+            if detail.startswith('USE TEMP B-TREE'):
+                problems.append(f"额外排序: {detail}")
+                continue
+            match = re.match(r'(SCAN|SEARCH) (\S+)', detail)
+            if not match or match.group(2) in subqueries:
+                continue
+            table = self._checked_table(match.group(2))
+            if table is None:
+                continue
+            if match.group(1) == 'SCAN' and not (query.ordered_scan and 'INDEX' in detail):
+                problems.append(f"全表扫描: {detail}")
+            elif table in query.covering and 'COVERING INDEX' not in detail and 'PRIMARY KEY' not in detail:
+                problems.append(f"未使用覆盖索引: {detail}")
+        return problems
+    
+    def _mysql_problems(self, plan, query):
+        problems = []
+        for step in plan:
+            extra = step.get('Extra') or ''
+            table = self._checked_table(step.get('table'))
+            description = f"{step.get('table')} type={step.get('type')} key={step.get('key')} {extra}".strip()
+            if 'Using filesort' in extra or 'Using temporary' in extra:
+                problems.append(f"额外排序: {description}")
+            if table is None:
+                continue
+            if step.get('type') == 'ALL' or (step.get('type') == 'index' and not query.ordered_scan):
+                problems.append(f"全表扫描: {description}")
+            elif table in query.covering and 'Using index' not in extra and step.get('key') != 'PRIMARY':
+                problems.append(f"未使用覆盖索引: {description}")
+        return problems
+    
+    def check(self, city_name='beijing', start=None, end=None):
+        """检查所有典型查询的执行计划
+        
+        Returns:
+            DataFrame（name、ok、problems、plan）
+        """
+        results = []
+        for query in self.canonical_queries(city_name, start, end):
+            plan = self.explain(query.statement)
+            problems = self.plan_problems(plan, query)
+            steps = [step['detail'] if self.dialect == 'sqlite'
+                     else f"{step.get('table')} type={step.get('type')} key={step.get('key')} {step.get('Extra') or ''}".strip()
+                     for step in plan]
+            results.append({'name': query.name, 'ok': not problems, 'problems': problems, 'plan': steps})
+            if problems:
+                logger.warning(f"查询 {query.name} 执行计划退化: {'; '.join(problems)}")
+        return pd.DataFrame(results)
+    
+    def close(self):
+        """关闭数据库连接"""
+        self.db_manager.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='检查分析、看板和预警典型查询的执行计划，出现全表扫描或额外排序时返回非0')
+    parser.add_argument('--seed', action='store_true', help='先写入种子数据并收集统计信息（只在空库或测试库上使用）')
+    parser.add_argument('--city', default='beijing', help='查询的城市')
+    args = parser.parse_args()
+    
+    checker = QueryPlanChecker()
+    try:
+        if args.seed:
+            checker.db_manager.init_database()
+            checker.seed()
+        report = checker.check(args.city)
+    finally:
+        checker.close()
+    
+    for _, row in report.iterrows():
+        print(f"[{'OK' if row['ok'] else 'FAIL'}] {row['name']}")
+        for step in row['plan']:
+            print(f"    {step}")
+        for problem in row['problems']:
+            print(f"    !! {problem}")
+    return 0 if report['ok'].all() else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event
+
+# 配置日志
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from processing.data_storage import WeatherDataStorage
+from analysis.data_analyzer import WeatherDataAnalyzer
+from benchmark_layout import BENCHMARK_START, make_frame, cleanup
+
+# 模拟看板回调的告警阈值
+ALERT_THRESHOLDS = {'temperature': {'operator': '>', 'threshold': 35}, 'wind_speed': {'operator': '>', 'threshold': 20}}
+
+def make_requests(city_names, hours, window_days, count):
+    """随机生成看板回调请求：城市时间范围查询为主，夹杂天气预警检查"""
+    rng = np.random.default_rng(11)
+    window = pd.Timedelta(days=window_days)
+    max_offset = max(hours - window_days * 24, 1)
+    requests = []
+    for _ in range(count):
+        city_name = str(rng.choice(city_names))
+        if rng.random() < 0.2:
+            requests.append(('alerts', city_name, None, None))
+        else:
+            start = pd.Timestamp(BENCHMARK_START) + pd.Timedelta(hours=int(rng.integers(0, max_offset)))
+            requests.append(('history', city_name, start.to_pydatetime(), (start + window).to_pydatetime()))
+    return requests
+
+def handle(analyzer, request):
+    """执行一个回调请求，返回结果行数"""
+    kind, city_name, start, end = request
+    if kind == 'alerts':
+        return len(analyzer.check_weather_alerts(city_name, ALERT_THRESHOLDS))
+    return len(analyzer.get_historical_data(city_name, start, end))
+
+def run_threads(analyzer, requests, threads):
+    """所有请求同时到达，由指定数量的线程共用一个分析器处理
+    
+    请求延迟从到达（开始提交）算起到处理完成，包含排队等待的时间，与看板单线程时回调排队的情况一致。
+    """
+    def timed(request):
+        rows = handle(analyzer, request)
+        return time.perf_counter() - arrived, rows
+    
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        arrived = time.perf_counter()
+        results = list(executor.map(timed, requests))
+        elapsed = time.perf_counter() - arrived
+    
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    return {
+        'threads': threads,
+        'requests': len(requests),
+        'rows': sum(rows for _, rows in results),
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_sec': round(len(requests) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 1),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 1)
+    }
+
+def add_db_latency(engine, latency_ms):
+    """每条语句执行前等待指定时间，模拟远程数据库（如MySQL）的网络往返和服务端执行时间
+    
+    本地SQLite的查询几乎全部消耗本进程的CPU；远程数据库的查询时间主要是等待，等待期间线程释放GIL，
+    其他线程可以继续处理请求。
+    """
+    def wait(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(latency_ms / 1000)
+    
+    event.listen(engine, 'before_cursor_execute', wait)
+    return wait
+
+def run_benchmark(hours, city_ids, window_days, request_count, thread_counts, db_latency_ms=0):
+    """写入基准数据，按不同线程数处理同一批请求"""
+    storage = WeatherDataStorage()
+    storage.db_manager.init_database()
+    analyzer = WeatherDataAnalyzer()
+    results = []
+    
+    try:
+        cleanup(storage)
+        success, stored = storage.store_historical_weather(make_frame(hours, city_ids))
+        print(f"写入基准数据 {stored} 行（{len(city_ids)} 个城市 x {hours} 小时），成功: {success}")
+        
+        names = analyzer.city_ids.snapshot().names
+        requests = make_requests([names[city_id] for city_id in city_ids], hours, window_days, request_count)
+        # 预热：加载城市映射、建立连接
+        handle(analyzer, requests[0])
+        wait = add_db_latency(analyzer.db_manager.engine, db_latency_ms) if db_latency_ms else None
+        try:
+            for threads in thread_counts:
+                results.append(run_threads(analyzer, requests, threads))
+        finally:
+            if wait is not None:
+                event.remove(analyzer.db_manager.engine, 'before_cursor_execute', wait)
+    finally:
+        cleanup(storage)
+        analyzer.close()
+        storage.close()
+    
+    return pd.DataFrame(results)
+
+def main():
+    parser = argparse.ArgumentParser(description='看板回调并发处理的性能基准（共用一个分析器，线程数递增）')
+    parser.add_argument('--hours', type=int, default=24 * 365, help='每个城市写入的小时数')
+    parser.add_argument('--cities', default='1,2,3,4,5', help='写入的城市ID，逗号分隔')
+    parser.add_argument('--window-days', type=int, default=30, help='历史数据查询的时间窗口（天）')
+    parser.add_argument('--requests', type=int, default=200, help='请求数')
+    parser.add_argument('--threads', default='1,2,4,8', help='依次测试的线程数，逗号分隔')
+    parser.add_argument('--db-latency-ms', type=float, default=0, help='每条语句额外等待的时间（毫秒），模拟远程数据库')
+    args = parser.parse_args()
+    
+    city_ids = [int(city_id) for city_id in args.cities.split(',')]
+    thread_counts = [int(threads) for threads in args.threads.split(',')]
+    # 连接池需要容纳所有线程同时借出的连接
+    os.environ.setdefault('DB_POOL_SIZE', str(max(thread_counts)))
+    result = run_benchmark(args.hours, city_ids, args.window_days, args.requests, thread_counts, args.db_latency_ms)
+    print(result.to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
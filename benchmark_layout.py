@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+# 配置日志
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from processing.data_storage import WeatherDataStorage
+from processing.database_manager import HistoricalWeather, WEATHER_LAYOUT
+from processing.schema_migration import SchemaMigrator
+
+# 基准数据使用的时间起点，避开真实数据所在的时间范围
+BENCHMARK_START = datetime(1990, 1, 1)
+BENCHMARK_END = datetime(2000, 1, 1)
+
+# 单城市时间范围扫描（与 get_historical_data 按城市和时间过滤的访问方式一致）
+SCAN_SQL = text(
+    "SELECT timestamp, temperature, pressure, humidity, precipitation, wind_speed, wind_direction "
+    "FROM historical_weather WHERE city_id = :city_id AND timestamp >= :start AND timestamp < :end"
+)
+
+def make_frame(hours, city_ids):
+    """生成逐小时的历史数据（已完成编码，可直接入库）
+    
+    各城市的数据交替写入，模拟多城市同时采集时的写入顺序，
+    自增主键布局下同一城市的相邻观测分散在不同的数据页中。
+    """
+    rng = np.random.default_rng(42)
+    timestamps = pd.date_range(BENCHMARK_START, periods=hours, freq='h')
+    row_count = hours * len(city_ids)
+    
+    return pd.DataFrame({
+        'city_id': np.tile(city_ids, hours),
+        'source_id': 1,
+        'timestamp': np.repeat(timestamps, len(city_ids)),
+        'temperature': rng.normal(20, 5, row_count).round(2),
+        'pressure': rng.normal(1013, 5, row_count).round(2),
+        'humidity': rng.uniform(20, 100, row_count).round(2),
+        'precipitation': rng.exponential(1, row_count).round(2),
+        'wind_speed': rng.uniform(0, 20, row_count).round(2),
+        'wind_direction': rng.uniform(0, 360, row_count).round(2)
+    })
+
+def cleanup(storage):
+    """删除基准测试写入的数据"""
+    with storage.db_manager.engine.begin() as conn:
+        conn.execute(text("DELETE FROM historical_weather WHERE timestamp < :end"), {'end': BENCHMARK_END})
+
+def describe_layout(engine):
+    """数据库中 historical_weather 表当前的主键"""
+    primary_key = inspect(engine).get_pk_constraint('historical_weather').get('constrained_columns', [])
+    return 'clustered' if primary_key == ['city_id', 'timestamp'] else 'surrogate'
+
+def run_scans(engine, city_ids, hours, window_days, queries):
+    """随机选择城市和时间窗口执行范围扫描并计时"""
+    rng = np.random.default_rng(7)
+    window = pd.Timedelta(days=window_days)
+    max_offset = max(hours - window_days * 24, 1)
+    timings = []
+    rows = 0
+    
+    with engine.connect() as conn:
+        for _ in range(queries):
+            start = pd.Timestamp(BENCHMARK_START) + pd.Timedelta(hours=int(rng.integers(0, max_offset)))
+            params = {'city_id': int(rng.choice(city_ids)), 'start': start.to_pydatetime(), 'end': (start + window).to_pydatetime()}
+            begin = time.perf_counter()
+            rows += len(conn.execute(SCAN_SQL, params).fetchall())
+            timings.append(time.perf_counter() - begin)
+    
+    timings = np.array(timings) * 1000
+    return {
+        'layout': describe_layout(engine),
+        'queries': queries,
+        'rows': rows,
+        'mean_ms': round(float(timings.mean()), 3),
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'rows_per_sec': int(rows / (timings.sum() / 1000)) if timings.sum() > 0 else None
+    }
+
+def run_benchmark(hours, city_ids, window_days, queries, migrate):
+    """写入基准数据，扫描计时；指定迁移时按当前布局配置重建表后再次扫描"""
+    storage = WeatherDataStorage()
+    storage.db_manager.init_database()
+    engine = storage.db_manager.engine
+    results = []
+    
+    try:
+        cleanup(storage)
+        df = make_frame(hours, city_ids)
+        success, stored = storage.store_historical_weather(df)
+        print(f"写入基准数据 {stored} 行（{len(city_ids)} 个城市 x {hours} 小时），成功: {success}")
+        
+        result = run_scans(engine, city_ids, hours, window_days, queries)
+        results.append(dict(result, phase='before'))
+        
+        if migrate:
+            migrator = SchemaMigrator(storage.db_manager)
+            start = time.perf_counter()
+            plan = migrator.migrate(models=(HistoricalWeather,))
+            print(f"迁移到 {WEATHER_LAYOUT} 布局耗时 {time.perf_counter() - start:.2f}s，变更: {plan.get('historical_weather', [])}")
+            
+            result = run_scans(engine, city_ids, hours, window_days, queries)
+            results.append(dict(result, phase='after'))
+    finally:
+        cleanup(storage)
+        storage.close()
+    
+    return pd.DataFrame(results)
+
+def main():
+    parser = argparse.ArgumentParser(description='历史数据按城市时间范围扫描的性能基准（自增主键 vs 聚簇主键）')
+    parser.add_argument('--hours', type=int, default=24 * 365 * 2, help='每个城市写入的小时数')
+    parser.add_argument('--cities', default='1,2,3,4,5', help='写入的城市ID，逗号分隔')
+    parser.add_argument('--window-days', type=int, default=30, help='每次扫描的时间窗口（天）')
+    parser.add_argument('--queries', type=int, default=200, help='扫描次数')
+    parser.add_argument('--migrate', action='store_true', help='扫描后按 DB_WEATHER_LAYOUT 迁移表结构并再次扫描')
+    args = parser.parse_args()
+    
+    city_ids = [int(city_id) for city_id in args.cities.split(',')]
+    result = run_benchmark(args.hours, city_ids, args.window_days, args.queries, args.migrate)
+    print(result.to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# 配置日志
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from processing.data_storage import WeatherDataStorage
+from processing.database_manager import RealTimeWeather
+
+# 基准数据使用的时间起点，避开真实数据所在的时间范围
+BENCHMARK_START = datetime(1990, 1, 1)
+
+def make_frame(row_count, city_ids=(1, 2, 3, 4, 5)):
+    """生成用于基准测试的实时数据（已完成编码，可直接入库）"""
+    rng = np.random.default_rng(42)
+    per_city = -(-row_count // len(city_ids))
+    timestamps = pd.date_range(BENCHMARK_START, periods=per_city, freq='min')
+    
+    df = pd.DataFrame({
+        'city_id': np.repeat(city_ids, per_city)[:row_count],
+        'source_id': 1,
+        'timestamp': np.tile(timestamps, len(city_ids))[:row_count],
+        'temperature': rng.normal(20, 5, row_count).round(2),
+        'pressure': rng.normal(1013, 5, row_count).round(2),
+        'humidity': rng.uniform(20, 100, row_count).round(2),
+        'precipitation': rng.exponential(1, row_count).round(2),
+        'wind_speed': rng.uniform(0, 20, row_count).round(2),
+        'wind_direction': rng.uniform(0, 360, row_count).round(2)
+    })
+    return df
+
+def cleanup(storage):
+    """删除基准测试写入的数据"""
+    session = storage.db_manager.get_session()
+    try:
+        session.query(RealTimeWeather).filter(RealTimeWeather.timestamp < datetime(2000, 1, 1)).delete(synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+def timed_store(storage, df, bulk):
+    """执行一次写入并计时"""
+    start = time.perf_counter()
+    success, stored, updated = storage.store_realtime_weather(df, bulk=bulk)
+    elapsed = time.perf_counter() - start
+    return success, stored, updated, elapsed
+
+def run_benchmark(sizes, rowwise_limit):
+    """对比逐行写入与批量upsert（首次写入为插入，第二次写入为更新）"""
+    storage = WeatherDataStorage()
+    # 确保表结构和基础数据存在（SQLite后端可直接在空文件上运行）
+    storage.db_manager.init_database()
+    results = []
+    
+    try:
+        for size in sizes:
+            df = make_frame(size)
+            modes = [('bulk', True)]
+            if size <= rowwise_limit:
+                modes.append(('rowwise', False))
+            
+            for mode_name, bulk in modes:
+                cleanup(storage)
+                for phase in ('insert', 'update'):
+                    success, stored, updated, elapsed = timed_store(storage, df, bulk)
+                    results.append({
+                        'rows': size,
+                        'mode': mode_name,
+                        'phase': phase,
+                        'success': success,
+                        'stored': stored,
+                        'updated': updated,
+                        'seconds': round(elapsed, 3),
+                        'rows_per_sec': int(size / elapsed) if elapsed > 0 else None
+                    })
+                    print(f"{size:>8} 行 {mode_name:<8} {phase:<6} 耗时 {elapsed:8.3f}s 新增 {stored} 更新 {updated}")
+    finally:
+        cleanup(storage)
+        storage.close()
+    
+    return pd.DataFrame(results)
+
+def main():
+    parser = argparse.ArgumentParser(description='实时数据入库性能基准（逐行写入 vs 批量upsert）')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='测试的数据行数，逗号分隔')
+    parser.add_argument('--rowwise-limit', type=int, default=100000, help='超过该行数时跳过逐行写入模式')
+    args = parser.parse_args()
+    
+    sizes = [int(size) for size in args.sizes.split(',')]
+    result = run_benchmark(sizes, args.rowwise_limit)
+    print(result.to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
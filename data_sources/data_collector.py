@@ -7,6 +7,9 @@ from meteostat import Point, Daily, Hourly
 import pyowm
 from dotenv import load_dotenv
 
+# 作为包导入，项目路径由入口脚本设置（单独运行时在项目根目录执行 python -m data_sources.data_collector）
+from processing.city_catalog import city_id_map
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -26,14 +29,13 @@ class WeatherDataCollector:
             self.owm = pyowm.OWM(self.api_keys['owm'])
             self.mgr = self.owm.weather_manager()
         
-        # 城市坐标映射
-        self.city_coords = {
-            'beijing': (39.9042, 116.4074),
-            'shanghai': (31.2304, 121.4737),
-            'guangzhou': (23.1291, 113.2644),
-            'shenzhen': (22.5431, 114.0579),
-            'chengdu': (30.5728, 104.0668)
-        }
+        # 城市坐标从站点目录读取（目录文件更新后自动重新加载）
+        self.city_ids = city_id_map()
+    
+    @property
+    def city_coords(self):
+        """城市名称到 (纬度, 经度) 的映射"""
+        return self.city_ids.coordinates()
     
     def get_realtime_weather(self, city='beijing'):
         """获取实时气象数据"""
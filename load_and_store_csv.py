@@ -10,6 +10,16 @@ logger = logging.getLogger(__name__)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from processing.data_storage import WeatherDataStorage
+from processing.parallel_loader import ParallelCSVLoader
+
+def detect_data_type(csv_file):
+    """根据文件名判断数据类型"""
+    data_type = 'historical'  # 默认是历史数据
+    if 'realtime' in csv_file.lower():
+        data_type = 'realtime'
+    elif 'extreme' in csv_file.lower():
+        data_type = 'extreme'
+    return data_type
 
 def main():
     """加载、清洗并存储CSV数据到数据库"""
@@ -36,23 +46,29 @@ def main():
     
     logger.info(f"找到 {len(csv_files)} 个CSV文件")
     
+    # 并行预处理进程数（LOADER_WORKERS 大于1时启用并行加载）
+    workers = int(os.getenv('LOADER_WORKERS', 1))
+    if workers > 1:
+        loader = ParallelCSVLoader(storage, workers=workers)
+        loader.load_files([(os.path.join(data_dir, csv_file), detect_data_type(csv_file)) for csv_file in csv_files])
+        storage.close()
+        logger.info("=== 所有CSV数据处理完成 ===")
+        return 0
+    
     # 处理每个CSV文件
     for csv_file in csv_files:
         file_path = os.path.join(data_dir, csv_file)
         logger.info(f"开始处理文件: {csv_file}")
         
         # 判断数据类型
-        data_type = 'historical'  # 默认是历史数据
-        if 'realtime' in csv_file.lower():
-            data_type = 'realtime'
-        elif 'extreme' in csv_file.lower():
-            data_type = 'extreme'
+        data_type = detect_data_type(csv_file)
         
-        # 加载并存储数据
-        success, stored, updated = storage.load_historical_data_from_csv(file_path, data_type)
+        # 加载并存储数据（按入库清单跳过未变化的文件）
+        success, stored, updated = storage.ingest_csv_file(file_path, data_type)
         
         if success:
-            logger.info(f"文件 {csv_file} 处理成功，新增: {stored}条，更新: {updated}条")
+            logger.info(f"文件 {csv_file} 处理成功，新增: {stored}条，更新: {updated}条，"
+                        f"隔离: {storage.last_quarantined_count}条")
         else:
             logger.error(f"文件 {csv_file} 处理失败")
     
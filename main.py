@@ -12,6 +12,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from data_sources.data_collector import WeatherDataCollector
 from processing.data_validator import WeatherDataValidator
+from processing.ingest_pipeline import WeatherIngestPipeline
+from processing.extreme_event_loader import ExtremeEventLoader
 
 def main():
     """主函数，整合数据采集、处理和API启动"""
@@ -29,24 +31,33 @@ def main():
         # 3. 数据采集
         cities = ['beijing', 'shanghai', 'guangzhou', 'shenzhen', 'chengdu']
         
-        for city in cities:
-            # 获取实时数据
-            logger.info(f"获取{city}实时气象数据...")
-            realtime_data = collector.get_realtime_weather(city)
-            if realtime_data:
-                # 验证和标准化
-                standardized_data, msg = validator.validate_and_standardize(realtime_data)
-                if standardized_data is not None:
-                    collector.save_data(realtime_data, f'realtime_weather_{city}_{datetime.now().strftime("%Y%m%d_%H%M%S")}', 'realtime')
-            
-            # 获取历史数据
-            logger.info(f"获取{city}历史气象数据...")
-            historical_data = collector.get_historical_weather(city)
-            if historical_data is not None:
-                # 验证和标准化
-                standardized_data, msg = validator.validate_and_standardize(historical_data)
-                if standardized_data is not None:
-                    collector.save_data(standardized_data, f'historical_weather_{city}_{datetime.now().strftime("%Y%m%d")}', 'historical')
+        if os.getenv('PIPELINE_MODE', 'files') == 'direct':
+            # 采集数据在内存中验证、预处理后直接入库（需显式开启），文件归档可选
+            pipeline = WeatherIngestPipeline(collector, validator)
+            try:
+                pipeline.collect_and_ingest(cities)
+            finally:
+                pipeline.close()
+        else:
+            # 采集数据保存为文件，由 load_and_store_csv.py 入库
+            for city in cities:
+                # 获取实时数据
+                logger.info(f"获取{city}实时气象数据...")
+                realtime_data = collector.get_realtime_weather(city)
+                if realtime_data:
+                    # 验证和标准化
+                    standardized_data, msg = validator.validate_and_standardize(realtime_data)
+                    if standardized_data is not None:
+                        collector.save_data(realtime_data, f'realtime_weather_{city}_{datetime.now().strftime("%Y%m%d_%H%M%S")}', 'realtime')
+                
+                # 获取历史数据
+                logger.info(f"获取{city}历史气象数据...")
+                historical_data = collector.get_historical_weather(city)
+                if historical_data is not None:
+                    # 验证和标准化
+                    standardized_data, msg = validator.validate_and_standardize(historical_data)
+                    if standardized_data is not None:
+                        collector.save_data(standardized_data, f'historical_weather_{city}_{datetime.now().strftime("%Y%m%d")}', 'historical')
         
         # 4. 下载Kaggle数据集
         logger.info("下载Kaggle极端天气数据集...")
@@ -56,6 +67,14 @@ def main():
         logger.info("处理Kaggle极端天气数据集...")
         validator.process_kaggle_dataset()
         
+        # 6. 构建极端天气事件并入库
+        logger.info("从Kaggle数据集构建极端天气事件...")
+        event_loader = ExtremeEventLoader()
+        try:
+            event_loader.load_directory()
+        finally:
+            event_loader.close()
+        
         logger.info("=== 气象数据处理系统执行完成 ===")
         logger.info("请运行 'python api/app.py' 启动数据查询API")
         
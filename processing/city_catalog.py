@@ -0,0 +1,243 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from collections import namedtuple
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import select, insert, update, bindparam, func
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing.database_manager import DatabaseManager, City
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 站点目录文件（STATION_CATALOG_PATH），每行一个站点：city_id（可选）、city_name、city_code、latitude、longitude
+CATALOG_PATH = os.getenv(
+    'STATION_CATALOG_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'station_catalog.csv')
+)
+
+# 站点目录的必填字段
+CATALOG_COLUMNS = ['city_name', 'city_code', 'latitude', 'longitude']
+
+# 映射快照：ids 为名称和编码到 city_id 的字典，names 为 city_id 到名称的字典，
+# coords 为名称到 (纬度, 经度) 的字典，version 为加载时的目录版本
+CitySnapshot = namedtuple('CitySnapshot', ['ids', 'names', 'coords', 'version'])
+
+def read_catalog(path=None):
+    """读取并校验站点目录文件
+    
+    Args:
+        path: 目录文件路径，默认为 STATION_CATALOG_PATH
+    
+    Returns:
+        DataFrame（city_id 列仅在目录文件提供时存在）
+    
+    Raises:
+        ValueError: 缺少字段、名称/编码/ID重复或坐标超出范围
+    """
+    path = path or CATALOG_PATH
+    catalog = pd.read_csv(path, dtype={'city_name': str, 'city_code': str})
+    missing = [column for column in CATALOG_COLUMNS if column not in catalog.columns]
+    if missing:
+        raise ValueError(f"站点目录 {path} 缺少字段: {missing}")
+    
+    catalog['city_name'] = catalog['city_name'].str.strip()
+    catalog['city_code'] = catalog['city_code'].str.strip()
+    id_columns = ['city_id'] if 'city_id' in catalog.columns else []
+    for column in id_columns + ['city_name', 'city_code']:
+        if catalog[column].isna().any() or catalog[column].duplicated().any():
+            raise ValueError(f"站点目录 {path} 的 {column} 存在空值或重复值")
+    invalid = ~catalog['latitude'].between(-90, 90) | ~catalog['longitude'].between(-180, 180)
+    if invalid.any():
+        raise ValueError(f"站点目录 {path} 有 {int(invalid.sum())} 个站点坐标超出范围: {catalog.loc[invalid, 'city_name'].tolist()[:10]}")
+    
+    return catalog[id_columns + CATALOG_COLUMNS].reset_index(drop=True)
+
+def load_catalog(db_manager, catalog=None):
+    """把站点目录批量写入 cities 表
+    
+    已有城市一次查询读出后与目录比较：新站点批量插入，编码或坐标有变化的站点批量更新，其余不写入。
+    已有城市的 city_id 不会改变（气象数据通过它关联城市）。
+    
+    Args:
+        db_manager: 数据库管理器
+        catalog: 站点目录（read_catalog 的结果），为空时读取默认目录文件
+    
+    Returns:
+        (新增的站点数, 更新的站点数)
+    """
+    catalog = read_catalog() if catalog is None else catalog
+    now = datetime.now()
+    with db_manager.engine.begin() as conn:
+        result = conn.execute(select(City.city_id, City.city_name, City.city_code, City.latitude, City.longitude))
+        existing = pd.DataFrame(result.all(), columns=list(result.keys()))
+        merged = catalog.merge(existing, on='city_name', how='left', suffixes=('', '_db'), indicator=True)
+        
+        new = (merged['_merge'] == 'left_only').to_numpy()
+        changed = ~new & (
+            (merged['city_code'] != merged['city_code_db'])
+            | ((merged['latitude'] - merged['latitude_db'].astype('float64')).abs() > 1e-6)
+            | ((merged['longitude'] - merged['longitude_db'].astype('float64')).abs() > 1e-6)
+        ).to_numpy()
+        if 'city_id' in catalog.columns:
+            moved = ~new & (merged['city_id'] != merged['city_id_db']).to_numpy()
+            if moved.any():
+                logger.warning(f"{int(moved.sum())} 个站点的 city_id 与数据库不一致，保留数据库中的ID: "
+                               f"{merged.loc[moved, 'city_name'].tolist()[:10]}")
+        
+        if new.any():
+            rows = catalog[new].assign(created_at=now, updated_at=now).to_dict('records')
+            conn.execute(insert(City), rows)
+        if changed.any():
+            rows = catalog.loc[changed, CATALOG_COLUMNS].rename(columns={'city_name': 'name'}).assign(updated_at=now)
+            conn.execute(
+                update(City).where(City.city_name == bindparam('name')).values(
+                    city_code=bindparam('city_code'), latitude=bindparam('latitude'),
+                    longitude=bindparam('longitude'), updated_at=bindparam('updated_at')
+                ).execution_options(synchronize_session=False),
+                rows.to_dict('records')
+            )
+    
+    inserted, updated = int(new.sum()), int(changed.sum())
+    if inserted or updated:
+        city_id_map(db_manager.engine).invalidate()
+        logger.info(f"站点目录写入完成: 新增 {inserted} 个站点，更新 {updated} 个站点")
+    return inserted, updated
+
+class CityIdMap:
+    """城市名称/编码到 city_id 的进程内映射（读多写少）
+    
+    映射整体保存在一个不可变的快照中，读取时不加锁。距上次检查超过 CITY_MAP_CHECK_SECONDS 秒（默认30）时
+    先查询目录版本（数据库为城市数和最近更新时间，目录文件为修改时间），版本变化时才重新加载整个映射。
+    本进程写入站点目录后会立即失效快照，下次读取时重新加载。
+    """
+    
+    def __init__(self, engine=None, path=None, check_seconds=None):
+        """
+        Args:
+            engine: 数据库引擎，为空时从站点目录文件加载（目录没有 city_id 列时只提供坐标）
+            path: 站点目录文件路径
+            check_seconds: 检查目录版本的最短间隔（秒）
+        """
+        self.engine = engine
+        self.path = path or CATALOG_PATH
+        self.check_seconds = check_seconds if check_seconds is not None else float(os.getenv('CITY_MAP_CHECK_SECONDS', 30))
+        self.lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+    
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """由已加载的快照构建固定的映射（如传给预处理子进程），不再检查目录版本"""
+        city_map = cls(check_seconds=float('inf'))
+        city_map._snapshot = snapshot
+        return city_map
+    
+    def _version(self):
+        if self.engine is None:
+            return os.stat(self.path).st_mtime_ns
+        with self.engine.connect() as conn:
+            return tuple(conn.execute(select(func.count(), func.max(City.updated_at)).select_from(City)).one())
+    
+    def _load(self, version):
+        if self.engine is None:
+            cities = read_catalog(self.path)
+        else:
+            with self.engine.connect() as conn:
+                result = conn.execute(select(City.city_id, City.city_name, City.city_code, City.latitude, City.longitude))
+                cities = pd.DataFrame(result.all(), columns=list(result.keys()))
+        
+        ids, names = {}, {}
+        if 'city_id' in cities.columns:
+            city_ids = cities['city_id'].astype(int).tolist()
+            ids.update(zip(cities['city_code'], city_ids))
+            # 名称与其他站点的编码相同时以名称为准
+            ids.update(zip(cities['city_name'], city_ids))
+            names.update(zip(city_ids, cities['city_name']))
+        coords = dict(zip(cities['city_name'], zip(cities['latitude'].astype(float).tolist(), cities['longitude'].astype(float).tolist())))
+        return CitySnapshot(ids, names, coords, version)
+    
+    def stale(self):
+        """下次读取是否需要检查目录版本（可能查询数据库）"""
+        return self._snapshot is None or time.monotonic() - self._checked_at >= self.check_seconds
+    
+    def snapshot(self):
+        """当前映射快照（按检查间隔确认目录版本，必要时重新加载）"""
+        snapshot = self._snapshot
+        if not self.stale():
+            return snapshot
+        
+        with self.lock:
+            # 等待锁期间其他线程可能已经完成检查
+            if not self.stale():
+                return self._snapshot
+            version = self._version()
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._load(version)
+                logger.info(f"城市ID映射已加载，共 {len(self._snapshot.coords)} 个站点")
+            self._checked_at = time.monotonic()
+            return self._snapshot
+    
+    def invalidate(self):
+        """使当前快照失效，下次读取时重新加载"""
+        with self.lock:
+            self._snapshot = None
+    
+    def lookup(self, key):
+        """按城市名称或编码查找 city_id，未知的城市返回None"""
+        return self.snapshot().ids.get(key)
+    
+    def encode(self, values):
+        """把一列城市名称或编码转换为 city_id（未知的城市为NaN）"""
+        return pd.Series(values).map(self.snapshot().ids)
+    
+    def coordinates(self):
+        """城市名称到 (纬度, 经度) 的字典"""
+        return self.snapshot().coords
+
+# 进程内共享的映射，按数据库（或站点目录文件）区分
+_maps = {}
+_maps_lock = threading.Lock()
+
+def city_id_map(engine=None):
+    """获取进程内共享的城市ID映射
+    
+    Args:
+        engine: 数据库引擎，映射从该数据库的 cities 表加载；为空时从站点目录文件加载
+    """
+    key = engine.url.render_as_string(hide_password=False) if engine is not None else CATALOG_PATH
+    with _maps_lock:
+        city_map = _maps.get(key)
+        if city_map is None:
+            city_map = _maps[key] = CityIdMap(engine)
+        elif engine is not None:
+            # 引擎在所有使用者关闭后会被释放，使用最新获取的引擎
+            city_map.engine = engine
+        return city_map
+
+def main():
+    parser = argparse.ArgumentParser(description='把站点目录批量写入 cities 表')
+    parser.add_argument('path', nargs='?', default=CATALOG_PATH, help='站点目录CSV文件（默认 STATION_CATALOG_PATH）')
+    args = parser.parse_args()
+    
+    db_manager = DatabaseManager()
+    try:
+        inserted, updated = load_catalog(db_manager, read_catalog(args.path))
+        logger.info(f"站点目录 {args.path}: 新增 {inserted} 个站点，更新 {updated} 个站点")
+        return 0
+    except Exception as e:
+        logger.error(f"写入站点目录失败: {e}")
+        return 1
+    finally:
+        db_manager.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
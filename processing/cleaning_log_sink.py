@@ -0,0 +1,121 @@
+import os
+import logging
+import threading
+from collections import deque
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class CleaningLogSink:
+    """数据清洗日志的异步写入缓冲
+    
+    入库流程只把清洗日志放入内存缓冲区即返回，由后台线程定期或在缓冲达到批量大小时批量写入数据库，
+    多次入库产生的日志合并为一次写入。写入失败的日志放回缓冲区开头，下次写入时重试。缓冲区有上限，
+    写入跟不上或数据库长时间不可用时丢弃超出的日志并记录警告（计入 dropped_count），不阻塞入库。
+    """
+    
+    def __init__(self, write_logs, buffer_size=None, batch_size=None, flush_interval=None):
+        """
+        Args:
+            write_logs: 批量写入函数 write_logs(logs) -> (是否成功, 写入条数)
+            buffer_size: 缓冲区最多容纳的日志条数
+            batch_size: 缓冲达到该条数时立即触发写入
+            flush_interval: 定期写入的间隔（秒）
+        """
+        self.write_logs = write_logs
+        self.buffer_size = buffer_size or int(os.getenv('CLEANING_LOG_BUFFER_SIZE', 10000))
+        self.batch_size = batch_size or int(os.getenv('CLEANING_LOG_BATCH_SIZE', 500))
+        self.flush_interval = flush_interval or float(os.getenv('CLEANING_LOG_FLUSH_INTERVAL', 5))
+        self.buffer = deque()
+        self.dropped_count = 0
+        self.lock = threading.Lock()
+        # 写入数据库期间持有，保证 flush 返回时已取出的日志都已写入
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.thread = None
+    
+    def submit(self, logs):
+        """放入一批清洗日志（不等待写入）
+        
+        Returns:
+            放入缓冲区的条数
+        """
+        if not logs:
+            return 0
+        
+        with self.lock:
+            if self.closed:
+                logger.warning(f"清洗日志缓冲已关闭，丢弃 {len(logs)} 条日志")
+                return 0
+            accepted = min(len(logs), self.buffer_size - len(self.buffer))
+            self.buffer.extend(logs[:accepted])
+            dropped = len(logs) - accepted
+            self.dropped_count += dropped
+            pending = len(self.buffer)
+            
+            # 首次提交时启动后台写入线程
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='cleaning-log-sink', daemon=True)
+                self.thread.start()
+        
+        if dropped:
+            logger.warning(f"清洗日志缓冲区已满，丢弃 {dropped} 条日志（累计丢弃 {self.dropped_count} 条）")
+        if pending >= self.batch_size:
+            self.wakeup.set()
+        return accepted
+    
+    def flush(self):
+        """立即写入缓冲区中的全部日志
+        
+        Returns:
+            (是否成功, 写入条数)
+        """
+        with self.write_lock:
+            with self.lock:
+                logs = list(self.buffer)
+                self.buffer.clear()
+            if not logs:
+                return True, 0
+            try:
+                success, written = self.write_logs(logs)
+            except Exception:
+                self._requeue(logs)
+                raise
+            if not success:
+                self._requeue(logs)
+            return success, written
+    
+    def _requeue(self, logs):
+        """写入失败的日志放回缓冲区开头（在新提交的日志之前），超出缓冲区上限的部分丢弃"""
+        with self.lock:
+            kept = min(len(logs), self.buffer_size - len(self.buffer))
+            self.buffer.extendleft(reversed(logs[:kept]))
+            dropped = len(logs) - kept
+            self.dropped_count += dropped
+        if dropped:
+            logger.warning(f"清洗日志写入失败且缓冲区已满，丢弃 {dropped} 条日志（累计丢弃 {self.dropped_count} 条）")
+        else:
+            logger.warning(f"清洗日志写入失败，{kept} 条日志放回缓冲区等待重试")
+    
+    def close(self):
+        """写入剩余日志并停止后台线程"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+    
+    def _run(self):
+        """后台写入线程：定期或被唤醒时写入缓冲区中的日志"""
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"清洗日志后台写入失败: {e}")
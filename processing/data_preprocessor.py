@@ -4,12 +4,17 @@ import logging
 from datetime import datetime
 import os
 
+from .city_catalog import city_id_map
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class WeatherDataPreprocessor:
-    def __init__(self):
+    def __init__(self, city_ids=None):
+        # 城市名称/编码到 city_id 的映射，默认使用站点目录文件（入库时使用数据库中的映射）
+        self.city_ids = city_ids or city_id_map()
+        
         # 数据质量规则
         self.validation_rules = {
             'temperature': {'min': -50, 'max': 60, 'unit': '°C'},
@@ -222,15 +227,6 @@ class WeatherDataPreprocessor:
         try:
             df_copy = df.copy()
             
-            # 城市编码
-            city_mapping = {
-                'beijing': 1,
-                'shanghai': 2,
-                'guangzhou': 3,
-                'shenzhen': 4,
-                'chengdu': 5
-            }
-            
             # 数据源编码
             source_mapping = {
                 'OpenWeatherMap': 1,
@@ -239,7 +235,8 @@ class WeatherDataPreprocessor:
             }
             
             if 'city' in df_copy.columns:
-                df_copy['city_id'] = df_copy['city'].map(city_mapping)
+                # 城市编码（名称或站点编码均可）
+                df_copy['city_id'] = self.city_ids.encode(df_copy['city']).to_numpy()
             
             if 'source' in df_copy.columns:
                 df_copy['source_id'] = df_copy['source'].map(source_mapping)
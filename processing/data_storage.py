@@ -1,26 +1,391 @@
 import os
+import io
+import json
+import time
+import hashlib
 import logging
+import threading
 from datetime import datetime
 import pandas as pd
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select, insert, and_, or_
+from sqlalchemy.exc import IntegrityError, DataError, DBAPIError, StatementError
 
-from .database_manager import DatabaseManager, RealTimeWeather, HistoricalWeather, ExtremeEvent, DataCleaningLog
+from .database_manager import DatabaseManager, RealTimeWeather, HistoricalWeather, ExtremeEvent, DataCleaningLog, QuarantinedRow
 from .data_preprocessor import WeatherDataPreprocessor
+from .city_catalog import city_id_map
+from .ingest_manifest import IngestManifestManager
+from .cleaning_log_sink import CleaningLogSink
+from .parquet_lake import ParquetLake
+from .weather_rollups import WeatherRollupManager
+from .partition_manager import HistoricalPartitionManager
+from .hot_window import HOT_WINDOW_ENABLED, HOT_WINDOW_HOURS, hot_window
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 气象数据表的唯一键
+WEATHER_KEY_COLUMNS = ['city_id', 'timestamp']
+
+# 气象数据表入库字段
+WEATHER_RECORD_COLUMNS = ['city_id', 'source_id', 'timestamp', 'temperature', 'pressure', 'humidity',
+                          'precipitation', 'wind_speed', 'wind_direction', 'status']
+
+# 实时数据upsert时需要覆盖的字段
+REALTIME_UPDATE_COLUMNS = ['source_id', 'temperature', 'pressure', 'humidity', 'precipitation',
+                           'wind_speed', 'wind_direction', 'status', 'updated_at']
+
+# 数据清洗日志表入库字段
+CLEANING_LOG_COLUMNS = ['process_time', 'data_source', 'field_name', 'process_type', 'process_method',
+                        'before_count', 'after_count', 'affected_count', 'description']
+
+# 极端事件表的唯一事件键
+EVENT_KEY_COLUMNS = ['city_id', 'event_type', 'start_time', 'end_time']
+
+# 极端事件表入库字段
+EVENT_RECORD_COLUMNS = ['city_id', 'source_id', 'event_type', 'event_level', 'start_time', 'end_time',
+                        'max_temperature', 'min_temperature', 'max_pressure', 'min_pressure',
+                        'max_humidity', 'max_precipitation', 'max_wind_speed', 'description', 'status']
+
+# 断点校验已处理内容时读取的字节数（文件开头和断点位置之前各读取这么多字节计算哈希）
+FINGERPRINT_BYTES = 64 * 1024
+
+def hash_range(file_path, start, size):
+    """计算文件从 start 开始 size 字节内容的哈希"""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        return hashlib.sha256(f.read(size)).hexdigest()
+
+def _read_record(f):
+    """读取CSV文件中的一条记录（字节），引号内的换行不作为记录结束；文件结束时返回空字节串"""
+    record = f.readline()
+    while record and record.count(b'"') % 2:
+        line = f.readline()
+        if not line:
+            break
+        record += line
+    return record
+
+def csv_row_offset(file_path, row_count):
+    """表头之后第 row_count 条数据行结束处的字节偏移（只扫描字节，不解析数据，空行不计数）"""
+    with open(file_path, 'rb') as f:
+        _read_record(f)
+        skipped = 0
+        while skipped < row_count:
+            record = _read_record(f)
+            if not record:
+                break
+            if record.strip():
+                skipped += 1
+        return f.tell()
+
+def iter_csv_chunks(file_path, chunk_size=None, byte_offset=None):
+    """从字节偏移处分块读取CSV文件，逐块返回 (数据, 本块结束处的字节偏移)
+    
+    按记录切分文件，每块加上表头交给pandas解析，chunk_size 为空时剩余内容作为一块。
+    byte_offset 为空时从表头之后开始读取。
+    """
+    with open(file_path, 'rb') as f:
+        header = _read_record(f)
+        if byte_offset is not None:
+            f.seek(byte_offset)
+        while True:
+            records = []
+            while not chunk_size or len(records) < chunk_size:
+                record = _read_record(f)
+                if not record:
+                    break
+                if record.strip():
+                    records.append(record)
+            if not records:
+                return
+            yield pd.read_csv(io.BytesIO(header + b''.join(records))), f.tell()
+
+def existing_keys_query(model, bounds):
+    """按城市的时间窗口查询已存在的 (city_id, timestamp) 键
+    
+    Args:
+        model: 气象数据表模型
+        bounds: 以城市ID为索引、包含 min/max 时间的DataFrame
+    """
+    conditions = [
+        and_(model.city_id == int(city_id),
+             model.timestamp.between(row['min'].to_pydatetime(), row['max'].to_pydatetime()))
+        for city_id, row in bounds.iterrows()
+    ]
+    return select(model.city_id, model.timestamp).where(or_(*conditions))
+
 class WeatherDataStorage:
-    def __init__(self):
-        # 初始化数据库管理器
-        self.db_manager = DatabaseManager()
+    def __init__(self, db_manager=None):
+        # 初始化数据库管理器（为空时按环境配置连接）
+        self.db_manager = db_manager or DatabaseManager()
+        
+        # 初始化数据预处理模块，城市按数据库中的城市ID映射编码
+        self.preprocessor = WeatherDataPreprocessor(city_id_map(self.db_manager.engine))
+        
+        # 批量写入的分块大小
+        self.chunk_size = int(os.getenv('DB_BATCH_SIZE', 5000))
+        
+        # CSV流式读取的分块行数（为0时整文件读取）及断点文件目录
+        self.csv_chunk_size = int(os.getenv('CSV_CHUNK_SIZE', 0))
+        self.checkpoint_dir = os.getenv('CSV_CHECKPOINT_DIR', './data/checkpoints')
+        
+        # 文件入库清单，用于跳过未变化的文件、只加载追加的内容
+        self.manifest = IngestManifestManager(self.db_manager) if os.getenv('INGEST_MANIFEST', '1') == '1' else None
+        
+        # 清洗日志在后台批量写入
+        self.cleaning_log_sink = CleaningLogSink(self.store_cleaning_logs)
+        
+        # 历史天气表按时间分区（HISTORICAL_PARTITIONING: year / month），写入前创建缺少的分区
+        self.partitions = HistoricalPartitionManager(self.db_manager) if os.getenv('HISTORICAL_PARTITIONING') else None
         
-        # 初始化数据预处理模块
-        self.preprocessor = WeatherDataPreprocessor()
+        # 历史数据的按天/按月汇总，与新观测在同一事务中累加
+        self.rollups = WeatherRollupManager(self.db_manager) if os.getenv('WEATHER_ROLLUPS', '1') == '1' else None
+        
+        # 分块提交后的监听器（如写入Parquet数据湖）及数据行被隔离后的监听器
+        self.commit_listeners = []
+        self.quarantine_listeners = []
+        # 各线程最近一次存储/加载调用中被隔离的行数（见 last_quarantined_count）
+        self._call_state = threading.local()
+        self.parquet_lake = None
+        if os.getenv('PARQUET_LAKE', '0') == '1':
+            self.parquet_lake = ParquetLake()
+            self.add_commit_listener(self.parquet_lake.append)
+        
+        # 提交后在主库更新复制心跳，只读副本据此计算延迟；间隔内的多次提交只写一次，小于0时不写心跳。
+        # 未设置 DB_HEARTBEAT_INTERVAL 时只在配置了只读副本（DB_REPLICA_URLS）时按1秒间隔写入
+        heartbeat_interval = os.getenv('DB_HEARTBEAT_INTERVAL')
+        if heartbeat_interval is None:
+            heartbeat_interval = 1 if self.db_manager.replicas is not None else -1
+        self.heartbeat_interval = float(heartbeat_interval)
+        self._last_heartbeat = None
+        if self.heartbeat_interval >= 0:
+            self.add_commit_listener(self._write_heartbeat)
+        
+        # 已提交的气象观测写入进程内热数据窗口（HOT_WINDOW=1 时开启），预警和看板直接读取最新观测
+        if HOT_WINDOW_ENABLED and HOT_WINDOW_HOURS > 0:
+            self.add_commit_listener(self._feed_hot_window)
+    
+    def _feed_hot_window(self, target_table, frame):
+        """提交监听器：气象数据表的观测写入热数据窗口"""
+        if target_table in (HistoricalWeather.__tablename__, RealTimeWeather.__tablename__):
+            hot_window(self.db_manager.engine, target_table).append(frame)
+    
+    def _write_heartbeat(self, target_table, frame):
+        """提交监听器：距上次心跳超过间隔时更新主库心跳"""
+        now = time.monotonic()
+        if self._last_heartbeat is not None and now - self._last_heartbeat < self.heartbeat_interval:
+            return
+        self._last_heartbeat = now
+        self.db_manager.write_heartbeat()
+    
+    def _prepare_weather_frame(self, df, keep='last'):
+        """提取气象数据入库字段并规范类型
+        
+        Args:
+            df: 预处理后的气象数据
+            keep: 批内重复键保留哪一条（'last' 对应upsert的后写覆盖，'first' 对应仅插入新数据）
+        
+        Returns:
+            (按 (city_id, timestamp) 去重后的数据, 批内重复的条数)
+        """
+        frame = df[[col for col in WEATHER_RECORD_COLUMNS if col != 'status']].copy()
+        frame['timestamp'] = pd.to_datetime(frame['timestamp']).astype('datetime64[ns]')
+        frame['status'] = 1
+        
+        before_count = len(frame)
+        frame = frame.drop_duplicates(subset=WEATHER_KEY_COLUMNS, keep=keep)
+        return frame, before_count - len(frame)
+    
+    def _fetch_existing_keys(self, session, model, frame):
+        """按城市的时间窗口做一次范围查询，取回已存在的 (city_id, timestamp) 键"""
+        bounds = frame.dropna(subset=WEATHER_KEY_COLUMNS).groupby('city_id')['timestamp'].agg(['min', 'max'])
+        if bounds.empty:
+            return pd.DataFrame(columns=WEATHER_KEY_COLUMNS)
+        
+        rows = session.execute(existing_keys_query(model, bounds)).all()
+        
+        existing = pd.DataFrame(rows, columns=WEATHER_KEY_COLUMNS)
+        existing['city_id'] = existing['city_id'].astype(frame['city_id'].dtype)
+        existing['timestamp'] = pd.to_datetime(existing['timestamp']).astype('datetime64[ns]')
+        return existing
+    
+    def _mark_existing(self, session, model, frame):
+        """返回布尔数组，标记 frame 中每一行的键是否已存在于数据库"""
+        if model is HistoricalWeather and self.partitions is not None:
+            # 只在本批数据时间范围内的分区中查找
+            model = self.partitions.source(frame['timestamp'].min(), frame['timestamp'].max())
+        existing = self._fetch_existing_keys(session, model, frame)
+        merged = frame[WEATHER_KEY_COLUMNS].merge(existing, on=WEATHER_KEY_COLUMNS, how='left', indicator=True)
+        return (merged['_merge'] == 'both').to_numpy()
+    
+    def _count_new_events(self, session, chunk):
+        """统计分块中数据库尚不存在的事件数（批内重复的事件键只计一次）
+        
+        MySQL的 ON DUPLICATE KEY UPDATE 在默认的 FOUND_ROWS 连接选项下，重复键也计入 rowcount，
+        因此两种方言都在写入前按城市和开始时间范围查询已存在的事件键来统计新增条数。
+        """
+        keys = chunk[EVENT_KEY_COLUMNS].dropna().drop_duplicates()
+        if keys.empty:
+            return 0
+        
+        rows = session.execute(
+            select(*[getattr(ExtremeEvent, column) for column in EVENT_KEY_COLUMNS]).where(
+                ExtremeEvent.city_id.in_([int(city_id) for city_id in keys['city_id'].unique()]),
+                ExtremeEvent.start_time.between(keys['start_time'].min().to_pydatetime(), keys['start_time'].max().to_pydatetime())
+            )
+        ).all()
+        existing = pd.DataFrame(rows, columns=EVENT_KEY_COLUMNS)
+        existing['city_id'] = existing['city_id'].astype(keys['city_id'].dtype)
+        existing['event_type'] = existing['event_type'].astype(keys['event_type'].dtype)
+        for column in ('start_time', 'end_time'):
+            existing[column] = pd.to_datetime(existing[column]).astype('datetime64[ns]')
+        merged = keys.merge(existing, on=EVENT_KEY_COLUMNS, how='left', indicator=True)
+        return int((merged['_merge'] == 'left_only').sum())
+    
+    def _to_records(self, frame, columns):
+        """DataFrame转换为executemany参数列表（NaN转为None，时间转为datetime）"""
+        data = frame[columns].astype(object)
+        data = data.where(pd.notna(frame[columns]), None)
+        for column in columns:
+            if pd.api.types.is_datetime64_any_dtype(frame[column]):
+                # datetime64[us] 转 object 时得到 datetime.datetime，NaT 转为 None
+                data[column] = pd.Series(frame[column].to_numpy().astype('datetime64[us]').astype(object), index=frame.index, dtype=object)
+        return data.to_dict('records')
+    
+    def _to_python(self, value):
+        """numpy标量转换为Python原生类型，便于数据库驱动处理"""
+        return value.item() if hasattr(value, 'item') else value
+    
+    def add_commit_listener(self, listener):
+        """注册提交监听器，每个分块提交后以 listener(表名, 已提交的数据) 调用"""
+        self.commit_listeners.append(listener)
+    
+    def _notify_commit(self, target_table, frame):
+        """通知提交监听器；监听器出错只记录日志，不影响已提交的数据"""
+        for listener in self.commit_listeners:
+            try:
+                listener(target_table, frame)
+            except Exception as e:
+                logger.error(f"提交监听器处理 {target_table} 数据失败: {e}")
     
-    def store_realtime_weather(self, df):
-        """存储实时气象数据"""
+    @property
+    def last_quarantined_count(self):
+        """当前线程最近一次存储或加载调用中被隔离到 quarantined_rows 表的行数
+        
+        存储和加载方法的返回值不含隔离条数，需要区分“全部入库”和“部分被隔离”的调用方（如保留任务、
+        入库清单）在调用后读取该值；加载多个分块或文件的方法为各次写入的合计。
+        """
+        return getattr(self._call_state, 'quarantined', 0)
+    
+    def add_quarantine_listener(self, listener):
+        """注册隔离监听器，数据行被隔离后以 listener(表名, 被隔离的数据) 调用"""
+        self.quarantine_listeners.append(listener)
+    
+    def _notify_quarantine(self, target_table, rows):
+        """通知隔离监听器；监听器出错只记录日志"""
+        for listener in self.quarantine_listeners:
+            try:
+                listener(target_table, rows)
+            except Exception as e:
+                logger.error(f"隔离监听器处理 {target_table} 数据失败: {e}")
+    
+    def _is_row_error(self, error):
+        """判断写入错误是否由数据行本身引起（完整性约束、取值错误或参数无法转换）"""
+        return isinstance(error, (IntegrityError, DataError)) or not isinstance(error, DBAPIError)
+    
+    def _write_in_chunks(self, target_table, frame, write_chunk, chunk_size=None):
+        """分块写入并逐块提交
+        
+        Args:
+            target_table: 目标表名（用于隔离记录）
+            frame: 待写入的数据
+            write_chunk: 写入函数 write_chunk(session, chunk) -> (新增条数, 更新条数, 实际写入的数据)
+            chunk_size: 分块大小
+        
+        Returns:
+            (新增条数, 更新条数, 隔离条数)
+        """
+        chunk_size = chunk_size or self.chunk_size
+        stored_count = 0
+        updated_count = 0
+        quarantined_count = 0
+        
+        for start in range(0, len(frame), chunk_size):
+            stored, updated, quarantined = self._write_chunk_with_bisect(
+                target_table, frame.iloc[start:start + chunk_size], write_chunk
+            )
+            stored_count += stored
+            updated_count += updated
+            quarantined_count += quarantined
+        
+        if quarantined_count:
+            logger.warning(f"{target_table} 写入时有 {quarantined_count} 条数据被隔离到 quarantined_rows 表")
+        self._call_state.quarantined = quarantined_count
+        return stored_count, updated_count, quarantined_count
+    
+    def _write_chunk_with_bisect(self, target_table, chunk, write_chunk):
+        """在独立事务中写入一个分块；分块因数据行错误失败时二分重试，定位到单行后将其隔离
+        
+        Returns:
+            (新增条数, 更新条数, 隔离条数)
+        """
+        session = self.db_manager.get_session()
+        try:
+            stored, updated, written = write_chunk(session, chunk)
+            session.commit()
+            self._notify_commit(target_table, written)
+            return stored, updated, 0
+        except StatementError as e:
+            session.rollback()
+            if not self._is_row_error(e):
+                raise
+            error = e
+        finally:
+            session.close()
+        
+        if len(chunk) == 1:
+            self._quarantine_rows(target_table, chunk, error)
+            return 0, 0, 1
+        
+        middle = len(chunk) // 2
+        first = self._write_chunk_with_bisect(target_table, chunk.iloc[:middle], write_chunk)
+        second = self._write_chunk_with_bisect(target_table, chunk.iloc[middle:], write_chunk)
+        return tuple(a + b for a, b in zip(first, second))
+    
+    def _quarantine_rows(self, target_table, rows, error):
+        """将无法写入的数据行连同失败原因写入隔离表"""
+        reason = str(getattr(error, 'orig', None) or error)[:2000]
+        payloads = [json.dumps(record, ensure_ascii=False, default=str) for record in rows.astype(object).where(pd.notna(rows), None).to_dict('records')]
+        
+        session = self.db_manager.get_session()
+        try:
+            session.execute(insert(QuarantinedRow.__table__), [
+                {'target_table': target_table, 'payload': payload, 'reason': reason, 'created_at': datetime.now()}
+                for payload in payloads
+            ])
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"写入隔离表失败: {e}，数据: {payloads}，原因: {reason}")
+        finally:
+            session.close()
+        self._notify_quarantine(target_table, rows)
+    
+    def store_realtime_weather(self, df, bulk=True):
+        """存储实时气象数据
+        
+        Args:
+            df: 预处理后的实时数据
+            bulk: 是否使用批量upsert（False时使用逐行查询并写入的方式）
+        
+        Returns:
+            (是否成功, 新增条数, 更新条数)，被隔离的行数见 last_quarantined_count；逐行写入失败时整批回滚，不隔离数据
+        """
+        self._call_state.quarantined = 0
+        if bulk:
+            return self.bulk_upsert_realtime_weather(df)
+        
         try:
             session = self.db_manager.get_session()
             stored_count = 0
@@ -78,11 +443,57 @@ class WeatherDataStorage:
             session.close()
             return False, 0, 0
     
-    def store_historical_weather(self, df):
-        """存储历史气象数据"""
+    def bulk_upsert_realtime_weather(self, df, chunk_size=None):
+        """批量upsert实时气象数据
+        
+        每个分块先用一次范围查询统计已存在的键，再以一条带冲突子句的语句写入整个分块，
+        按 (city_id, timestamp) 冲突时更新。每个分块单独提交，问题行被隔离而不影响其他数据。
+        
+        Returns:
+            (是否成功, 新增条数, 更新条数)，被隔离的行数见 last_quarantined_count
+        """
+        self._call_state.quarantined = 0
         try:
+            frame, duplicate_count = self._prepare_weather_frame(df)
+            stmt = self.db_manager.upsert_statement(RealTimeWeather, WEATHER_KEY_COLUMNS, REALTIME_UPDATE_COLUMNS)
+            
+            def write_chunk(session, chunk):
+                existing_count = int(self._mark_existing(session, RealTimeWeather, chunk).sum())
+                session.execute(stmt, self._to_records(chunk, WEATHER_RECORD_COLUMNS))
+                return len(chunk) - existing_count, existing_count, chunk
+            
+            stored_count, updated_count, quarantined_count = self._write_in_chunks(
+                RealTimeWeather.__tablename__, frame, write_chunk, chunk_size
+            )
+            # 批内重复的行在逐行写入时会表现为更新
+            updated_count += duplicate_count
+            
+            logger.info(f"实时气象数据批量存储完成，新增: {stored_count}条，更新: {updated_count}条，隔离: {quarantined_count}条")
+            return True, stored_count, updated_count
+        except Exception as e:
+            logger.error(f"实时气象数据批量存储失败: {e}")
+            return False, 0, 0
+    
+    def store_historical_weather(self, df, bulk=True):
+        """存储历史气象数据
+        
+        Args:
+            df: 预处理后的历史数据
+            bulk: 是否使用批量去重插入（False时使用逐行查询并写入的方式）
+        
+        Returns:
+            (是否成功, 新增条数)，被隔离的行数见 last_quarantined_count；逐行写入失败时整批回滚，不隔离数据
+        """
+        self._call_state.quarantined = 0
+        if bulk:
+            return self.bulk_insert_historical_weather(df)
+        
+        try:
+            if self.partitions is not None:
+                self.partitions.ensure_partitions(df['timestamp'])
             session = self.db_manager.get_session()
             stored_count = 0
+            stored_rows = []
             
             for _, row in df.iterrows():
                 # 检查数据是否已存在
@@ -106,8 +517,12 @@ class WeatherDataStorage:
                         status=1
                     )
                     session.add(historical_data)
+                    stored_rows.append(row)
                     stored_count += 1
             
+            if self.rollups is not None and stored_rows:
+                self.rollups.apply(session, pd.DataFrame(stored_rows))
+            
             # 提交事务
             session.commit()
             session.close()
@@ -125,8 +540,59 @@ class WeatherDataStorage:
             session.close()
             return False, 0
     
-    def store_extreme_events(self, df):
-        """存储极端天气事件数据"""
+    def bulk_insert_historical_weather(self, df, chunk_size=None):
+        """批量插入历史气象数据（已存在的键跳过）
+        
+        每个分块通过一次按城市时间窗口的范围查询取回已存在的键，与本批数据做反连接去重
+        （批内重复键同样只保留第一条），剩余数据用 executemany 一次写入。
+        每个分块单独提交，问题行被隔离而不影响其他数据。
+        
+        Returns:
+            (是否成功, 新增条数)，被隔离的行数见 last_quarantined_count
+        """
+        self._call_state.quarantined = 0
+        try:
+            frame, _ = self._prepare_weather_frame(df, keep='first')
+            stmt = insert(HistoricalWeather.__table__)
+            if self.partitions is not None:
+                self.partitions.ensure_partitions(frame['timestamp'])
+            
+            def write_chunk(session, chunk):
+                new_rows = chunk[~self._mark_existing(session, HistoricalWeather, chunk)]
+                if not new_rows.empty:
+                    if self.partitions is None:
+                        session.execute(stmt, self._to_records(new_rows, WEATHER_RECORD_COLUMNS))
+                    else:
+                        for table, part in self.partitions.split_by_partition(new_rows):
+                            session.execute(insert(table), self._to_records(part, WEATHER_RECORD_COLUMNS))
+                    if self.rollups is not None:
+                        self.rollups.apply(session, new_rows)
+                return len(new_rows), 0, new_rows
+            
+            stored_count, _, quarantined_count = self._write_in_chunks(
+                HistoricalWeather.__tablename__, frame, write_chunk, chunk_size
+            )
+            
+            logger.info(f"历史气象数据批量存储完成，新增: {stored_count}条，隔离: {quarantined_count}条")
+            return True, stored_count
+        except Exception as e:
+            logger.error(f"历史气象数据批量存储失败: {e}")
+            return False, 0
+    
+    def store_extreme_events(self, df, bulk=True):
+        """存储极端天气事件数据
+        
+        Args:
+            df: 极端事件数据
+            bulk: 是否使用批量插入并跳过冲突（False时使用逐行查询并写入的方式）
+        
+        Returns:
+            (是否成功, 新增条数)，被隔离的行数见 last_quarantined_count；逐行写入失败时整批回滚，不隔离数据
+        """
+        self._call_state.quarantined = 0
+        if bulk:
+            return self.bulk_insert_extreme_events(df)
+        
         try:
             session = self.db_manager.get_session()
             stored_count = 0
@@ -179,42 +645,62 @@ class WeatherDataStorage:
             session.close()
             return False, 0
     
-    def store_cleaning_logs(self, logs):
-        """存储数据清洗日志"""
+    def bulk_insert_extreme_events(self, df, chunk_size=None):
+        """批量插入极端天气事件，依赖唯一事件键跳过已存在的事件
+        
+        Returns:
+            (是否成功, 新增条数)，被隔离的行数见 last_quarantined_count
+        """
+        self._call_state.quarantined = 0
         try:
-            session = self.db_manager.get_session()
-            stored_count = 0
+            # 缺失的可选字段补为空值
+            frame = df.reindex(columns=EVENT_RECORD_COLUMNS).copy()
+            frame['start_time'] = pd.to_datetime(frame['start_time']).astype('datetime64[ns]')
+            frame['end_time'] = pd.to_datetime(frame['end_time']).astype('datetime64[ns]')
+            frame['status'] = 1
+            stmt = self.db_manager.insert_ignore_statement(ExtremeEvent)
             
-            for log in logs:
-                # 插入日志数据
-                cleaning_log = DataCleaningLog(
-                    process_time=log['process_time'],
-                    data_source=log['data_source'],
-                    field_name=log['field_name'],
-                    process_type=log['process_type'],
-                    process_method=log['process_method'],
-                    before_count=log['before_count'],
-                    after_count=log['after_count'],
-                    affected_count=log['affected_count'],
-                    description=log['description']
-                )
-                session.add(cleaning_log)
-                stored_count += 1
+            def write_chunk(session, chunk):
+                new_count = self._count_new_events(session, chunk)
+                session.execute(stmt, self._to_records(chunk, EVENT_RECORD_COLUMNS))
+                return new_count, 0, chunk
             
-            # 提交事务
-            session.commit()
-            session.close()
+            stored_count, _, quarantined_count = self._write_in_chunks(
+                ExtremeEvent.__tablename__, frame, write_chunk, chunk_size
+            )
             
-            logger.info(f"数据清洗日志存储完成，新增: {stored_count}条")
+            logger.info(f"极端天气事件数据批量存储完成，新增: {stored_count}条，"
+                        f"跳过已存在: {len(frame) - stored_count - quarantined_count}条，隔离: {quarantined_count}条")
             return True, stored_count
+        except Exception as e:
+            logger.error(f"极端天气事件数据批量存储失败: {e}")
+            return False, 0
+    
+    def store_cleaning_logs(self, logs):
+        """批量存储数据清洗日志（同步写入，一条 executemany 语句）"""
+        session = self.db_manager.get_session()
+        try:
+            records = [{column: self._to_python(log.get(column)) for column in CLEANING_LOG_COLUMNS} for log in logs]
+            if records:
+                session.execute(insert(DataCleaningLog.__table__), records)
+                session.commit()
+            
+            logger.info(f"数据清洗日志存储完成，新增: {len(records)}条")
+            return True, len(records)
         except Exception as e:
             logger.error(f"数据清洗日志存储失败: {e}")
             session.rollback()
-            session.close()
             return False, 0
+        finally:
+            session.close()
     
     def preprocess_and_store(self, df, data_type='historical'):
-        """预处理并存储数据"""
+        """预处理并存储数据
+        
+        Returns:
+            (是否成功, 新增条数, 更新条数)，被隔离的行数见 last_quarantined_count
+        """
+        self._call_state.quarantined = 0
         try:
             # 1. 数据预处理
             processed_df = self.preprocessor.preprocess_data(df, data_type)
@@ -223,31 +709,54 @@ class WeatherDataStorage:
                 logger.error("数据预处理失败，无法存储")
                 return False, 0, 0
             
-            # 2. 存储清洗日志
+            # 2. 清洗日志交给后台批量写入，不等待落库
             if self.preprocessor.cleaning_logs:
-                self.store_cleaning_logs(self.preprocessor.cleaning_logs)
+                self.cleaning_log_sink.submit(self.preprocessor.cleaning_logs)
                 # 清空日志列表
                 self.preprocessor.cleaning_logs = []
             
             # 3. 根据数据类型存储
-            if data_type == 'realtime':
-                success, stored, updated = self.store_realtime_weather(processed_df)
-                return success, stored, updated
-            elif data_type == 'historical':
-                success, stored = self.store_historical_weather(processed_df)
-                return success, stored, 0
-            elif data_type == 'extreme':
-                success, stored = self.store_extreme_events(processed_df)
-                return success, stored, 0
-            else:
-                logger.error(f"不支持的数据类型: {data_type}")
-                return False, 0, 0
+            return self.store_processed_data(processed_df, data_type)
         except Exception as e:
             logger.error(f"预处理并存储数据失败: {e}")
             return False, 0, 0
     
-    def load_historical_data_from_csv(self, file_path, data_type='historical'):
-        """从CSV文件加载历史数据并存储"""
+    def store_processed_data(self, processed_df, data_type='historical'):
+        """按数据类型存储已预处理的数据
+        
+        Returns:
+            (是否成功, 新增条数, 更新条数)
+        """
+        if data_type == 'realtime':
+            return self.store_realtime_weather(processed_df)
+        elif data_type == 'historical':
+            success, stored = self.store_historical_weather(processed_df)
+            return success, stored, 0
+        elif data_type == 'extreme':
+            success, stored = self.store_extreme_events(processed_df)
+            return success, stored, 0
+        else:
+            logger.error(f"不支持的数据类型: {data_type}")
+            return False, 0, 0
+    
+    def load_historical_data_from_csv(self, file_path, data_type='historical', chunk_size=None, resume=True):
+        """从CSV文件加载历史数据并存储
+        
+        Args:
+            file_path: CSV文件路径
+            data_type: 数据类型 (realtime, historical, extreme)
+            chunk_size: 分块读取的行数，为空时使用 CSV_CHUNK_SIZE 配置，均未设置时整文件读取
+            resume: 分块读取时是否从上次中断的断点继续
+        
+        Returns:
+            (是否成功, 新增条数, 更新条数)，被隔离的行数见 last_quarantined_count
+        """
+        self._call_state.quarantined = 0
+        chunk_size = chunk_size or self.csv_chunk_size
+        if chunk_size:
+            success, stored, updated, _ = self.stream_csv_to_database(file_path, data_type, chunk_size, resume)
+            return success, stored, updated
+        
         try:
             # 读取CSV文件
             df = pd.read_csv(file_path)
@@ -259,30 +768,238 @@ class WeatherDataStorage:
             logger.error(f"从CSV文件加载历史数据失败: {e}")
             return False, 0, 0
     
-    def bulk_load_historical_data(self, directory_path, data_type='historical'):
-        """批量加载目录下的所有CSV文件"""
+    def _checkpoint_path(self, file_path):
+        """断点文件路径（按CSV文件绝对路径的哈希命名）"""
+        file_key = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+        return os.path.join(self.checkpoint_dir, f'{file_key}.json')
+    
+    def _file_state(self, file_path):
+        """文件当前的 (大小, 修改时间)，开始加载时记录，不读取文件内容"""
+        stat = os.stat(file_path)
+        return stat.st_size, stat.st_mtime_ns
+    
+    def _processed_hashes(self, file_path, byte_offset):
+        """已处理部分（断点位置之前）开头和末尾各 FINGERPRINT_BYTES 字节内容的哈希"""
+        start = max(byte_offset - FINGERPRINT_BYTES, 0)
+        return (hash_range(file_path, 0, min(byte_offset, FINGERPRINT_BYTES)),
+                hash_range(file_path, start, byte_offset - start))
+    
+    def _load_checkpoint(self, file_path, data_type, file_state):
+        """读取断点，数据类型不一致、文件被截断或已处理部分的内容被修改时视为无效
+        
+        断点记录写入时的文件大小、修改时间，以及已处理部分开头和末尾一段内容的哈希。
+        大小和修改时间都没变时直接使用断点；否则只接受在末尾追加内容的情况，校验这两段内容，不读取整个文件。
+        """
+        checkpoint_path = self._checkpoint_path(file_path)
+        if not os.path.exists(checkpoint_path):
+            return None
+        
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        
+        file_size, file_mtime_ns = file_state
+        if checkpoint.get('data_type') != data_type or 'byte_offset' not in checkpoint or file_size < checkpoint['file_size']:
+            logger.warning(f"文件 {file_path} 已变化，忽略原有断点")
+            return None
+        
+        if file_size != checkpoint['file_size'] or file_mtime_ns != checkpoint['file_mtime_ns']:
+            if list(self._processed_hashes(file_path, checkpoint['byte_offset'])) != checkpoint['processed_hashes']:
+                logger.warning(f"文件 {file_path} 已处理部分的内容已被修改，忽略原有断点")
+                return None
+        return checkpoint
+    
+    def _save_checkpoint(self, file_path, data_type, file_state, rows_done, byte_offset, stored, updated, quarantined):
+        """原子写入断点（先写临时文件再替换）"""
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        checkpoint_path = self._checkpoint_path(file_path)
+        file_size, file_mtime_ns = file_state
+        checkpoint = {
+            'file_path': os.path.abspath(file_path),
+            'data_type': data_type,
+            'file_size': file_size,
+            'file_mtime_ns': file_mtime_ns,
+            'processed_hashes': self._processed_hashes(file_path, byte_offset),
+            'rows_done': rows_done,
+            'byte_offset': byte_offset,
+            'stored': stored,
+            'updated': updated,
+            'quarantined': quarantined,
+            'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        tmp_path = f'{checkpoint_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, checkpoint_path)
+    
+    def _clear_checkpoint(self, file_path):
+        """文件加载完成后删除断点"""
+        checkpoint_path = self._checkpoint_path(file_path)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    
+    def stream_csv_to_database(self, file_path, data_type='historical', chunk_size=50000, resume=True, start_row=0):
+        """分块流式加载CSV文件
+        
+        每次只读取 chunk_size 行，逐块预处理、入库并提交，内存占用与文件大小无关。resume 为True时
+        每块提交后记录已处理的数据行数和字节偏移作为断点，中断后再次加载同一文件时直接定位到断点继续；
+        resume 为False时从 start_row 开始加载，不读取也不记录断点（由调用方的入库清单决定起始行）。
+        分块中被隔离的行已记录在 quarantined_rows 表中，不影响继续加载后续分块，隔离条数见 last_quarantined_count。
+        
+        预处理按块进行：IQR异常值检测的分位数、极端事件缺失值的均值填充都只基于本块数据计算，
+        线性插值也不跨越块边界，因此清洗结果与整文件加载可能不同（块越大越接近）。
+        需要与整文件一致的清洗结果时应不设置 chunk_size。
+        
+        Args:
+            file_path: CSV文件路径
+            data_type: 数据类型
+            chunk_size: 每块读取的行数，为空时整个文件作为一块
+            resume: 是否使用断点（从已有断点继续并在每块提交后更新断点）
+            start_row: 没有断点时从第几行数据开始读取（不含表头）
+        
+        Returns:
+            (是否成功, 新增条数, 更新条数, 已处理的数据行数)
+        """
+        rows_done = start_row
+        byte_offset = None
+        total_stored = 0
+        total_updated = 0
+        total_quarantined = 0
+        try:
+            file_state = None
+            checkpoint = None
+            if resume:
+                file_state = self._file_state(file_path)
+                checkpoint = self._load_checkpoint(file_path, data_type, file_state)
+            else:
+                # 不使用断点时清除遗留的断点，避免之后的断续加载误用
+                self._clear_checkpoint(file_path)
+            if checkpoint:
+                rows_done = checkpoint['rows_done']
+                byte_offset = checkpoint['byte_offset']
+                total_stored = checkpoint['stored']
+                total_updated = checkpoint['updated']
+                total_quarantined = checkpoint.get('quarantined', 0)
+                logger.info(f"从断点继续加载文件 {file_path}，已处理 {rows_done} 行")
+            
+            elif rows_done:
+                # 没有断点时扫描定位到起始行，已处理的数据行不解析
+                byte_offset = csv_row_offset(file_path, rows_done)
+            
+            for chunk, chunk_end in iter_csv_chunks(file_path, chunk_size, byte_offset):
+                success, stored, updated = self.preprocess_and_store(chunk, data_type)
+                total_quarantined += self.last_quarantined_count
+                if not success:
+                    logger.error(f"文件 {file_path} 在第 {rows_done} 行之后的分块处理失败，已提交的分块保留，可从断点继续")
+                    return False, total_stored, total_updated, rows_done
+                
+                rows_done += len(chunk)
+                total_stored += stored
+                total_updated += updated
+                if resume:
+                    self._save_checkpoint(file_path, data_type, file_state, rows_done, chunk_end,
+                                          total_stored, total_updated, total_quarantined)
+                logger.info(f"文件 {file_path} 已处理 {rows_done} 行")
+            
+            self._clear_checkpoint(file_path)
+            logger.info(f"文件 {file_path} 流式加载完成，共 {rows_done} 行，新增: {total_stored}条，"
+                        f"更新: {total_updated}条，隔离: {total_quarantined}条")
+            return True, total_stored, total_updated, rows_done
+        except Exception as e:
+            logger.error(f"流式加载CSV文件失败: {e}")
+            return False, total_stored, total_updated, rows_done
+        finally:
+            self._call_state.quarantined = total_quarantined
+    
+    def ingest_csv_file(self, file_path, data_type='historical'):
+        """按文件入库清单增量加载CSV文件
+        
+        未变化的文件直接跳过，只在末尾追加了内容的文件只加载新增的行，其余情况加载整个文件。
+        起始行只由清单决定，不使用断点：分块加载中断的文件不会记入清单，下次从清单记录的行重新加载
+        （已提交分块中的历史数据键会被跳过，实时数据覆盖为相同值）。
+        有数据行被隔离时不记入清单，修正隔离的数据后再次加载会重新处理该文件。
+        未启用入库清单时等同于 load_historical_data_from_csv。
+        
+        Returns:
+            (是否成功, 新增条数, 更新条数)，被隔离的行数见 last_quarantined_count
+        """
+        if self.manifest is None:
+            return self.load_historical_data_from_csv(file_path, data_type)
+        
+        self._call_state.quarantined = 0
+        try:
+            plan = self.manifest.plan(file_path, data_type)
+            if plan['action'] == 'skip':
+                if plan.get('refresh'):
+                    self.manifest.record(file_path, data_type, plan, plan['start_row'])
+                logger.info(f"文件 {file_path} 未变化，跳过")
+                return True, 0, 0
+            
+            if plan['action'] == 'append':
+                logger.info(f"文件 {file_path} 有追加内容，从第 {plan['start_row']} 行开始加载")
+            
+            success, stored, updated, rows_done = self.stream_csv_to_database(
+                file_path, data_type, self.csv_chunk_size or None, resume=False, start_row=plan['start_row']
+            )
+            quarantined = self.last_quarantined_count
+            if success and quarantined:
+                logger.warning(f"文件 {file_path} 有 {quarantined} 条数据被隔离，不记入入库清单")
+            elif success:
+                self.manifest.record(file_path, data_type, plan, rows_done)
+            return success, stored, updated
+        except Exception as e:
+            logger.error(f"按入库清单加载CSV文件失败: {e}")
+            return False, 0, 0
+    
+    def bulk_load_historical_data(self, directory_path, data_type='historical', workers=None, queue_depth=None):
+        """批量加载目录下的所有CSV文件
+        
+        Args:
+            directory_path: CSV文件目录
+            data_type: 数据类型
+            workers: 并行预处理的进程数，为空时使用 LOADER_WORKERS 配置，大于1时启用并行加载
+            queue_depth: 并行加载时等待写入的结果队列深度
+        
+        Returns:
+            (是否成功, 新增条数, 更新条数)，被隔离的行数见 last_quarantined_count
+        """
+        total_quarantined = 0
         try:
             total_stored = 0
             total_updated = 0
             
+            csv_files = sorted(filename for filename in os.listdir(directory_path) if filename.endswith('.csv'))
+            
+            workers = workers or int(os.getenv('LOADER_WORKERS', 1))
+            if workers > 1:
+                from .parallel_loader import ParallelCSVLoader
+                loader = ParallelCSVLoader(self, workers=workers, queue_depth=queue_depth)
+                success, total_stored, total_updated, file_stats = loader.load_files(
+                    [(os.path.join(directory_path, filename), data_type) for filename in csv_files]
+                )
+                total_quarantined = sum(stat['quarantined'] for stat in file_stats)
+                return success, total_stored, total_updated
+            
             # 遍历目录下的所有CSV文件
-            for filename in os.listdir(directory_path):
-                if filename.endswith('.csv'):
-                    file_path = os.path.join(directory_path, filename)
-                    logger.info(f"开始处理文件: {filename}")
-                    success, stored, updated = self.load_historical_data_from_csv(file_path, data_type)
-                    if success:
-                        total_stored += stored
-                        total_updated += updated
-            
-            logger.info(f"批量加载完成，总共新增: {total_stored}条，更新: {total_updated}条")
+            for filename in csv_files:
+                file_path = os.path.join(directory_path, filename)
+                logger.info(f"开始处理文件: {filename}")
+                success, stored, updated = self.ingest_csv_file(file_path, data_type)
+                total_quarantined += self.last_quarantined_count
+                if success:
+                    total_stored += stored
+                    total_updated += updated
+            
+            logger.info(f"批量加载完成，总共新增: {total_stored}条，更新: {total_updated}条，隔离: {total_quarantined}条")
             return True, total_stored, total_updated
         except Exception as e:
             logger.error(f"批量加载历史数据失败: {e}")
             return False, 0, 0
+        finally:
+            self._call_state.quarantined = total_quarantined
     
     def close(self):
-        """关闭数据库连接"""
+        """写入缓冲中的清洗日志并关闭数据库连接"""
+        self.cleaning_log_sink.close()
         self.db_manager.close()
 
 if __name__ == "__main__":
@@ -316,7 +1033,7 @@ if __name__ == "__main__":
     success, stored, updated = storage.preprocess_and_store(df, data_type='historical')
     
     if success:
-        logger.info(f"示例数据存储成功，新增: {stored}条，更新: {updated}条")
+        logger.info(f"示例数据存储成功，新增: {stored}条，更新: {updated}条，隔离: {storage.last_quarantined_count}条")
     else:
         logger.error("示例数据存储失败")
     
@@ -1,11 +1,19 @@
 import os
 import logging
+from contextlib import contextmanager
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, DECIMAL, ForeignKey, Index, BigInteger, SmallInteger
+from sqlalchemy import inspect, select, text, insert, func, type_coerce, Column, Integer, String, Float, DateTime, Text, DECIMAL, ForeignKey, Index, BigInteger, SmallInteger
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.dialects.mysql import insert as mysql_insert, DATETIME as MYSQL_DATETIME
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from dotenv import load_dotenv
 
+from .db_backends import get_backend, replica_backends
+from .engine_registry import registry
+from .replica_router import ReplicaRouter
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -16,6 +24,118 @@ load_dotenv()
 # 创建基类
 Base = declarative_base()
 
+# 自增主键类型：SQLite只有 INTEGER PRIMARY KEY 才会自增，其他数据库使用BIGINT
+BigIntegerPK = BigInteger().with_variant(Integer, 'sqlite')
+
+# 气象指标的存储方式（DB_METRIC_STORAGE）：
+# - decimal: DECIMAL定点数（默认）
+# - float32: 4字节单精度浮点数
+# - scaled_int: 按小数位数放大后存为整数（如气温25.31存为2531），读取时再缩小
+METRIC_STORAGE = os.getenv('DB_METRIC_STORAGE', 'decimal').lower()
+
+# 气象指标字段：(DECIMAL总位数, 小数位数, 说明)
+WEATHER_METRICS = {
+    'temperature': (5, 2, '气温（°C）'),
+    'pressure': (6, 2, '气压（hPa）'),
+    'humidity': (5, 2, '湿度（%）'),
+    'precipitation': (6, 2, '降水量（mm）'),
+    'wind_speed': (5, 2, '风速（m/s）'),
+    'wind_direction': (5, 2, '风向（°）')
+}
+
+class ScaledInteger(TypeDecorator):
+    """按固定小数位数放大后以整数存储的数值类型"""
+    
+    impl = Integer
+    cache_ok = True
+    
+    def __init__(self, scale):
+        super().__init__()
+        self.scale = scale
+        self.factor = 10 ** scale
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or value != value:
+            return None
+        return int(round(float(value) * self.factor))
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return value / self.factor
+
+def metric_type(precision, scale, storage=None):
+    """按存储方式返回气象指标字段的列类型"""
+    storage = storage or METRIC_STORAGE
+    if storage == 'decimal':
+        return DECIMAL(precision, scale)
+    elif storage == 'float32':
+        return Float(precision=24)
+    elif storage == 'scaled_int':
+        return ScaledInteger(scale)
+    raise ValueError(f"不支持的指标存储方式: {storage}")
+
+def metric_column(name):
+    """创建气象指标字段"""
+    precision, scale, comment = WEATHER_METRICS[name]
+    return Column(metric_type(precision, scale), comment=comment)
+
+# 气象数据表的主键布局（DB_WEATHER_LAYOUT）：
+# - surrogate: 自增id主键 + (city_id, timestamp) 唯一索引（默认）
+# - clustered: (city_id, timestamp) 作为主键。InnoDB按主键聚簇存储数据，SQLite建为 WITHOUT ROWID 表，
+#   同一城市的时间范围查询顺序读取相邻的数据页，不再需要自增id和额外的唯一索引
+WEATHER_LAYOUT = os.getenv('DB_WEATHER_LAYOUT', 'surrogate').lower()
+if WEATHER_LAYOUT not in ('surrogate', 'clustered'):
+    raise ValueError(f"不支持的气象数据表布局: {WEATHER_LAYOUT}")
+CLUSTERED_LAYOUT = WEATHER_LAYOUT == 'clustered'
+
+# 是否为历史数据表建覆盖索引（DB_COVERING_INDEXES，默认关闭）：
+# 分析、看板和预警都按 城市 + 时间范围 读取整行指标，自增主键布局下 (city_id, timestamp) 唯一索引
+# 只能定位行，每行还要回表读取指标。覆盖索引在键之后附带查询用到的全部字段，范围查询只读索引，
+# 但它与唯一索引并存，相当于每行数据多存一份、每次写入多维护一个整行宽度的索引，因此只在读多写少时开启。
+# 聚簇主键布局下数据本身按 (city_id, timestamp) 存放，无需覆盖索引，是兼顾读写的首选方案
+COVERING_INDEXES = os.getenv('DB_COVERING_INDEXES', '0') == '1'
+
+# 覆盖索引附带的字段（get_historical_data 读取的字段）
+COVERING_COLUMNS = ['city_id', 'timestamp', 'source_id', *WEATHER_METRICS, 'status']
+
+def weather_table_args(unique_index_name, *indexes, covering_index_name=None):
+    """按主键布局返回气象数据表的索引和表参数
+    
+    Args:
+        unique_index_name: 自增主键布局下 (city_id, timestamp) 唯一索引的名称
+        indexes: 其他索引
+        covering_index_name: 城市+时间范围查询的覆盖索引名称，为空时不建
+    """
+    if CLUSTERED_LAYOUT:
+        return (*indexes, {'sqlite_with_rowid': False})
+    if covering_index_name and COVERING_INDEXES:
+        indexes = (*indexes, Index(covering_index_name, *COVERING_COLUMNS))
+    return (Index(unique_index_name, 'city_id', 'timestamp', unique=True), *indexes)
+
+def raw_metric_columns(model):
+    """查询气象指标时直接读取存储值的列表达式
+    
+    跳过 DECIMAL→Decimal 和 ScaledInteger 的逐值转换，结果交给 decode_metric_frame 整列转换。
+    """
+    columns = []
+    for name in WEATHER_METRICS:
+        column = getattr(model, name)
+        raw_type = Integer() if isinstance(column.type, ScaledInteger) else Float()
+        columns.append(type_coerce(column, raw_type).label(name))
+    return columns
+
+def decode_metric_frame(df, model):
+    """把 raw_metric_columns 读出的存储值整列转换为浮点数"""
+    for name in WEATHER_METRICS:
+        if name in df.columns:
+            values = df[name].astype('float64')
+            column_type = getattr(model, name).type
+            if isinstance(column_type, ScaledInteger):
+                values = values / column_type.factor
+            df[name] = values
+    return df
+
 # 城市表
 class City(Base):
     __tablename__ = 'cities'
@@ -59,16 +179,17 @@ class DataSource(Base):
 class RealTimeWeather(Base):
     __tablename__ = 'real_time_weather'
     
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    city_id = Column(Integer, ForeignKey('cities.city_id'), nullable=False, comment='城市ID')
+    if not CLUSTERED_LAYOUT:
+        id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
+    city_id = Column(Integer, ForeignKey('cities.city_id'), primary_key=CLUSTERED_LAYOUT, nullable=False, comment='城市ID')
     source_id = Column(Integer, ForeignKey('data_sources.source_id'), nullable=False, comment='数据源ID')
-    timestamp = Column(DateTime, nullable=False, comment='数据采集时间')
-    temperature = Column(DECIMAL(5, 2), comment='气温（°C）')
-    pressure = Column(DECIMAL(6, 2), comment='气压（hPa）')
-    humidity = Column(DECIMAL(5, 2), comment='湿度（%）')
-    precipitation = Column(DECIMAL(6, 2), comment='降水量（mm）')
-    wind_speed = Column(DECIMAL(5, 2), comment='风速（m/s）')
-    wind_direction = Column(DECIMAL(5, 2), comment='风向（°）')
+    timestamp = Column(DateTime, primary_key=CLUSTERED_LAYOUT, nullable=False, comment='数据采集时间')
+    temperature = metric_column('temperature')
+    pressure = metric_column('pressure')
+    humidity = metric_column('humidity')
+    precipitation = metric_column('precipitation')
+    wind_speed = metric_column('wind_speed')
+    wind_direction = metric_column('wind_direction')
     status = Column(SmallInteger, default=1, comment='数据状态（0:无效, 1:有效）')
     created_at = Column(DateTime, default=datetime.now, comment='创建时间')
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
@@ -78,27 +199,26 @@ class RealTimeWeather(Base):
     data_source = relationship('DataSource', back_populates='real_time_weathers')
     
     # 索引
-    __table_args__ = (
-        Index('idx_city_timestamp', 'city_id', 'timestamp', unique=True),
-    )
+    __table_args__ = weather_table_args('idx_city_timestamp')
     
     def __repr__(self):
-        return f"<RealTimeWeather(id={self.id}, city_id={self.city_id}, timestamp={self.timestamp})>"
+        return f"<RealTimeWeather(id={getattr(self, 'id', None)}, city_id={self.city_id}, timestamp={self.timestamp})>"
 
 # 历史数据表
 class HistoricalWeather(Base):
     __tablename__ = 'historical_weather'
     
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    city_id = Column(Integer, ForeignKey('cities.city_id'), nullable=False, comment='城市ID')
+    if not CLUSTERED_LAYOUT:
+        id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
+    city_id = Column(Integer, ForeignKey('cities.city_id'), primary_key=CLUSTERED_LAYOUT, nullable=False, comment='城市ID')
     source_id = Column(Integer, ForeignKey('data_sources.source_id'), nullable=False, comment='数据源ID')
-    timestamp = Column(DateTime, nullable=False, comment='数据采集时间')
-    temperature = Column(DECIMAL(5, 2), comment='气温（°C）')
-    pressure = Column(DECIMAL(6, 2), comment='气压（hPa）')
-    humidity = Column(DECIMAL(5, 2), comment='湿度（%）')
-    precipitation = Column(DECIMAL(6, 2), comment='降水量（mm）')
-    wind_speed = Column(DECIMAL(5, 2), comment='风速（m/s）')
-    wind_direction = Column(DECIMAL(5, 2), comment='风向（°）')
+    timestamp = Column(DateTime, primary_key=CLUSTERED_LAYOUT, nullable=False, comment='数据采集时间')
+    temperature = metric_column('temperature')
+    pressure = metric_column('pressure')
+    humidity = metric_column('humidity')
+    precipitation = metric_column('precipitation')
+    wind_speed = metric_column('wind_speed')
+    wind_direction = metric_column('wind_direction')
     status = Column(SmallInteger, default=1, comment='数据状态（0:无效, 1:有效）')
     created_at = Column(DateTime, default=datetime.now, comment='创建时间')
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
@@ -108,19 +228,17 @@ class HistoricalWeather(Base):
     data_source = relationship('DataSource', back_populates='historical_weathers')
     
     # 索引
-    __table_args__ = (
-        Index('idx_city_timestamp_hist', 'city_id', 'timestamp', unique=True),
-        Index('idx_timestamp_hist', 'timestamp'),
-    )
+    __table_args__ = weather_table_args('idx_city_timestamp_hist', Index('idx_timestamp_hist', 'timestamp'),
+                                        covering_index_name='idx_city_time_cover_hist')
     
     def __repr__(self):
-        return f"<HistoricalWeather(id={self.id}, city_id={self.city_id}, timestamp={self.timestamp})>"
+        return f"<HistoricalWeather(id={getattr(self, 'id', None)}, city_id={self.city_id}, timestamp={self.timestamp})>"
 
 # 极端事件数据表
 class ExtremeEvent(Base):
     __tablename__ = 'extreme_events'
     
-    event_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    event_id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     city_id = Column(Integer, ForeignKey('cities.city_id'), nullable=False, comment='城市ID')
     source_id = Column(Integer, ForeignKey('data_sources.source_id'), nullable=False, comment='数据源ID')
     event_type = Column(String(50), nullable=False, comment='事件类型（暴雨、高温、大风等）')
@@ -145,7 +263,7 @@ class ExtremeEvent(Base):
     
     # 索引
     __table_args__ = (
-        Index('idx_city_event', 'city_id', 'event_type', 'start_time'),
+        Index('uq_city_event_time', 'city_id', 'event_type', 'start_time', 'end_time', unique=True),
         Index('idx_event_time', 'start_time', 'end_time'),
     )
     
@@ -156,7 +274,7 @@ class ExtremeEvent(Base):
 class DataCleaningLog(Base):
     __tablename__ = 'data_cleaning_logs'
     
-    log_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    log_id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     process_time = Column(DateTime, nullable=False, comment='处理时间')
     data_source = Column(String(100), nullable=False, comment='数据源')
     field_name = Column(String(50), nullable=False, comment='字段名')
@@ -171,45 +289,100 @@ class DataCleaningLog(Base):
     def __repr__(self):
         return f"<DataCleaningLog(log_id={self.log_id}, process_time={self.process_time}, field_name='{self.field_name}')>"
 
+# 入库失败数据隔离表
+class QuarantinedRow(Base):
+    __tablename__ = 'quarantined_rows'
+    
+    quarantine_id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
+    target_table = Column(String(50), nullable=False, comment='目标表名')
+    payload = Column(Text, nullable=False, comment='数据行内容（JSON）')
+    reason = Column(Text, comment='写入失败原因')
+    created_at = Column(DateTime, default=datetime.now, comment='创建时间')
+    
+    # 索引
+    __table_args__ = (
+        Index('idx_quarantine_table_time', 'target_table', 'created_at'),
+    )
+    
+    def __repr__(self):
+        return f"<QuarantinedRow(quarantine_id={self.quarantine_id}, target_table='{self.target_table}')>"
+
+# 文件入库清单表
+class IngestManifest(Base):
+    __tablename__ = 'ingest_manifest'
+    
+    manifest_id = Column(Integer, primary_key=True, autoincrement=True)
+    file_path = Column(String(500), unique=True, nullable=False, comment='文件绝对路径')
+    data_type = Column(String(20), nullable=False, comment='数据类型（realtime/historical/extreme）')
+    file_size = Column(BigInteger, nullable=False, comment='已入库时的文件大小（字节）')
+    file_mtime_ns = Column(BigInteger, nullable=False, comment='已入库时的文件修改时间（纳秒）')
+    content_hash = Column(String(64), nullable=False, comment='已入库部分内容的SHA-256')
+    rows_consumed = Column(BigInteger, nullable=False, comment='已入库的数据行数（不含表头）')
+    created_at = Column(DateTime, default=datetime.now, comment='创建时间')
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
+    
+    def __repr__(self):
+        return f"<IngestManifest(file_path='{self.file_path}', rows_consumed={self.rows_consumed})>"
+
+# 气象指标汇总表（按城市、指标和时间粒度增量维护）
+class WeatherRollup(Base):
+    __tablename__ = 'weather_rollups'
+    
+    rollup_id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
+    city_id = Column(Integer, ForeignKey('cities.city_id'), nullable=False, comment='城市ID')
+    metric = Column(String(20), nullable=False, comment='指标名称')
+    grain = Column(String(10), nullable=False, comment='时间粒度（day/month）')
+    bucket_start = Column(DateTime, nullable=False, comment='时间段开始时间')
+    value_count = Column(Integer, nullable=False, comment='有效观测数')
+    value_sum = Column(Float(precision=53), nullable=False, comment='观测值之和')
+    value_sum_sq = Column(Float(precision=53), nullable=False, comment='观测值平方和')
+    value_min = Column(Float(precision=53), nullable=False, comment='最小值')
+    value_max = Column(Float(precision=53), nullable=False, comment='最大值')
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
+    
+    # 索引：读取时固定粒度和指标，按城市、时间段有序返回，无需额外排序
+    __table_args__ = (
+        Index('uq_rollup_metric_bucket', 'grain', 'metric', 'city_id', 'bucket_start', unique=True),
+    )
+    
+    def __repr__(self):
+        return f"<WeatherRollup(city_id={self.city_id}, metric='{self.metric}', grain='{self.grain}', bucket_start={self.bucket_start})>"
+
+# 复制心跳表：写入方提交数据后在主库更新心跳时间，副本同步到的心跳时间用于计算复制延迟
+class ReplicationHeartbeat(Base):
+    __tablename__ = 'replication_heartbeat'
+    
+    heartbeat_id = Column(Integer, primary_key=True, autoincrement=False, comment='心跳ID（固定为1）')
+    beat_at = Column(DateTime().with_variant(MYSQL_DATETIME(fsp=6), 'mysql'), nullable=False, comment='心跳时间')
+    
+    def __repr__(self):
+        return f"<ReplicationHeartbeat(beat_at={self.beat_at})>"
+
 class DatabaseManager:
-    def __init__(self):
-        # 从环境变量获取数据库连接信息
-        self.db_host = os.getenv('DB_HOST', 'localhost')
-        self.db_port = os.getenv('DB_PORT', '3306')
-        self.db_name = os.getenv('DB_NAME', 'weather_data')
-        self.db_user = os.getenv('DB_USER', 'root')
-        self.db_password = os.getenv('DB_PASSWORD', '')
+    def __init__(self, backend=None, replicas=None):
+        # 数据库后端（DB_BACKEND: mysql / sqlite），连接信息从环境变量获取
+        self.backend = backend or get_backend()
         
-        # 构建数据库连接URL
-        self.db_url = f"mysql+pymysql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}?charset=utf8mb4"
+        # 数据库连接URL
+        self.db_url = self.backend.url
         
-        # 创建数据库引擎
-        self.engine = create_engine(self.db_url, echo=False)
+        # 从进程内共享的引擎注册表获取数据库引擎，同一数据库共用一个连接池
+        self.engine = registry.acquire(self.backend)
         
         # 创建会话工厂
         self.Session = sessionmaker(bind=self.engine)
+        
+        # 只读副本（DB_REPLICA_URLS），分析类读取通过 get_read_session 分配到副本
+        replicas = replica_backends() if replicas is None else replicas
+        self.replicas = ReplicaRouter(
+            self.engine, replicas,
+            select(ReplicationHeartbeat.beat_at).where(ReplicationHeartbeat.heartbeat_id == 1)
+        ) if replicas else None
     
     def create_database(self):
         """创建数据库（如果不存在）"""
         try:
-            # 创建临时引擎，不指定数据库
-            temp_url = f"mysql+pymysql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}?charset=utf8mb4"
-            temp_engine = create_engine(temp_url, echo=False)
-            
-            from sqlalchemy import text
-            
-            with temp_engine.connect() as conn:
-                # 检查数据库是否存在
-                result = conn.execute(text(f"SHOW DATABASES LIKE '{self.db_name}'"))
-                if not result.fetchone():
-                    # 创建数据库
-                    conn.execute(text(f"CREATE DATABASE {self.db_name} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"))
-                    logger.info(f"数据库 {self.db_name} 创建成功")
-                else:
-                    logger.info(f"数据库 {self.db_name} 已存在")
-            
-            # 关闭临时引擎
-            temp_engine.dispose()
+            self.backend.create_database()
             return True
         except Exception as e:
             logger.error(f"创建数据库失败: {e}")
@@ -235,36 +408,89 @@ class DatabaseManager:
             # 创建表
             self.create_tables()
             
+            # 为已有的极端事件表补建唯一事件键
+            self.ensure_extreme_event_key()
+            
             # 初始化基础数据
             self.init_base_data()
             
+            # 汇总表缺少已有的历史数据（如启用汇总前入库的数据）时按城市重建
+            if os.getenv('WEATHER_ROLLUPS', '1') == '1':
+                self.ensure_rollups()
+            
             logger.info("数据库初始化完成")
             return True
         except Exception as e:
             logger.error(f"初始化数据库失败: {e}")
             return False
     
-    def init_base_data(self):
-        """初始化基础数据，如城市、数据源等"""
+    def ensure_extreme_event_key(self):
+        """确保极端事件表存在 (city_id, event_type, start_time, end_time) 唯一索引
+        
+        旧版本建表时只有非唯一的 idx_city_event 索引，这里先清理重复事件（保留event_id最小的一条），
+        再创建唯一索引并删除被其覆盖的旧索引。
+        """
         try:
-            session = self.Session()
+            index_names = {index['name'] for index in inspect(self.engine).get_indexes(ExtremeEvent.__tablename__)}
+            if 'uq_city_event_time' in index_names:
+                return True
+            
+            with self.engine.begin() as conn:
+                # 删除重复事件，派生表包装是为了兼容MySQL不允许在子查询中引用被删除表的限制
+                result = conn.execute(text(
+                    "DELETE FROM extreme_events WHERE event_id NOT IN ("
+                    "SELECT keep_id FROM (SELECT MIN(event_id) AS keep_id FROM extreme_events "
+                    "GROUP BY city_id, event_type, start_time, end_time) AS keep_events)"
+                ))
+                if result.rowcount:
+                    logger.info(f"清理重复极端事件: {result.rowcount}条")
+                
+                unique_index = next(index for index in ExtremeEvent.__table__.indexes if index.name == 'uq_city_event_time')
+                unique_index.create(conn)
+                
+                # 旧索引已不在模型中，直接执行DDL删除（不能构造Index对象，否则会挂到模型的表定义上）
+                if 'idx_city_event' in index_names:
+                    if self.engine.dialect.name == 'mysql':
+                        conn.execute(text("DROP INDEX idx_city_event ON extreme_events"))
+                    else:
+                        conn.execute(text("DROP INDEX idx_city_event"))
             
+            logger.info("极端事件唯一事件键创建完成")
+            return True
+        except Exception as e:
+            logger.error(f"创建极端事件唯一事件键失败: {e}")
+            return False
+    
+    def ensure_rollups(self):
+        """确保汇总表覆盖历史数据表中的全部观测，不一致的城市由历史数据重建
+        
+        Returns:
+            重建的城市ID列表，检查失败时返回None
+        """
+        # 汇总模块依赖本模块的模型，在此导入避免循环导入
+        from .weather_rollups import WeatherRollupManager
+        
+        try:
+            return WeatherRollupManager(self).ensure_complete()
+        except Exception as e:
+            logger.error(f"检查汇总表完整性失败: {e}")
+            return None
+    
+    def init_base_data(self, catalog_path=None):
+        """初始化基础数据：城市从站点目录批量写入，数据源按名称补齐
+        
+        Args:
+            catalog_path: 站点目录文件，默认为 STATION_CATALOG_PATH
+        """
+        # 站点目录模块依赖本模块的模型，在此导入避免循环导入
+        from .city_catalog import load_catalog, read_catalog
+        
+        session = None
+        try:
             # 初始化城市数据
-            cities_data = [
-                {'city_name': 'beijing', 'city_code': 'BJ', 'latitude': 39.9042, 'longitude': 116.4074},
-                {'city_name': 'shanghai', 'city_code': 'SH', 'latitude': 31.2304, 'longitude': 121.4737},
-                {'city_name': 'guangzhou', 'city_code': 'GZ', 'latitude': 23.1291, 'longitude': 113.2644},
-                {'city_name': 'shenzhen', 'city_code': 'SZ', 'latitude': 22.5431, 'longitude': 114.0579},
-                {'city_name': 'chengdu', 'city_code': 'CD', 'latitude': 30.5728, 'longitude': 104.0668}
-            ]
+            load_catalog(self, read_catalog(catalog_path))
             
-            for city_data in cities_data:
-                # 检查城市是否已存在
-                existing_city = session.query(City).filter_by(city_name=city_data['city_name']).first()
-                if not existing_city:
-                    city = City(**city_data)
-                    session.add(city)
-                    logger.info(f"添加城市: {city_data['city_name']}")
+            session = self.Session()
             
             # 初始化数据源数据
             data_sources_data = [
@@ -273,33 +499,165 @@ class DatabaseManager:
                 {'source_name': 'Kaggle', 'source_code': 'KG', 'description': '极端天气数据集'}
             ]
             
+            # 一次查询已有的数据源
+            existing_sources = set(session.execute(select(DataSource.source_name)).scalars())
             for source_data in data_sources_data:
-                # 检查数据源是否已存在
-                existing_source = session.query(DataSource).filter_by(source_name=source_data['source_name']).first()
-                if not existing_source:
-                    data_source = DataSource(**source_data)
-                    session.add(data_source)
+                if source_data['source_name'] not in existing_sources:
+                    session.add(DataSource(**source_data))
                     logger.info(f"添加数据源: {source_data['source_name']}")
             
             # 提交事务
             session.commit()
-            session.close()
             
             logger.info("基础数据初始化完成")
             return True
         except Exception as e:
             logger.error(f"初始化基础数据失败: {e}")
-            session.rollback()
-            session.close()
+            if session:
+                session.rollback()
             return False
+        finally:
+            if session:
+                session.close()
     
     def get_session(self):
-        """获取数据库会话"""
+        """获取数据库会话（主库，用于写入和需要读到最新数据的查询）"""
         return self.Session()
     
+    @contextmanager
+    def session_scope(self, read_only=False, max_lag=None):
+        """在一个事务范围内使用的会话：正常结束时提交，出错时回滚，最后总是关闭
+        
+        每次进入都创建独立的会话（连接从线程安全的连接池借出，关闭时归还），会话不在线程之间共享，
+        多个线程（如 Dash/Flask 的并发回调）可以同时使用同一个 DatabaseManager。
+        
+        Args:
+            read_only: 只读查询（使用只读副本，结束时不提交）
+            max_lag: 只读查询允许的最大副本延迟（秒）
+        """
+        session = self.get_read_session(max_lag) if read_only else self.get_session()
+        try:
+            yield session
+            if not read_only:
+                session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    
+    def read_engine(self, max_lag=None):
+        """读取使用的引擎：配置了只读副本时选择可用的副本，否则为主库
+        
+        Args:
+            max_lag: 允许的最大副本延迟（秒），为空时不检查延迟
+        """
+        if self.replicas is None:
+            return self.engine
+        return self.replicas.read_engine(max_lag)
+    
+    def get_read_session(self, max_lag=None):
+        """获取只读查询的数据库会话（分析、看板等读取）"""
+        return self.Session(bind=self.read_engine(max_lag))
+    
+    def replica_status(self):
+        """只读副本的可用状态和复制延迟"""
+        return self.replicas.status() if self.replicas is not None else []
+    
+    def write_heartbeat(self):
+        """在主库更新心跳时间"""
+        stmt = self.upsert_statement(ReplicationHeartbeat, ['heartbeat_id'], ['beat_at'])
+        with self.engine.begin() as conn:
+            conn.execute(stmt, {'heartbeat_id': 1, 'beat_at': datetime.now()})
+    
+    def upsert_statement(self, model, index_elements, update_columns):
+        """构建批量upsert语句，按数据库方言使用原生冲突子句
+        
+        Args:
+            model: ORM模型类
+            index_elements: 冲突判定所用的唯一键字段
+            update_columns: 冲突时需要更新的字段
+        
+        Returns:
+            可配合 executemany 参数列表执行的 insert 语句
+        """
+        table = model.__table__
+        dialect = self.engine.dialect.name
+        
+        if dialect == 'mysql':
+            # MySQL: INSERT ... ON DUPLICATE KEY UPDATE
+            stmt = mysql_insert(table)
+            return stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_columns})
+        elif dialect == 'sqlite':
+            # SQLite: INSERT ... ON CONFLICT (...) DO UPDATE
+            stmt = sqlite_insert(table)
+            return stmt.on_conflict_do_update(
+                index_elements=index_elements,
+                set_={column: stmt.excluded[column] for column in update_columns}
+            )
+        
+        raise ValueError(f"不支持的数据库方言: {dialect}")
+    
+    def accumulate_statement(self, model, index_elements, sum_columns, min_columns=(), max_columns=(), set_columns=()):
+        """构建批量累加语句：键不存在时插入，存在时在原值上累加/取最值
+        
+        Args:
+            model: ORM模型类
+            index_elements: 冲突判定所用的唯一键字段
+            sum_columns: 冲突时与原值相加的字段
+            min_columns: 冲突时取较小值的字段
+            max_columns: 冲突时取较大值的字段
+            set_columns: 冲突时直接覆盖的字段
+        """
+        table = model.__table__
+        dialect = self.engine.dialect.name
+        
+        if dialect == 'mysql':
+            # MySQL: ON DUPLICATE KEY UPDATE col = col + VALUES(col)
+            stmt = mysql_insert(table)
+            new_values = stmt.inserted
+            least, greatest = func.least, func.greatest
+        elif dialect == 'sqlite':
+            # SQLite: ON CONFLICT DO UPDATE SET col = col + excluded.col，多参数的 min/max 为标量函数
+            stmt = sqlite_insert(table)
+            new_values = stmt.excluded
+            least, greatest = func.min, func.max
+        else:
+            raise ValueError(f"不支持的数据库方言: {dialect}")
+        
+        updates = {column: table.c[column] + new_values[column] for column in sum_columns}
+        updates.update({column: least(table.c[column], new_values[column]) for column in min_columns})
+        updates.update({column: greatest(table.c[column], new_values[column]) for column in max_columns})
+        updates.update({column: new_values[column] for column in set_columns})
+        
+        if dialect == 'mysql':
+            return stmt.on_duplicate_key_update(updates)
+        return stmt.on_conflict_do_update(index_elements=index_elements, set_=updates)
+    
+    def insert_ignore_statement(self, model):
+        """构建批量插入语句，唯一键冲突的行直接跳过
+        
+        MySQL使用 ON DUPLICATE KEY UPDATE 把主键赋值为自身（INSERT IGNORE 会把外键、非空、取值范围等错误
+        也降级为警告而静默丢弃数据），SQLite使用 ON CONFLICT DO NOTHING，其他错误照常抛出。
+        MySQL下重复键也会计入 rowcount，新增条数需另行统计。
+        """
+        table = model.__table__
+        dialect = self.engine.dialect.name
+        
+        if dialect == 'mysql':
+            stmt = mysql_insert(table)
+            primary_key = table.primary_key.columns.values()[0]
+            return stmt.on_duplicate_key_update({primary_key.name: primary_key})
+        elif dialect == 'sqlite':
+            return sqlite_insert(table).on_conflict_do_nothing()
+        
+        raise ValueError(f"不支持的数据库方言: {dialect}")
+    
     def close(self):
-        """关闭数据库连接"""
-        self.engine.dispose()
+        """关闭数据库连接（共享引擎在最后一个使用者关闭时释放）"""
+        if self.replicas is not None:
+            self.replicas.close()
+        registry.release(self.engine)
         logger.info("数据库连接已关闭")
 
 if __name__ == "__main__":
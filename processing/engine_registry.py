@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+import threading
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class TimedQueuePool(QueuePool):
+    """记录连接获取等待时间的连接池
+    
+    在公开的 connect()（Engine.connect 和会话获取连接都经由它从池中取连接）外计时，
+    等待时间包括排队等待空闲连接、新建溢出连接以及 pool_pre_ping 的检测。
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.checkout_count = 0
+        self.timeout_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+    
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            with self.stats_lock:
+                self.timeout_count += 1
+            raise
+        
+        wait = time.perf_counter() - start
+        with self.stats_lock:
+            self.checkout_count += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        return connection
+    
+    def metrics(self):
+        """连接池当前状态和累计的获取等待统计"""
+        with self.stats_lock:
+            return {
+                'pool_size': self.size(),
+                'checked_out': self.checkedout(),
+                'checked_in': self.checkedin(),
+                'overflow': self.overflow(),
+                'max_overflow': self._max_overflow,
+                'checkouts': self.checkout_count,
+                'timeouts': self.timeout_count,
+                'avg_wait_ms': round(self.total_wait / self.checkout_count * 1000, 3) if self.checkout_count else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3)
+            }
+
+def pool_options():
+    """从环境变量读取连接池参数"""
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 3600)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1'
+    }
+
+class EngineRegistry:
+    """进程内共享的数据库引擎注册表
+    
+    同一连接URL在进程内只创建一个引擎（及连接池），各个 DatabaseManager 共享；
+    按引用计数释放，最后一个使用者关闭时才释放连接池。
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.engines = {}
+    
+    def acquire(self, backend):
+        """获取（必要时创建）后端对应的共享引擎"""
+        url = backend.url
+        with self.lock:
+            entry = self.engines.get(url)
+            if entry is None:
+                entry = {'engine': backend.create_engine(**pool_options()), 'refcount': 0}
+                self.engines[url] = entry
+                logger.info(f"创建共享数据库引擎: {entry['engine'].url.render_as_string(hide_password=True)}")
+            entry['refcount'] += 1
+            return entry['engine']
+    
+    def release(self, engine):
+        """释放一次引擎引用，没有使用者时关闭连接池"""
+        with self.lock:
+            for url, entry in list(self.engines.items()):
+                if entry['engine'] is engine:
+                    entry['refcount'] -= 1
+                    if entry['refcount'] <= 0:
+                        del self.engines[url]
+                        engine.dispose()
+                    return
+        # 不是由注册表创建的引擎直接关闭
+        engine.dispose()
+    
+    def metrics(self):
+        """各共享引擎的连接池指标"""
+        with self.lock:
+            entries = list(self.engines.values())
+        
+        result = []
+        for entry in entries:
+            engine = entry['engine']
+            pool = engine.pool
+            metrics = pool.metrics() if isinstance(pool, TimedQueuePool) else {'status': pool.status()}
+            metrics['url'] = engine.url.render_as_string(hide_password=True)
+            metrics['users'] = entry['refcount']
+            result.append(metrics)
+        return result
+
+# 进程内唯一的注册表
+registry = EngineRegistry()
@@ -0,0 +1,185 @@
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+from .data_storage import WeatherDataStorage
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 极端事件识别规则（阈值与 WeatherDataAnalyzer.identify_extreme_events 一致）
+# level_step: 峰值每超出阈值一个步长，事件等级加1（1-5级）
+EXTREME_EVENT_RULES = {
+    '高温': {'metric': 'temperature', 'threshold': 35, 'operator': '>', 'level_step': 2},
+    '低温': {'metric': 'temperature', 'threshold': -10, 'operator': '<', 'level_step': 5},
+    '暴雨': {'metric': 'precipitation', 'threshold': 50, 'operator': '>', 'level_step': 25},
+    '大风': {'metric': 'wind_speed', 'threshold': 20, 'operator': '>', 'level_step': 5},
+    '高湿': {'metric': 'humidity', 'threshold': 95, 'operator': '>', 'level_step': 1},
+    '干燥': {'metric': 'humidity', 'threshold': 20, 'operator': '<', 'level_step': 4}
+}
+
+# 事件聚合字段：(输出字段, 源字段, 聚合函数)
+EVENT_AGGREGATIONS = [
+    ('max_temperature', 'temperature', 'max'),
+    ('min_temperature', 'temperature', 'min'),
+    ('max_pressure', 'pressure', 'max'),
+    ('min_pressure', 'pressure', 'min'),
+    ('max_humidity', 'humidity', 'max'),
+    ('max_precipitation', 'precipitation', 'max'),
+    ('max_wind_speed', 'wind_speed', 'max')
+]
+
+class ExtremeEventLoader:
+    """把Kaggle极端天气逐条观测数据合并为极端事件并批量入库
+    
+    同一城市中连续满足某条规则、且相邻观测间隔不超过最大间隔的观测合并为一个事件。
+    事件划分通过向量化的游程检测完成（条件变化或城市变化处标记新事件，累加得到事件编号），
+    各事件的起止时间和最值在一次 groupby 中算出，再通过 store_extreme_events 批量写入。
+    """
+    
+    def __init__(self, storage=None, max_gap_hours=None):
+        self.storage = storage or WeatherDataStorage()
+        self.max_gap = pd.Timedelta(hours=max_gap_hours or float(os.getenv('EXTREME_EVENT_MAX_GAP_HOURS', 24)))
+    
+    def _prepare(self, df):
+        """补齐城市ID和数据源ID，并按城市、时间排序"""
+        df = df.copy()
+        if 'city_id' not in df.columns or 'source_id' not in df.columns:
+            encoded = self.storage.preprocessor.encode_categorical(df)
+            for column in ('city_id', 'source_id'):
+                if column not in df.columns and column in encoded.columns:
+                    df[column] = encoded[column]
+        if 'source_id' not in df.columns:
+            df['source_id'] = np.nan
+        # Kaggle数据集的数据源ID
+        df['source_id'] = df['source_id'].fillna(3)
+        
+        if 'city_id' not in df.columns:
+            # 没有 city 列或城市编码失败时无法确定城市
+            raise ValueError("观测数据缺少城市信息，无法确定城市ID")
+        
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        missing_city = df['city_id'].isna()
+        if missing_city.any():
+            logger.warning(f"{int(missing_city.sum())} 条观测的城市不在支持列表中，已忽略")
+            df = df[~missing_city]
+        
+        return df.sort_values(['city_id', 'timestamp'], kind='stable').reset_index(drop=True)
+    
+    def build_events(self, df):
+        """识别极端事件
+        
+        Args:
+            df: 逐条观测数据（包含 timestamp、city 或 city_id 以及各气象指标）
+        
+        Returns:
+            DataFrame，字段与 extreme_events 表一致
+        """
+        df = self._prepare(df)
+        if df.empty:
+            return pd.DataFrame()
+        
+        same_city = df['city_id'].eq(df['city_id'].shift())
+        within_gap = df['timestamp'].diff() <= self.max_gap
+        events = []
+        
+        for event_type, rule in EXTREME_EVENT_RULES.items():
+            metric = rule['metric']
+            if metric not in df.columns:
+                continue
+            
+            values = df[metric]
+            flag = values > rule['threshold'] if rule['operator'] == '>' else values < rule['threshold']
+            if not flag.any():
+                continue
+            
+            # 游程检测：满足条件且与上一条观测不属于同一连续区间时开始新事件
+            continues = flag.shift(fill_value=False) & same_city & within_gap
+            run_id = (flag & ~continues).cumsum()
+            
+            hits = df[flag].assign(run_id=run_id[flag])
+            aggregations = {
+                'city_id': ('city_id', 'first'),
+                'source_id': ('source_id', 'first'),
+                'start_time': ('timestamp', 'min'),
+                'end_time': ('timestamp', 'max'),
+                'observation_count': ('timestamp', 'size'),
+                'peak': (metric, 'max' if rule['operator'] == '>' else 'min')
+            }
+            for output, source, func in EVENT_AGGREGATIONS:
+                if source in hits.columns:
+                    aggregations[output] = (source, func)
+            grouped = hits.groupby('run_id').agg(**aggregations).reset_index(drop=True)
+            
+            # 事件等级：峰值超出阈值的程度，按步长划分为1-5级
+            excess = (grouped['peak'] - rule['threshold']).abs()
+            grouped['event_level'] = (1 + excess // rule['level_step']).clip(1, 5).astype(int)
+            grouped['event_type'] = event_type
+            grouped['description'] = (
+                event_type + '事件，' + grouped['observation_count'].astype(str) + '条观测，'
+                + metric + '峰值' + grouped['peak'].round(2).astype(str)
+            )
+            events.append(grouped.drop(columns=['observation_count', 'peak']))
+        
+        if not events:
+            return pd.DataFrame()
+        
+        result = pd.concat(events, ignore_index=True)
+        result['city_id'] = result['city_id'].astype(int)
+        result['source_id'] = result['source_id'].astype(int)
+        return result
+    
+    def load_dataframe(self, df):
+        """识别并存储一批观测数据中的极端事件
+        
+        Returns:
+            (是否成功, 新增事件数)
+        """
+        start = time.perf_counter()
+        try:
+            events = self.build_events(df)
+        except Exception as e:
+            logger.error(f"识别极端事件失败: {e}")
+            return False, 0
+        if events.empty:
+            logger.info("未识别到极端事件")
+            return True, 0
+        
+        success, stored = self.storage.store_extreme_events(events)
+        logger.info(f"从 {len(df)} 条观测中识别出 {len(events)} 个极端事件，新增: {stored}个，"
+                    f"隔离: {self.storage.last_quarantined_count}个，"
+                    f"耗时 {time.perf_counter() - start:.2f}s")
+        return success, stored
+    
+    def load_directory(self, input_path='./data/processed'):
+        """加载 process_kaggle_dataset 生成的极端天气数据文件
+        
+        Returns:
+            (是否全部成功, 新增事件数)
+        """
+        if not os.path.exists(input_path):
+            logger.warning(f"数据目录不存在: {input_path}")
+            return True, 0
+        
+        all_success = True
+        total_stored = 0
+        for filename in sorted(os.listdir(input_path)):
+            if filename.endswith('.csv') and 'extreme' in filename.lower():
+                logger.info(f"从 {filename} 构建极端事件")
+                try:
+                    df = pd.read_csv(os.path.join(input_path, filename))
+                except Exception as e:
+                    logger.error(f"读取 {filename} 失败: {e}")
+                    all_success = False
+                    continue
+                success, stored = self.load_dataframe(df)
+                all_success = all_success and success
+                total_stored += stored
+        return all_success, total_stored
+    
+    def close(self):
+        """关闭存储连接"""
+        self.storage.close()
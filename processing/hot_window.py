@@ -0,0 +1,332 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+from .database_manager import HistoricalWeather, WEATHER_METRICS, METRIC_STORAGE
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 是否开启热数据窗口（默认关闭）：窗口由读取数据的进程（看板、预警服务）持有，读到的观测最多比数据库
+# 晚 HOT_WINDOW_REFRESH_SECONDS 秒，开启前应确认这些读取可以接受该延迟
+HOT_WINDOW_ENABLED = os.getenv('HOT_WINDOW', '0') == '1'
+
+# 城市缓冲区从数据库重新加载的间隔（秒）：其他进程写入的观测只能通过重新加载进入窗口。
+# 为0时不重新加载（只有本进程写入该数据库时使用）
+HOT_WINDOW_REFRESH_SECONDS = float(os.getenv('HOT_WINDOW_REFRESH_SECONDS', 60))
+
+# 热数据窗口保留的时长（小时，相对于每个城市最新的观测），为0时关闭
+HOT_WINDOW_HOURS = float(os.getenv('HOT_WINDOW_HOURS', 24))
+
+# 每个城市最多保留的观测条数（默认可容纳24小时的逐分钟观测）
+HOT_WINDOW_CAPACITY = int(os.getenv('HOT_WINDOW_CAPACITY', 1440))
+
+# 热数据窗口保存的指标及小数位数
+HOT_METRICS = list(WEATHER_METRICS)
+METRIC_SCALES = np.array([WEATHER_METRICS[metric][1] for metric in HOT_METRICS])
+
+def window_statistics(values):
+    """按列计算观测的统计值（热数据窗口和数据库查询结果共用，空值不参与计算）
+    
+    Args:
+        values: 形状为 (观测数, 指标数) 的数组，列顺序与 HOT_METRICS 一致
+    
+    Returns:
+        以指标为索引的DataFrame，字段为 count/mean/min/max/std（标准差为样本标准差）
+    """
+    # 每个指标一行连续存放再按行求和，累加顺序与输入数组的内存布局无关
+    values = np.ascontiguousarray(np.asarray(values, dtype='float64').reshape(-1, len(HOT_METRICS)).T)
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, values, 0).sum(axis=1) / count
+        deviation = np.where(valid, values - mean[:, None], 0)
+        std = np.sqrt((deviation ** 2).sum(axis=1) / (count - 1))
+    empty = count == 0
+    return pd.DataFrame({
+        'count': count,
+        'mean': mean,
+        'min': np.where(empty, np.nan, np.fmin.reduce(values, axis=1, initial=np.inf)),
+        'max': np.where(empty, np.nan, np.fmax.reduce(values, axis=1, initial=-np.inf)),
+        'std': np.where(count > 1, std, np.nan)
+    }, index=pd.Index(HOT_METRICS, name='metric'))
+
+class CityRingBuffer:
+    """单个城市最近观测的环形缓冲区
+    
+    时间（纳秒）、数据源和各指标分别保存在数组中，按时间递增排列；容量按需倍增，达到上限后新观测覆盖最早的观测。
+    covered_from 之后的观测都在缓冲区中（为首次写入的时间，之后随覆盖和过期向后移动）。
+    """
+    
+    def __init__(self, capacity, initial_size=64):
+        self.capacity = capacity
+        self._allocate(min(initial_size, capacity))
+        self.head = 0
+        self.size = 0
+        self.covered_from = None
+        # 缓冲区开始反映数据库内容的时间（time.monotonic），超过刷新间隔后重新从数据库加载
+        self.loaded_at = time.monotonic()
+    
+    def _allocate(self, size):
+        self.timestamps = np.empty(size, dtype='int64')
+        self.source_ids = np.empty(size, dtype='int64')
+        self.values = np.empty((size, len(HOT_METRICS)), dtype='float64')
+    
+    def ordered(self):
+        """按时间顺序返回 (时间, 数据源, 指标) 的副本"""
+        positions = (self.head + np.arange(self.size)) % len(self.timestamps)
+        return self.timestamps[positions], self.source_ids[positions], self.values[positions]
+    
+    def _rewrite(self, timestamps, source_ids, values):
+        """用按时间递增的数据重写缓冲区，超出容量时只保留最新的观测"""
+        timestamps, source_ids, values = timestamps[-self.capacity:], source_ids[-self.capacity:], values[-self.capacity:]
+        if len(timestamps) > len(self.timestamps):
+            self._allocate(min(self.capacity, max(len(timestamps), 2 * len(self.timestamps))))
+        size = len(timestamps)
+        self.timestamps[:size] = timestamps
+        self.source_ids[:size] = source_ids
+        self.values[:size] = values
+        self.head = 0
+        self.size = size
+    
+    def append(self, timestamps, source_ids, values, window_ns):
+        """写入一批按时间递增、时间不重复的观测，并移除早于 (最新时间 - window_ns) 的观测"""
+        if self.covered_from is None:
+            self.covered_from = int(timestamps[0])
+        
+        if self.size and timestamps[0] <= self.timestamps[(self.head + self.size - 1) % len(self.timestamps)]:
+            # 迟到或覆盖已有时间的数据（如实时数据upsert）：与现有数据合并，同一时间以新数据为准，
+            # 早于覆盖起点的观测不保存（缓冲区不完整的时间段只能查询数据库）
+            current = self.ordered()
+            merged_timestamps = np.concatenate([current[0], timestamps])
+            order = np.argsort(merged_timestamps, kind='stable')
+            merged_timestamps = merged_timestamps[order]
+            keep = np.append(merged_timestamps[1:] != merged_timestamps[:-1], True) & (merged_timestamps >= self.covered_from)
+            self._rewrite(merged_timestamps[keep], np.concatenate([current[1], source_ids])[order][keep],
+                          np.concatenate([current[2], values])[order][keep])
+        elif self.size + len(timestamps) > len(self.timestamps) and len(self.timestamps) < self.capacity:
+            # 空间不足且未达到容量上限：扩容后重写
+            current = self.ordered()
+            self._rewrite(np.concatenate([current[0], timestamps]), np.concatenate([current[1], source_ids]),
+                          np.concatenate([current[2], values]))
+        else:
+            count = min(len(timestamps), len(self.timestamps))
+            positions = (self.head + self.size + np.arange(len(timestamps) - count, len(timestamps))) % len(self.timestamps)
+            self.timestamps[positions] = timestamps[-count:]
+            self.source_ids[positions] = source_ids[-count:]
+            self.values[positions] = values[-count:]
+            overwritten = max(self.size + len(timestamps) - len(self.timestamps), 0)
+            self.head = (self.head + overwritten) % len(self.timestamps)
+            self.size = min(self.size + len(timestamps), len(self.timestamps))
+        
+        self._expire(window_ns)
+    
+    def load(self, timestamps, source_ids, values, covered_from, window_ns):
+        """用从数据库读取的观测重写缓冲区（covered_from 之后的观测都已包含在内）"""
+        self.head = 0
+        self.size = 0
+        self.covered_from = covered_from
+        self.loaded_at = time.monotonic()
+        if len(timestamps):
+            self._rewrite(timestamps, source_ids, values)
+            self._expire(window_ns)
+    
+    def _expire(self, window_ns):
+        """移除早于 (最新时间 - window_ns) 的观测，并相应推后覆盖起点"""
+        ordered_timestamps = self.ordered()[0]
+        if self.size == self.capacity:
+            # 缓冲区已满时更早的观测可能已被覆盖
+            self.covered_from = max(self.covered_from, int(ordered_timestamps[0]))
+        
+        # 移除超出时间窗口的观测
+        cutoff = int(ordered_timestamps[-1]) - window_ns
+        expired = int(np.searchsorted(ordered_timestamps, cutoff))
+        self.head = (self.head + expired) % len(self.timestamps)
+        self.size -= expired
+        self.covered_from = max(self.covered_from, cutoff)
+    
+    def discard_before(self, timestamp_ns):
+        """移除早于指定时间的观测（对应数据库中已删除的数据，覆盖起点不变）"""
+        expired = int(np.searchsorted(self.ordered()[0], timestamp_ns))
+        self.head = (self.head + expired) % len(self.timestamps)
+        self.size -= expired
+
+class HotWindow:
+    """按城市保存最近观测的进程内热数据窗口（一个数据表一个实例）
+    
+    窗口属于读取数据的进程（看板、预警服务）：读取方未命中时用数据库查询结果预热该城市的缓冲区（prime），
+    同一进程中 WeatherDataStorage 提交的观测由提交监听器在每个分块提交后写入。每个城市保留最新观测之前
+    HOT_WINDOW_HOURS 小时（默认24）、最多 HOT_WINDOW_CAPACITY 条（默认1440）的观测。最新值、最近若干小时的
+    数据和统计值可以直接从内存读取；请求的时间范围早于缓冲区的覆盖起点（窗口未预热），或缓冲区距上次从数据库
+    加载已超过 HOT_WINDOW_REFRESH_SECONDS 秒（其他进程写入的观测尚未加载）时返回None，由调用方查询数据库。
+    """
+    
+    def __init__(self, hours=None, capacity=None, round_values=True, refresh_seconds=None):
+        """
+        Args:
+            hours: 每个城市保留的时长（小时）
+            capacity: 每个城市最多保留的观测条数
+            round_values: 写入时是否按指标的小数位数取整（与数据库保存的值一致）
+            refresh_seconds: 城市缓冲区从数据库重新加载的间隔（秒），为0时不重新加载
+        """
+        self.hours = hours if hours is not None else HOT_WINDOW_HOURS
+        self.capacity = capacity or HOT_WINDOW_CAPACITY
+        self.round_values = round_values
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else HOT_WINDOW_REFRESH_SECONDS
+        self.window_ns = int(self.hours * 3600 * 1e9)
+        self.buffers = {}
+        self.lock = threading.Lock()
+    
+    def _arrays(self, frame):
+        """观测转换为按城市、时间排序的数组（同一城市同一时间保留最后一条）
+        
+        Returns:
+            (城市ID, 时间（纳秒）, 数据源, 指标)
+        """
+        city_ids = frame['city_id'].to_numpy(dtype='int64')
+        timestamps = pd.to_datetime(frame['timestamp']).to_numpy().astype('datetime64[ns]').view('int64')
+        source_ids = pd.to_numeric(frame['source_id']).to_numpy(dtype='int64', na_value=0)
+        values = np.column_stack([pd.to_numeric(frame[metric]).to_numpy(dtype='float64', na_value=np.nan) for metric in HOT_METRICS])
+        if self.round_values:
+            values = np.round(values * 10.0 ** METRIC_SCALES) / 10.0 ** METRIC_SCALES
+        
+        order = np.lexsort((np.arange(len(frame)), timestamps, city_ids))
+        city_ids, timestamps, source_ids, values = city_ids[order], timestamps[order], source_ids[order], values[order]
+        last = np.append((city_ids[1:] != city_ids[:-1]) | (timestamps[1:] != timestamps[:-1]), True)
+        return city_ids[last], timestamps[last], source_ids[last], values[last]
+    
+    def append(self, frame):
+        """写入已提交的观测（WEATHER_RECORD_COLUMNS 格式的DataFrame）"""
+        frame = frame.dropna(subset=['city_id', 'timestamp'])
+        if frame.empty:
+            return
+        
+        city_ids, timestamps, source_ids, values = self._arrays(frame)
+        bounds = np.flatnonzero(np.diff(city_ids)) + 1
+        with self.lock:
+            for start, end in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(city_ids)]])):
+                city_id = int(city_ids[start])
+                buffer = self.buffers.get(city_id)
+                if buffer is None:
+                    buffer = self.buffers[city_id] = CityRingBuffer(self.capacity)
+                buffer.append(timestamps[start:end], source_ids[start:end], values[start:end], self.window_ns)
+    
+    def prime(self, city_id, frame, start):
+        """用数据库查询结果预热城市的缓冲区（读取方未命中时调用）
+        
+        Args:
+            city_id: 城市ID
+            frame: 该城市从 start 到当前的全部观测（以时间为索引，字段为 city_id、source_id 和各气象指标）
+            start: 查询的起始时间
+        """
+        start_ns = pd.Timestamp(start).as_unit('ns').value
+        if frame.empty:
+            timestamps, source_ids, values = np.empty(0, dtype='int64'), np.empty(0, dtype='int64'), np.empty((0, len(HOT_METRICS)))
+        else:
+            _, timestamps, source_ids, values = self._arrays(frame.reset_index())
+        
+        with self.lock:
+            buffer = self.buffers.get(city_id)
+            if buffer is not None and buffer.size:
+                # 查询数据库之后本进程提交的、更晚的观测保留在缓冲区中
+                current = buffer.ordered()
+                newer = current[0] > (timestamps[-1] if len(timestamps) else start_ns)
+                timestamps = np.concatenate([timestamps, current[0][newer]])
+                source_ids = np.concatenate([source_ids, current[1][newer]])
+                values = np.concatenate([values, current[2][newer]])
+            buffer = self.buffers[city_id] = CityRingBuffer(self.capacity)
+            buffer.load(timestamps, source_ids, values, start_ns, self.window_ns)
+    
+    def _read(self, city_id, start, end):
+        """读取城市在时间范围内的观测
+        
+        Returns:
+            (时间, 数据源, 指标, 是否覆盖整个时间范围)，城市没有缓冲数据时返回None
+        """
+        start_ns = pd.Timestamp(start).as_unit('ns').value
+        end_ns = pd.Timestamp(end).as_unit('ns').value
+        with self.lock:
+            buffer = self.buffers.get(city_id)
+            if buffer is None or buffer.covered_from is None:
+                return None
+            if self.refresh_seconds and time.monotonic() - buffer.loaded_at > self.refresh_seconds:
+                # 其他进程写入的观测只能通过重新加载进入窗口
+                return None
+            timestamps, source_ids, values = buffer.ordered()
+            covered = buffer.covered_from <= start_ns
+        
+        first = int(np.searchsorted(timestamps, start_ns, side='left'))
+        last = int(np.searchsorted(timestamps, end_ns, side='right'))
+        return timestamps[first:last], source_ids[first:last], values[first:last], covered
+    
+    def _frame(self, city_id, timestamps, source_ids, values):
+        """观测数组转换为以时间为索引的DataFrame"""
+        data = {'city_id': np.full(len(timestamps), city_id, dtype='int64'), 'source_id': source_ids}
+        data.update(zip(HOT_METRICS, values.T))
+        return pd.DataFrame(data, index=pd.DatetimeIndex(timestamps.astype('datetime64[ns]').astype('datetime64[us]'), name='timestamp'))
+    
+    def frame(self, city_id, start, end):
+        """城市在时间范围内的观测（字段为 city_id、source_id 和各指标），窗口未覆盖整个时间范围时返回None"""
+        data = self._read(city_id, start, end)
+        if data is None or not data[3]:
+            return None
+        return self._frame(city_id, *data[:3])
+    
+    def latest(self, city_id, start, end):
+        """城市在时间范围内最新的一条观测（单行DataFrame）
+        
+        缓冲区中有范围内的观测时，它就是最新的观测（覆盖起点之后的观测都在缓冲区中）；
+        没有范围内的观测且窗口覆盖整个范围时返回空DataFrame，无法确定时返回None。
+        """
+        data = self._read(city_id, start, end)
+        if data is None:
+            return None
+        timestamps, source_ids, values, covered = data
+        if len(timestamps) == 0 and not covered:
+            return None
+        return self._frame(city_id, timestamps[-1:], source_ids[-1:], values[-1:])
+    
+    def statistics(self, city_id, start, end):
+        """城市在时间范围内各指标的统计值（见 window_statistics），窗口未覆盖整个时间范围时返回None"""
+        data = self._read(city_id, start, end)
+        if data is None or not data[3]:
+            return None
+        return window_statistics(data[2])
+    
+    def discard_before(self, city_id, timestamp):
+        """移除城市早于指定时间的观测（数据库中对应的数据已被删除）"""
+        with self.lock:
+            buffer = self.buffers.get(city_id)
+            if buffer is not None:
+                buffer.discard_before(pd.Timestamp(timestamp).as_unit('ns').value)
+    
+    def invalidate(self, city_id=None):
+        """清空城市（为空时为所有城市）的缓冲数据，之后的读取回退到数据库直到重新写入"""
+        with self.lock:
+            if city_id is None:
+                self.buffers.clear()
+            else:
+                self.buffers.pop(city_id, None)
+
+# 进程内共享的热数据窗口，按数据库和数据表区分
+_windows = {}
+_windows_lock = threading.Lock()
+
+def hot_window(engine, table=HistoricalWeather.__tablename__):
+    """获取进程内共享的热数据窗口
+    
+    Args:
+        engine: 数据库引擎（写入方和读取方使用同一数据库时共用窗口）
+        table: 数据表名称（historical_weather 或 real_time_weather）
+    """
+    key = (engine.url.render_as_string(hide_password=False), table)
+    with _windows_lock:
+        window = _windows.get(key)
+        if window is None:
+            # SQLite不按DECIMAL的小数位数取整，保存的是写入的原值
+            window = _windows[key] = HotWindow(round_values=engine.dialect.name != 'sqlite' or METRIC_STORAGE != 'decimal')
+        return window
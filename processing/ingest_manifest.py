@@ -0,0 +1,116 @@
+import os
+import hashlib
+import logging
+
+from .database_manager import IngestManifest
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 计算文件哈希时每次读取的字节数
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def hash_file(file_path, prefix_size=None):
+    """单次读取文件，返回 (前 prefix_size 字节的哈希, 整个文件的哈希)"""
+    prefix_hash = None
+    hasher = hashlib.sha256()
+    read_size = 0
+    
+    with open(file_path, 'rb') as f:
+        while True:
+            block_size = HASH_BLOCK_SIZE
+            if prefix_size is not None and prefix_hash is None:
+                block_size = min(block_size, prefix_size - read_size)
+                if block_size == 0:
+                    prefix_hash = hasher.hexdigest()
+                    continue
+            block = f.read(block_size)
+            if not block:
+                break
+            hasher.update(block)
+            read_size += len(block)
+    
+    if prefix_size is not None and prefix_hash is None:
+        prefix_hash = hasher.hexdigest()
+    return prefix_hash, hasher.hexdigest()
+
+class IngestManifestManager:
+    """文件入库清单：记录每个CSV文件已入库的大小、修改时间、内容哈希和行数
+    
+    再次加载时据此判断文件是否需要处理：
+    - skip: 文件未变化，直接跳过
+    - append: 文件只在末尾追加了内容，仅加载新增的行
+    - full: 新文件或内容被修改，重新加载整个文件
+    """
+    
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def get_entry(self, file_path):
+        """获取文件的清单记录"""
+        session = self.db_manager.get_session()
+        try:
+            return session.query(IngestManifest).filter(IngestManifest.file_path == os.path.abspath(file_path)).first()
+        finally:
+            session.close()
+    
+    def plan(self, file_path, data_type='historical'):
+        """判断文件需要如何加载
+        
+        Returns:
+            dict: action (skip/append/full)、start_row（从第几行数据开始加载）以及本次的文件大小、修改时间和内容哈希；
+                  refresh 为True表示内容未变但修改时间变了，需要更新清单记录
+        """
+        stat = os.stat(file_path)
+        entry = self.get_entry(file_path)
+        plan = {'action': 'full', 'start_row': 0, 'file_size': stat.st_size, 'file_mtime_ns': stat.st_mtime_ns}
+        
+        if entry is None or entry.data_type != data_type:
+            plan['content_hash'] = hash_file(file_path)[1]
+            return plan
+        
+        # 大小和修改时间都没变，不读取文件内容直接跳过
+        if stat.st_size == entry.file_size and stat.st_mtime_ns == entry.file_mtime_ns:
+            plan.update(action='skip', start_row=entry.rows_consumed, content_hash=entry.content_hash)
+            return plan
+        
+        if stat.st_size >= entry.file_size:
+            prefix_hash, content_hash = hash_file(file_path, entry.file_size)
+            plan['content_hash'] = content_hash
+            if prefix_hash == entry.content_hash:
+                # 已入库部分未被修改：大小相同说明只是修改时间变了，否则是在末尾追加了内容
+                if stat.st_size == entry.file_size:
+                    plan.update(action='skip', start_row=entry.rows_consumed, refresh=True)
+                else:
+                    plan.update(action='append', start_row=entry.rows_consumed)
+            return plan
+        
+        # 文件变小，说明内容被替换，重新加载
+        plan['content_hash'] = hash_file(file_path)[1]
+        return plan
+    
+    def record(self, file_path, data_type, plan, rows_consumed):
+        """文件加载完成后更新清单记录"""
+        session = self.db_manager.get_session()
+        try:
+            file_path = os.path.abspath(file_path)
+            entry = session.query(IngestManifest).filter(IngestManifest.file_path == file_path).first()
+            if entry is None:
+                entry = IngestManifest(file_path=file_path)
+                session.add(entry)
+            
+            entry.data_type = data_type
+            entry.file_size = plan['file_size']
+            entry.file_mtime_ns = plan['file_mtime_ns']
+            entry.content_hash = plan['content_hash']
+            entry.rows_consumed = rows_consumed
+            
+            session.commit()
+            return True
+        except Exception as e:
+            logger.error(f"更新文件入库清单失败: {e}")
+            session.rollback()
+            return False
+        finally:
+            session.close()
@@ -0,0 +1,101 @@
+import os
+import logging
+from datetime import datetime
+
+from .data_validator import WeatherDataValidator
+from .data_storage import WeatherDataStorage
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class WeatherIngestPipeline:
+    """采集数据直接入库的内存流水线：采集 → 验证标准化 → 预处理 → 入库
+    
+    采集到的数据在内存中依次经过 WeatherDataValidator、WeatherDataPreprocessor 和 WeatherDataStorage，
+    不再先写成CSV/JSON文件再由 load_and_store_csv.py 读回。需要保留原始文件时可开启归档，
+    归档只是旁路输出，不影响入库。
+    """
+    
+    def __init__(self, collector=None, validator=None, storage=None, archive=None):
+        """
+        Args:
+            collector: 数据采集器（只在需要采集或归档时使用）
+            validator: 数据验证器
+            storage: 数据存储实例
+            archive: 是否同时把采集到的数据归档为文件，为空时读取 ARCHIVE_COLLECTED_DATA 配置
+        """
+        self.collector = collector
+        self.validator = validator or WeatherDataValidator()
+        self.storage = storage or WeatherDataStorage()
+        self.archive = archive if archive is not None else os.getenv('ARCHIVE_COLLECTED_DATA', '0') == '1'
+    
+    def ingest(self, data, data_type='historical', archive_name=None):
+        """验证、预处理并存储一批采集到的数据
+        
+        Args:
+            data: 采集到的数据（实时数据为dict，历史数据为DataFrame）
+            data_type: 数据类型 (realtime, historical)
+            archive_name: 归档文件名（不含扩展名），开启归档时使用
+        
+        Returns:
+            (是否成功, 新增条数, 更新条数)，被隔离的行数见 storage.last_quarantined_count
+        """
+        if data is None:
+            return False, 0, 0
+        
+        standardized_df, msg = self.validator.validate_and_standardize(data)
+        if standardized_df is None:
+            logger.error(f"数据验证失败，无法入库: {msg}")
+            return False, 0, 0
+        
+        success, stored, updated = self.storage.preprocess_and_store(standardized_df, data_type)
+        
+        if self.archive and archive_name and self.collector is not None:
+            # 实时数据归档原始记录，历史数据归档标准化后的数据，与原有文件格式一致
+            self.collector.save_data(data if data_type == 'realtime' else standardized_df, archive_name, data_type)
+        
+        return success, stored, updated
+    
+    def collect_and_ingest(self, cities):
+        """采集各城市的实时和历史数据并直接入库
+        
+        Returns:
+            (是否全部成功, 新增条数, 更新条数)
+        """
+        all_success = True
+        total_stored = 0
+        total_updated = 0
+        total_quarantined = 0
+        
+        for city in cities:
+            logger.info(f"获取{city}实时气象数据...")
+            realtime_data = self.collector.get_realtime_weather(city)
+            if realtime_data:
+                success, stored, updated = self.ingest(
+                    realtime_data, 'realtime',
+                    f'realtime_weather_{city}_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+                )
+                all_success = all_success and success
+                total_stored += stored
+                total_updated += updated
+                total_quarantined += self.storage.last_quarantined_count if success else 0
+            
+            logger.info(f"获取{city}历史气象数据...")
+            historical_data = self.collector.get_historical_weather(city)
+            if historical_data is not None:
+                success, stored, updated = self.ingest(
+                    historical_data, 'historical',
+                    f'historical_weather_{city}_{datetime.now().strftime("%Y%m%d")}'
+                )
+                all_success = all_success and success
+                total_stored += stored
+                total_updated += updated
+                total_quarantined += self.storage.last_quarantined_count if success else 0
+        
+        logger.info(f"采集数据入库完成，新增: {total_stored}条，更新: {total_updated}条，隔离: {total_quarantined}条")
+        return all_success, total_stored, total_updated
+    
+    def close(self):
+        """关闭存储连接"""
+        self.storage.close()
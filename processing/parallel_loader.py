@@ -0,0 +1,174 @@
+import os
+import time
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+from .data_preprocessor import WeatherDataPreprocessor
+from .city_catalog import CityIdMap
+from .data_storage import WeatherDataStorage, WEATHER_RECORD_COLUMNS, EVENT_RECORD_COLUMNS
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 写入阶段需要的字段，只回传这些字段以减少进程间传输的数据量
+STORAGE_COLUMNS = set(WEATHER_RECORD_COLUMNS) | set(EVENT_RECORD_COLUMNS)
+
+def preprocess_csv_file(file_path, data_type='historical', start_row=0, city_snapshot=None):
+    """在子进程中读取并预处理单个CSV文件
+    
+    Args:
+        file_path: CSV文件路径
+        data_type: 数据类型
+        start_row: 从第几行数据开始读取（用于只加载追加的内容）
+        city_snapshot: 主进程数据库城市ID映射的快照，与顺序加载使用同一份映射编码城市；为空时从站点目录文件加载
+    
+    Returns:
+        预处理结果字典，包含预处理后的数据、清洗日志、行数和耗时
+    """
+    start = time.perf_counter()
+    # 跳过已入库的数据行（按行号判断，不生成需要跳过的行号集合）
+    df = pd.read_csv(file_path, skiprows=(lambda row: 0 < row <= start_row) if start_row else None)
+    
+    preprocessor = WeatherDataPreprocessor(CityIdMap.from_snapshot(city_snapshot) if city_snapshot else None)
+    processed_df = preprocessor.preprocess_data(df, data_type)
+    if processed_df is not None:
+        processed_df = processed_df[[col for col in processed_df.columns if col in STORAGE_COLUMNS]]
+    
+    return {
+        'file_path': file_path,
+        'data_type': data_type,
+        'rows': len(df),
+        'processed_df': processed_df,
+        'cleaning_logs': preprocessor.cleaning_logs,
+        'preprocess_seconds': time.perf_counter() - start
+    }
+
+class ParallelCSVLoader:
+    """多进程并行预处理、单写入者顺序入库的CSV批量加载器
+    
+    预处理在进程池中并行执行；主线程作为唯一的写入者，按文件提交顺序依次取出结果写入数据库。
+    已提交但尚未写入的文件数不超过队列深度，写入跟不上时不再提交新文件（背压）。
+    启用入库清单时，未变化的文件不会提交，追加过内容的文件只加载新增的行。
+    
+    并行加载以整个文件为单位，不使用 CSV_CHUNK_SIZE 分块读取和断点：子进程按块读取时结果仍需整体回传，
+    内存占用由队列深度（同时在内存中的文件数）控制；断续加载由入库清单保证，文件全部写入后才记入清单，
+    中断或失败的文件下次从清单记录的行开始重新加载（已存在的历史数据键跳过、实时数据覆盖为相同值）。
+    单个文件过大时应使用顺序的分块流式加载。
+    """
+    
+    def __init__(self, storage=None, workers=None, queue_depth=None):
+        self.storage = storage or WeatherDataStorage()
+        self.workers = workers or int(os.getenv('LOADER_WORKERS', os.cpu_count() or 1))
+        self.queue_depth = queue_depth or int(os.getenv('LOADER_QUEUE_DEPTH', self.workers * 2))
+        if self.storage.csv_chunk_size:
+            logger.info("并行加载按整个文件预处理和写入，不使用 CSV_CHUNK_SIZE 分块读取和断点")
+    
+    def _write_result(self, result):
+        """写入一个文件的预处理结果
+        
+        Returns:
+            (是否成功, 新增条数, 更新条数, 隔离条数)
+        """
+        if result['cleaning_logs']:
+            self.storage.cleaning_log_sink.submit(result['cleaning_logs'])
+        
+        if result['processed_df'] is None:
+            logger.error(f"文件 {result['file_path']} 预处理失败，无法存储")
+            return False, 0, 0, 0
+        
+        success, stored, updated = self.storage.store_processed_data(result['processed_df'], result['data_type'])
+        return success, stored, updated, self.storage.last_quarantined_count
+    
+    def load_files(self, files):
+        """并行加载多个CSV文件
+        
+        Args:
+            files: [(文件路径, 数据类型)] 列表，按列表顺序写入数据库
+        
+        Returns:
+            (是否全部成功, 新增条数, 更新条数, 各文件吞吐统计列表)，各文件被隔离的行数见统计中的 quarantined
+        """
+        file_iter = iter(files)
+        pending = deque()
+        file_stats = []
+        total_stored = 0
+        total_updated = 0
+        total_quarantined = 0
+        all_success = True
+        start = time.perf_counter()
+        
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            def submit_next():
+                """提交下一个需要加载的文件（按入库清单跳过未变化的文件），没有剩余文件时返回False"""
+                for file_path, data_type in file_iter:
+                    plan = self.storage.manifest.plan(file_path, data_type) if self.storage.manifest else None
+                    if plan and plan['action'] == 'skip':
+                        if plan.get('refresh'):
+                            self.storage.manifest.record(file_path, data_type, plan, plan['start_row'])
+                        logger.info(f"文件 {file_path} 未变化，跳过")
+                        continue
+                    
+                    start_row = plan['start_row'] if plan else 0
+                    # 子进程不连接数据库，使用主进程数据库城市ID映射的快照
+                    city_snapshot = self.storage.preprocessor.city_ids.snapshot()
+                    future = executor.submit(preprocess_csv_file, file_path, data_type, start_row, city_snapshot)
+                    pending.append((file_path, plan, start_row, future))
+                    return True
+                return False
+            
+            # 先填满队列
+            while len(pending) < self.queue_depth and submit_next():
+                pass
+            
+            while pending:
+                file_path, plan, start_row, future = pending.popleft()
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"文件 {file_path} 预处理失败: {e}")
+                    all_success = False
+                    submit_next()
+                    continue
+                
+                # 写入者取走一个结果后才提交新文件
+                submit_next()
+                
+                write_start = time.perf_counter()
+                success, stored, updated, quarantined = self._write_result(result)
+                write_seconds = time.perf_counter() - write_start
+                
+                all_success = all_success and success
+                if success:
+                    total_stored += stored
+                    total_updated += updated
+                    total_quarantined += quarantined
+                    if plan and quarantined:
+                        logger.warning(f"文件 {file_path} 有 {quarantined} 条数据被隔离，不记入入库清单")
+                    elif plan:
+                        self.storage.manifest.record(file_path, result['data_type'], plan, start_row + result['rows'])
+                
+                file_seconds = result['preprocess_seconds'] + write_seconds
+                file_stats.append({
+                    'file_path': file_path,
+                    'success': success,
+                    'rows': result['rows'],
+                    'stored': stored,
+                    'updated': updated,
+                    'quarantined': quarantined,
+                    'preprocess_seconds': round(result['preprocess_seconds'], 3),
+                    'write_seconds': round(write_seconds, 3),
+                    'rows_per_sec': int(result['rows'] / file_seconds) if file_seconds > 0 else None
+                })
+                logger.info(f"文件 {os.path.basename(file_path)} 处理{'成功' if success else '失败'}，{result['rows']}行，"
+                            f"预处理 {result['preprocess_seconds']:.2f}s，写入 {write_seconds:.2f}s，"
+                            f"新增: {stored}条，更新: {updated}条，隔离: {quarantined}条")
+        
+        elapsed = time.perf_counter() - start
+        total_rows = sum(stat['rows'] for stat in file_stats)
+        logger.info(f"并行加载完成，{len(file_stats)}个文件共 {total_rows} 行，耗时 {elapsed:.2f}s，"
+                    f"整体吞吐 {total_rows / elapsed if elapsed > 0 else 0:.0f} 行/秒，"
+                    f"新增: {total_stored}条，更新: {total_updated}条，隔离: {total_quarantined}条")
+        return all_success, total_stored, total_updated, file_stats
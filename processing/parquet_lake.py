@@ -0,0 +1,197 @@
+import os
+import glob
+import uuid
+import logging
+from datetime import datetime
+import pandas as pd
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 写入数据湖的气象数据表
+LAKE_TABLES = ('historical_weather', 'real_time_weather')
+
+# 数据湖中保存的字段
+LAKE_COLUMNS = ['city_id', 'source_id', 'timestamp', 'temperature', 'pressure', 'humidity',
+                'precipitation', 'wind_speed', 'wind_direction', 'status']
+
+# 数据湖中同一观测的唯一键
+LAKE_KEY_COLUMNS = ['city_id', 'timestamp']
+
+class ParquetLake:
+    """按 城市/年/月 分区的Parquet数据湖
+    
+    目录结构为 <根目录>/<表名>/city_id=<城市ID>/year=<年>/month=<月>/part-*.parquet。
+    每个已提交的批次按分区写成新的Parquet文件：先写入临时文件，再原子重命名为正式文件，
+    读取方不会看到写了一半的文件。分区内小文件数达到阈值时合并为一个文件。
+    同一观测可能出现在多个文件中（实时数据的更新），读取时按文件写入顺序保留最后一条。
+    """
+    
+    def __init__(self, root=None, compact_threshold=None):
+        self.root = root or os.getenv('PARQUET_LAKE_DIR', './data/lake')
+        self.compact_threshold = compact_threshold or int(os.getenv('PARQUET_COMPACT_THRESHOLD', 16))
+    
+    def _table_dir(self, table_name):
+        return os.path.join(self.root, table_name)
+    
+    def _partition_dir(self, table_name, city_id, year, month):
+        return os.path.join(self._table_dir(table_name), f'city_id={city_id}', f'year={year}', f'month={month:02d}')
+    
+    def _part_files(self, partition_dir):
+        """分区内的正式数据文件（文件名以写入时间开头，排序即写入顺序）"""
+        return sorted(glob.glob(os.path.join(partition_dir, 'part-*.parquet')))
+    
+    def _write_file(self, frame, partition_dir, file_name):
+        """先写临时文件再原子重命名"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        os.makedirs(partition_dir, exist_ok=True)
+        final_path = os.path.join(partition_dir, file_name)
+        tmp_path = os.path.join(partition_dir, f'.{file_name}.tmp')
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), tmp_path)
+        os.replace(tmp_path, final_path)
+        return final_path
+    
+    def _normalize(self, frame):
+        """统一字段和类型，保证各文件的schema一致"""
+        frame = frame.reindex(columns=LAKE_COLUMNS)
+        frame = frame.astype({
+            'city_id': 'int64',
+            'source_id': 'Int64',
+            'status': 'Int64',
+            'temperature': 'float64',
+            'pressure': 'float64',
+            'humidity': 'float64',
+            'precipitation': 'float64',
+            'wind_speed': 'float64',
+            'wind_direction': 'float64'
+        })
+        frame['timestamp'] = pd.to_datetime(frame['timestamp']).astype('datetime64[us]')
+        return frame
+    
+    def append(self, table_name, frame):
+        """把一个已提交的批次追加到数据湖
+        
+        Returns:
+            写入的文件数
+        """
+        if table_name not in LAKE_TABLES or frame is None or frame.empty:
+            return 0
+        
+        frame = self._normalize(frame)
+        batch_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+        timestamps = frame['timestamp']
+        written = 0
+        
+        for (city_id, year, month), part in frame.groupby([frame['city_id'], timestamps.dt.year, timestamps.dt.month]):
+            partition_dir = self._partition_dir(table_name, city_id, year, month)
+            self._write_file(part, partition_dir, f'part-{batch_id}.parquet')
+            written += 1
+            
+            if len(self._part_files(partition_dir)) >= self.compact_threshold:
+                self.compact_partition(partition_dir)
+        
+        return written
+    
+    def compact_partition(self, partition_dir):
+        """合并一个分区内的小文件，同一观测只保留最后写入的一条
+        
+        合并结果以最后一个源文件的名字加后缀命名，排序位置在之后写入的文件之前，
+        合并期间读取到新旧文件同时存在时，去重结果仍然正确。
+        """
+        import pyarrow.parquet as pq
+        
+        files = self._part_files(partition_dir)
+        if len(files) < 2:
+            return False
+        
+        frames = [pq.read_table(path).to_pandas() for path in files]
+        merged = pd.concat(frames, ignore_index=True).drop_duplicates(LAKE_KEY_COLUMNS, keep='last')
+        merged = merged.sort_values('timestamp').reset_index(drop=True)
+        
+        last_name = os.path.basename(files[-1])[:-len('.parquet')]
+        self._write_file(merged, partition_dir, f'{last_name}-compacted.parquet')
+        for path in files:
+            os.remove(path)
+        
+        logger.info(f"数据湖分区 {partition_dir} 合并完成，{len(files)} 个文件合并为1个，共 {len(merged)} 行")
+        return True
+    
+    def compact(self, table_name=None):
+        """合并所有分区（或指定表的所有分区）中的小文件
+        
+        Returns:
+            合并的分区数
+        """
+        tables = [table_name] if table_name else LAKE_TABLES
+        compacted = 0
+        for table in tables:
+            pattern = os.path.join(self._table_dir(table), 'city_id=*', 'year=*', 'month=*')
+            for partition_dir in sorted(glob.glob(pattern)):
+                if self.compact_partition(partition_dir):
+                    compacted += 1
+        return compacted
+    
+    def _read_partition(self, partition_dir, columns=None):
+        """读取一个分区的所有文件；读取期间分区被合并（源文件已删除）时重新列出文件再读"""
+        import pyarrow.parquet as pq
+        
+        while True:
+            try:
+                return [pq.read_table(path, columns=columns).to_pandas() for path in self._part_files(partition_dir)]
+            except FileNotFoundError:
+                continue
+    
+    def read(self, table_name='historical_weather', city_ids=None, start_date=None, end_date=None, columns=None):
+        """读取数据湖中的数据，按城市和年月裁剪分区后只读取相关文件
+        
+        Args:
+            table_name: 表名
+            city_ids: 城市ID列表，为空时读取所有城市
+            start_date: 开始时间
+            end_date: 结束时间
+            columns: 需要的字段，为空时读取所有字段
+        
+        Returns:
+            DataFrame
+        """
+        start_date = pd.Timestamp(start_date) if start_date is not None else None
+        end_date = pd.Timestamp(end_date) if end_date is not None else None
+        start_month = (start_date.year, start_date.month) if start_date is not None else None
+        end_month = (end_date.year, end_date.month) if end_date is not None else None
+        
+        read_columns = None
+        if columns:
+            read_columns = list(dict.fromkeys(LAKE_KEY_COLUMNS + list(columns)))
+        
+        frames = []
+        for city_dir in sorted(glob.glob(os.path.join(self._table_dir(table_name), 'city_id=*'))):
+            city_id = int(os.path.basename(city_dir).split('=', 1)[1])
+            if city_ids is not None and city_id not in city_ids:
+                continue
+            for month_dir in sorted(glob.glob(os.path.join(city_dir, 'year=*', 'month=*'))):
+                year = int(os.path.basename(os.path.dirname(month_dir)).split('=', 1)[1])
+                month = int(os.path.basename(month_dir).split('=', 1)[1])
+                if start_month is not None and (year, month) < start_month:
+                    continue
+                if end_month is not None and (year, month) > end_month:
+                    continue
+                frames.extend(self._read_partition(month_dir, read_columns))
+        
+        if not frames:
+            return pd.DataFrame(columns=read_columns or LAKE_COLUMNS)
+        
+        df = pd.concat(frames, ignore_index=True).drop_duplicates(LAKE_KEY_COLUMNS, keep='last')
+        if start_date is not None:
+            df = df[df['timestamp'] >= start_date]
+        if end_date is not None:
+            df = df[df['timestamp'] <= end_date]
+        return df.sort_values(['city_id', 'timestamp']).reset_index(drop=True)
+
+if __name__ == "__main__":
+    # 合并数据湖中的小文件
+    lake = ParquetLake()
+    count = lake.compact()
+    logger.info(f"数据湖合并完成，共合并 {count} 个分区")
@@ -0,0 +1,450 @@
+import os
+import re
+import sys
+import logging
+import threading
+import pandas as pd
+from sqlalchemy import MetaData, Index, inspect, select, delete, text, union_all
+from sqlalchemy.orm import aliased
+
+from .database_manager import DatabaseManager, HistoricalWeather, WeatherRollup, CLUSTERED_LAYOUT
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 分区粒度对应的分区名格式
+PARTITION_FORMATS = {
+    'year': '%Y',
+    'month': '%Y%m'
+}
+
+# MySQL中存放超出已有分区范围数据的分区
+MAXVALUE_PARTITION = 'pmax'
+
+class HistoricalPartitionManager:
+    """按时间范围分区管理历史天气表（HISTORICAL_PARTITIONING: year / month）
+    
+    - MySQL: 原生 RANGE COLUMNS(timestamp) 分区，查询按时间条件自动裁剪分区，
+      删除一个时间段即 DROP PARTITION，只修改元数据
+    - SQLite: 每个时间段一张表（historical_weather_p<时间段>），historical_weather 改为
+      UNION ALL 视图，写入通过 INSTEAD OF 触发器分发到对应的时间段表；
+      source() 按查询的时间范围只选取相关的时间段表，删除一个时间段即 DROP TABLE
+    
+    写入前通过 ensure_partitions 创建缺少的分区；表还未分区时首次调用会先完成转换。
+    删除分区时同时删除 weather_rollups 中该时间段的汇总（按天、按月的汇总时间段不跨分区边界）。
+    """
+    
+    def __init__(self, db_manager=None, granularity=None):
+        self.db_manager = db_manager or DatabaseManager()
+        self.engine = self.db_manager.engine
+        self.dialect = self.engine.dialect.name
+        self.granularity = (granularity or os.getenv('HISTORICAL_PARTITIONING', '')).lower() or None
+        if self.granularity is not None and self.granularity not in PARTITION_FORMATS:
+            raise ValueError(f"不支持的分区粒度: {self.granularity}")
+        if self.dialect not in ('mysql', 'sqlite'):
+            raise ValueError(f"不支持的数据库方言: {self.dialect}")
+        
+        self.table = HistoricalWeather.__table__
+        self.lock = threading.Lock()
+        # 已确认存在的分区名，避免每次写入都查询元数据
+        self._known_partitions = None
+        self._partition_tables = {}
+        self._sources = {}
+    
+    @property
+    def enabled(self):
+        return self.granularity is not None
+    
+    def _quote(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+    
+    # ------------------------------
+    # 时间段
+    # ------------------------------
+    
+    def period_start(self, timestamp):
+        """时间所在分区时间段的开始时间"""
+        timestamp = pd.Timestamp(timestamp)
+        if self.granularity == 'year':
+            return pd.Timestamp(timestamp.year, 1, 1)
+        return pd.Timestamp(timestamp.year, timestamp.month, 1)
+    
+    def next_period(self, start):
+        """下一个时间段的开始时间"""
+        return start + (pd.DateOffset(years=1) if self.granularity == 'year' else pd.DateOffset(months=1))
+    
+    def partition_name(self, start):
+        """时间段对应的分区名（如 p2011、p201103）"""
+        return 'p' + start.strftime(PARTITION_FORMATS[self.granularity])
+    
+    def partition_start(self, name):
+        """分区名对应的时间段开始时间"""
+        digits = name[1:]
+        if self.granularity == 'year':
+            return pd.Timestamp(int(digits), 1, 1)
+        return pd.Timestamp(int(digits[:4]), int(digits[4:6]), 1)
+    
+    def periods_between(self, start, end):
+        """覆盖 [start, end] 的所有时间段开始时间"""
+        periods = []
+        current = self.period_start(start)
+        last = self.period_start(end)
+        while current <= last:
+            periods.append(current)
+            current = self.next_period(current)
+        return periods
+    
+    def _bound(self, start):
+        """时间段开始时间的SQL字面量（与SQLite中DateTime的文本格式可直接比较）"""
+        return start.strftime('%Y-%m-%d %H:%M:%S')
+    
+    def _table_name(self, partition):
+        """SQLite中时间段表的表名"""
+        return f"{self.table.name}_{partition}"
+    
+    # ------------------------------
+    # 分区元数据
+    # ------------------------------
+    
+    def is_partitioned(self):
+        """历史天气表是否已转换为分区表"""
+        with self.engine.connect() as conn:
+            if self.dialect == 'mysql':
+                count = conn.execute(text(
+                    "SELECT COUNT(*) FROM information_schema.PARTITIONS "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL"
+                ), {'table': self.table.name}).scalar()
+                return count > 0
+            kind = conn.execute(text("SELECT type FROM sqlite_master WHERE name = :table"), {'table': self.table.name}).scalar()
+            return kind == 'view'
+    
+    def list_partitions(self, conn=None):
+        """已有的时间段分区名（按时间排序，不含MySQL的MAXVALUE分区）"""
+        if conn is None:
+            with self.engine.connect() as conn:
+                return self.list_partitions(conn)
+        
+        if self.dialect == 'mysql':
+            names = conn.execute(text(
+                "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL "
+                "ORDER BY PARTITION_ORDINAL_POSITION"
+            ), {'table': self.table.name}).scalars().all()
+            return [name for name in names if name != MAXVALUE_PARTITION]
+        
+        names = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE :pattern"
+        ), {'pattern': f"{self.table.name}_p%"}).scalars().all()
+        partitions = [name[len(self.table.name) + 1:] for name in names]
+        return sorted(partition for partition in partitions if re.fullmatch(r'p\d+', partition))
+    
+    def _data_range(self, conn, table_name):
+        """表中数据的最早和最晚时间"""
+        row = conn.execute(text(
+            f"SELECT MIN(timestamp), MAX(timestamp) FROM {self._quote(table_name)}"
+        )).one()
+        if row[0] is None:
+            return None
+        return pd.Timestamp(row[0]), pd.Timestamp(row[1])
+    
+    # ------------------------------
+    # 转换与新增分区
+    # ------------------------------
+    
+    def enable(self):
+        """把未分区的历史天气表转换为分区表，按已有数据的时间范围建立分区"""
+        if self.is_partitioned():
+            return False
+        
+        with self.engine.begin() as conn:
+            data_range = self._data_range(conn, self.table.name)
+        if data_range is None:
+            now = pd.Timestamp.now()
+            data_range = (now, now)
+        periods = self.periods_between(*data_range)
+        
+        if self.dialect == 'mysql':
+            self._enable_mysql(periods)
+        else:
+            self._enable_sqlite(periods)
+        
+        self._known_partitions = None
+        logger.info(f"{self.table.name} 已按{self.granularity}分区，共 {len(periods)} 个分区")
+        return True
+    
+    def _enable_mysql(self, periods):
+        """MySQL: 分区表的每个唯一键都必须包含分区字段，且不支持外键"""
+        table = self._quote(self.table.name)
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for foreign_key in inspector.get_foreign_keys(self.table.name):
+                conn.execute(text(f"ALTER TABLE {table} DROP FOREIGN KEY {self._quote(foreign_key['name'])}"))
+            if not CLUSTERED_LAYOUT:
+                # 自增主键改为 (id, timestamp)
+                conn.execute(text(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)"))
+            
+            definitions = [
+                f"PARTITION {self.partition_name(start)} VALUES LESS THAN ('{self._bound(self.next_period(start))}')"
+                for start in periods
+            ]
+            definitions.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE)")
+            conn.execute(text(f"ALTER TABLE {table} PARTITION BY RANGE COLUMNS(timestamp) ({', '.join(definitions)})"))
+    
+    def _enable_sqlite(self, periods):
+        """SQLite: 原表的数据按时间段复制到各时间段表后删除原表，再建立视图和触发器"""
+        legacy = f"{self.table.name}_unpartitioned"
+        columns = ', '.join(self._quote(column.name) for column in self.table.columns)
+        with self.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {self._quote(self.table.name)} RENAME TO {self._quote(legacy)}"))
+            for start in periods:
+                partition = self.partition_name(start)
+                self._create_sqlite_partition(conn, partition)
+                conn.execute(text(
+                    f"INSERT INTO {self._quote(self._table_name(partition))} ({columns}) "
+                    f"SELECT {columns} FROM {self._quote(legacy)} "
+                    f"WHERE timestamp >= :start AND timestamp < :end"
+                ), {'start': self._bound(start), 'end': self._bound(self.next_period(start))})
+            conn.execute(text(f"DROP TABLE {self._quote(legacy)}"))
+            self._rebuild_sqlite_view(conn, [self.partition_name(start) for start in periods])
+    
+    def _partition_table(self, partition):
+        """时间段表的表定义（与历史天气表结构一致，索引名加分区后缀）"""
+        if partition in self._partition_tables:
+            return self._partition_tables[partition]
+        metadata = MetaData()
+        for foreign_key in self.table.foreign_keys:
+            foreign_key.column.table.to_metadata(metadata)
+        partition_table = self.table.to_metadata(metadata, name=self._table_name(partition))
+        partition_table.indexes.clear()
+        for index in self.table.indexes:
+            Index(f"{index.name}_{partition}", *[column.name for column in index.columns],
+                  unique=index.unique, _table=partition_table)
+        self._partition_tables[partition] = partition_table
+        return partition_table
+    
+    def _create_sqlite_partition(self, conn, partition):
+        self._partition_table(partition).create(conn, checkfirst=True)
+    
+    def _rebuild_sqlite_view(self, conn, partitions):
+        """按当前的时间段表重建 UNION ALL 视图和写入/删除触发器"""
+        name = self._quote(self.table.name)
+        column_names = [column.name for column in self.table.columns]
+        columns = ', '.join(self._quote(column) for column in column_names)
+        new_values = ', '.join(f"NEW.{self._quote(column)}" for column in column_names)
+        
+        conn.execute(text(f"DROP VIEW IF EXISTS {name}"))
+        conn.execute(text(f"CREATE VIEW {name} AS " + ' UNION ALL '.join(
+            f"SELECT {columns} FROM {self._quote(self._table_name(partition))}" for partition in partitions
+        )))
+        
+        ranges = []
+        inserts = []
+        deletes = []
+        for partition in partitions:
+            start = self.partition_start(partition)
+            condition = f"NEW.timestamp >= '{self._bound(start)}' AND NEW.timestamp < '{self._bound(self.next_period(start))}'"
+            ranges.append(f"({condition})")
+            table = self._quote(self._table_name(partition))
+            inserts.append(f"INSERT INTO {table} ({columns}) SELECT {new_values} WHERE {condition};")
+            deletes.append(f"DELETE FROM {table} WHERE city_id = OLD.city_id AND timestamp = OLD.timestamp;")
+        
+        # 没有对应时间段表的数据直接报错，而不是被静默丢弃
+        conn.execute(text(
+            f"CREATE TRIGGER {self._quote(self.table.name + '_insert')} INSTEAD OF INSERT ON {name} BEGIN "
+            f"SELECT RAISE(ABORT, 'historical_weather: no partition for timestamp') WHERE NOT ({' OR '.join(ranges)}); "
+            + ' '.join(inserts) + " END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER {self._quote(self.table.name + '_delete')} INSTEAD OF DELETE ON {name} BEGIN "
+            + ' '.join(deletes) + " END"
+        ))
+    
+    def ensure_partitions(self, timestamps):
+        """确保一批数据所在的时间段都已有分区
+        
+        Args:
+            timestamps: 待写入数据的时间（Series或列表）
+        
+        Returns:
+            新建的分区数
+        """
+        if not self.enabled:
+            return 0
+        timestamps = pd.to_datetime(pd.Series(timestamps)).dropna()
+        if timestamps.empty:
+            return 0
+        
+        with self.lock:
+            if self._known_partitions is None:
+                if not self.is_partitioned():
+                    self.enable()
+                self._known_partitions = set(self.list_partitions())
+            
+            periods = timestamps.dt.to_period('Y' if self.granularity == 'year' else 'M').dt.start_time.unique()
+            missing = sorted({self.partition_name(start) for start in periods} - self._known_partitions)
+            if not missing:
+                return 0
+            
+            if self.dialect == 'mysql':
+                created = self._add_mysql_partitions(missing)
+            else:
+                created = self._add_sqlite_partitions(missing)
+            self._known_partitions = set(self.list_partitions())
+            return created
+    
+    def _add_mysql_partitions(self, missing):
+        """MySQL的RANGE分区必须连续：早于首个分区的时间段从首个分区拆出，晚于末个分区的从MAXVALUE分区拆出"""
+        existing = self.list_partitions()
+        table = self._quote(self.table.name)
+        first = self.partition_start(existing[0]) if existing else None
+        last = self.partition_start(existing[-1]) if existing else None
+        
+        earlier = [self.partition_start(name) for name in missing if first is not None and self.partition_start(name) < first]
+        later = [self.partition_start(name) for name in missing if last is None or self.partition_start(name) > last]
+        created = 0
+        
+        with self.engine.begin() as conn:
+            if earlier:
+                periods = self.periods_between(min(earlier), first - pd.Timedelta(seconds=1)) + [first]
+                definitions = [
+                    f"PARTITION {self.partition_name(start)} VALUES LESS THAN ('{self._bound(self.next_period(start))}')"
+                    for start in periods
+                ]
+                conn.execute(text(f"ALTER TABLE {table} REORGANIZE PARTITION {existing[0]} INTO ({', '.join(definitions)})"))
+                created += len(periods) - 1
+            if later:
+                start_from = self.next_period(last) if last is not None else min(later)
+                periods = self.periods_between(start_from, max(later))
+                definitions = [
+                    f"PARTITION {self.partition_name(start)} VALUES LESS THAN ('{self._bound(self.next_period(start))}')"
+                    for start in periods
+                ]
+                definitions.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE)")
+                conn.execute(text(f"ALTER TABLE {table} REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO ({', '.join(definitions)})"))
+                created += len(periods)
+        
+        logger.info(f"{self.table.name} 新增 {created} 个分区")
+        return created
+    
+    def _add_sqlite_partitions(self, missing):
+        with self.engine.begin() as conn:
+            for partition in missing:
+                self._create_sqlite_partition(conn, partition)
+            self._rebuild_sqlite_view(conn, self.list_partitions(conn))
+        logger.info(f"{self.table.name} 新增分区: {', '.join(missing)}")
+        return len(missing)
+    
+    def split_by_partition(self, frame):
+        """按写入目标拆分一批数据
+        
+        SQLite分区后直接写入各时间段表，不经过视图上逐行判断所有时间段的触发器；
+        其他情况整批写入历史天气表（MySQL由数据库分发到分区）。
+        
+        Returns:
+            [(目标表, 数据)]
+        """
+        if not self.enabled or self.dialect != 'sqlite' or frame.empty:
+            return [(self.table, frame)]
+        
+        periods = frame['timestamp'].dt.to_period('Y' if self.granularity == 'year' else 'M').dt.start_time
+        return [
+            (self._partition_table(self.partition_name(start)), part)
+            for start, part in frame.groupby(periods, sort=True)
+        ]
+    
+    # ------------------------------
+    # 删除分区与查询
+    # ------------------------------
+    
+    def drop_partition(self, partition):
+        """删除一个时间段的全部数据（只修改元数据，不逐行删除）
+        
+        Args:
+            partition: 分区名（如 p2011）或该时间段内的任一时间
+        """
+        if not re.fullmatch(r'p\d+', str(partition)):
+            partition = self.partition_name(self.period_start(partition))
+        
+        with self.lock:
+            existing = self.list_partitions()
+            if partition not in existing:
+                logger.warning(f"分区 {partition} 不存在")
+                return False
+            
+            with self.engine.begin() as conn:
+                if self.dialect == 'mysql':
+                    conn.execute(text(f"ALTER TABLE {self._quote(self.table.name)} DROP PARTITION {partition}"))
+                else:
+                    remaining = [name for name in existing if name != partition]
+                    if not remaining:
+                        raise ValueError("不能删除最后一个分区")
+                    conn.execute(text(f"DROP TABLE {self._quote(self._table_name(partition))}"))
+                    self._rebuild_sqlite_view(conn, remaining)
+                
+                # 从汇总中减去被删除的时间段
+                start = self.partition_start(partition)
+                conn.execute(delete(WeatherRollup).where(
+                    WeatherRollup.bucket_start >= start.to_pydatetime(),
+                    WeatherRollup.bucket_start < self.next_period(start).to_pydatetime()
+                ))
+            self._known_partitions = None
+        
+        logger.info(f"已删除 {self.table.name} 分区 {partition}")
+        return True
+    
+    def source(self, start_date=None, end_date=None):
+        """查询历史天气数据时使用的实体
+        
+        MySQL由数据库按时间条件裁剪分区，直接使用原模型；SQLite只合并与时间范围相交的时间段表。
+        
+        Returns:
+            HistoricalWeather 或映射到相关时间段表的别名实体
+        """
+        if not self.enabled or self.dialect != 'sqlite' or (start_date is None and end_date is None):
+            return HistoricalWeather
+        
+        # 本进程写入时已确认过的分区列表可直接使用
+        known = self._known_partitions
+        if known is None:
+            # 时间段表只在转换为分区表后才存在
+            known = self.list_partitions()
+            if not known:
+                return HistoricalWeather
+        
+        low = self.period_start(start_date) if start_date is not None else None
+        high = self.period_start(end_date) if end_date is not None else None
+        partitions = [
+            partition for partition in sorted(known)
+            if (low is None or self.partition_start(partition) >= low)
+            and (high is None or self.partition_start(partition) <= high)
+        ]
+        if not partitions:
+            # 没有相关分区时查询一个空结果
+            partitions = sorted(known)[:1]
+        
+        # 相同分区组合复用同一个实体，语句编译结果可以被缓存
+        key = tuple(partitions)
+        if key not in self._sources:
+            selects = [select(*self._partition_table(partition).columns) for partition in partitions]
+            subquery = (union_all(*selects) if len(selects) > 1 else selects[0]).subquery(self.table.name)
+            self._sources[key] = aliased(HistoricalWeather, subquery, adapt_on_names=True)
+        return self._sources[key]
+    
+    def close(self):
+        """关闭数据库连接"""
+        self.db_manager.close()
+
+if __name__ == "__main__":
+    # 用法: python -m processing.partition_manager [enable | list | drop <分区名>]
+    manager = HistoricalPartitionManager()
+    try:
+        command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+        if command == 'enable':
+            manager.enable()
+        elif command == 'drop' and len(sys.argv) > 2:
+            manager.drop_partition(sys.argv[2])
+        for name in manager.list_partitions():
+            print(name)
+    finally:
+        manager.close()
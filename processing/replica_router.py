@@ -0,0 +1,158 @@
+import os
+import time
+import logging
+import threading
+
+from .engine_registry import registry
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class ReplicaRouter:
+    """读写分离：写入走主库，分析类读取轮流分配到只读副本
+    
+    - 连接失败的副本在 DB_REPLICA_RETRY_SECONDS（默认30秒）内不再使用，没有可用副本时读取主库
+    - 副本延迟由心跳表计算：主库的心跳时间减去副本已同步到的心跳时间。
+      主库空闲时两者相同，延迟为0；副本缺少心跳记录时延迟未知
+    - 指定最大延迟的读取（如天气预警）只使用延迟不超过该值的副本，否则读取主库
+    - 读取副本的心跳同时确认副本可用。主库心跳和各副本的检查结果在 DB_REPLICA_CHECK_SECONDS
+      （默认为心跳写入间隔 DB_HEARTBEAT_INTERVAL，未设置时1秒）内复用，读取本身不再额外访问数据库；
+      因此得到的延迟最多落后这么长时间，与心跳的精度相当
+    """
+    
+    def __init__(self, primary_engine, backends, heartbeat_query, retry_seconds=None, check_seconds=None):
+        """
+        Args:
+            primary_engine: 主库引擎
+            backends: 只读副本的数据库后端列表
+            heartbeat_query: 读取心跳时间的查询
+            retry_seconds: 连接失败的副本暂停使用的时间（秒）
+            check_seconds: 副本可用状态和延迟的缓存时间（秒），为0时每次读取都重新检查
+        """
+        self.primary = primary_engine
+        self.backends = list(backends)
+        self.engines = [registry.acquire(backend) for backend in self.backends]
+        self.heartbeat_query = heartbeat_query
+        self.retry_seconds = retry_seconds if retry_seconds is not None else float(os.getenv('DB_REPLICA_RETRY_SECONDS', 30))
+        if check_seconds is None:
+            heartbeat_interval = float(os.getenv('DB_HEARTBEAT_INTERVAL', 1))
+            check_seconds = float(os.getenv('DB_REPLICA_CHECK_SECONDS', heartbeat_interval if heartbeat_interval > 0 else 1))
+        self.check_seconds = check_seconds
+        
+        self.lock = threading.Lock()
+        self.down_until = {}
+        self.next_index = 0
+        # 最近一次检查的 (时间, 结果)：主库心跳，以及各副本的延迟
+        self.primary_checked = None
+        self.replica_checked = {}
+    
+    def _describe(self, engine):
+        return engine.url.render_as_string(hide_password=True)
+    
+    def _candidates(self):
+        """按轮询顺序返回当前未被暂停使用的副本"""
+        now = time.monotonic()
+        with self.lock:
+            start = self.next_index
+            self.next_index = (self.next_index + 1) % len(self.engines)
+            order = [(start + offset) % len(self.engines) for offset in range(len(self.engines))]
+            return [index for index in order if self.down_until.get(index, 0) <= now]
+    
+    def _mark_down(self, index, error):
+        with self.lock:
+            self.down_until[index] = time.monotonic() + self.retry_seconds
+            self.replica_checked.pop(index, None)
+        logger.warning(f"只读副本 {self._describe(self.engines[index])} 不可用，{self.retry_seconds:.0f}秒内改为读取其他副本或主库: {error}")
+    
+    def heartbeat(self, engine):
+        """读取数据库中的心跳时间，没有心跳记录时返回None"""
+        with engine.connect() as conn:
+            return conn.execute(self.heartbeat_query).scalar()
+    
+    def _fresh(self, checked):
+        return checked is not None and time.monotonic() - checked[0] < self.check_seconds
+    
+    def _primary_heartbeat(self):
+        """主库的心跳时间，check_seconds 内复用上次读取的结果"""
+        with self.lock:
+            checked = self.primary_checked
+        if self._fresh(checked):
+            return checked[1]
+        
+        beat = self.heartbeat(self.primary)
+        with self.lock:
+            self.primary_checked = (time.monotonic(), beat)
+        return beat
+    
+    def lag(self, engine):
+        """副本相对主库的延迟（秒），无法确定时返回None"""
+        try:
+            primary_beat = self._primary_heartbeat()
+        except Exception as e:
+            logger.warning(f"读取主库心跳失败: {e}")
+            return None
+        if primary_beat is None:
+            # 主库还没有写入过心跳，没有需要同步的写入
+            return 0.0
+        
+        replica_beat = self.heartbeat(engine)
+        if replica_beat is None:
+            return None
+        return max((primary_beat - replica_beat).total_seconds(), 0.0)
+    
+    def _replica_lag(self, index):
+        """副本的延迟（秒，无法确定时为None），check_seconds 内复用上次的检查结果；副本不可用时抛出异常"""
+        with self.lock:
+            checked = self.replica_checked.get(index)
+        if self._fresh(checked):
+            return checked[1]
+        
+        lag = self.lag(self.engines[index])
+        with self.lock:
+            self.replica_checked[index] = (time.monotonic(), lag)
+        return lag
+    
+    def read_engine(self, max_lag=None):
+        """选择读取使用的引擎
+        
+        Args:
+            max_lag: 允许的最大副本延迟（秒），为空时不检查延迟
+        
+        Returns:
+            可用副本的引擎，没有满足条件的副本时返回主库引擎
+        """
+        for index in self._candidates():
+            engine = self.engines[index]
+            try:
+                lag = self._replica_lag(index)
+            except Exception as e:
+                self._mark_down(index, e)
+                continue
+            
+            if max_lag is None or (lag is not None and lag <= max_lag):
+                return engine
+            logger.info(f"只读副本 {self._describe(engine)} 延迟 {lag if lag is not None else '未知'} 秒，超过 {max_lag} 秒")
+        return self.primary
+    
+    def status(self):
+        """各副本的可用状态和延迟"""
+        result = []
+        now = time.monotonic()
+        for index, engine in enumerate(self.engines):
+            with self.lock:
+                down = self.down_until.get(index, 0) > now
+            try:
+                lag = self._replica_lag(index)
+            except Exception as e:
+                lag = None
+                down = True
+                logger.warning(f"检查只读副本 {self._describe(engine)} 失败: {e}")
+            result.append({'url': self._describe(engine), 'available': not down, 'lag_seconds': lag})
+        return result
+    
+    def close(self):
+        """释放副本引擎"""
+        for engine in self.engines:
+            registry.release(engine)
+        self.engines = []
@@ -0,0 +1,242 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing.database_manager import RealTimeWeather, City, WEATHER_METRICS, raw_metric_columns, decode_metric_frame
+from processing.data_storage import WeatherDataStorage
+from processing.hot_window import hot_window
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def hourly_aggregate(frame):
+    """把原始观测按城市、小时聚合为历史数据行
+    
+    各项指标取小时内的平均值（降水量为最近1小时的累计值，取平均即该小时的估计值），
+    风向按单位向量求平均（350°与10°的平均为0°），数据源取小时内最后一条观测的数据源。
+    
+    Args:
+        frame: 原始观测（包含 city_id、source_id、timestamp 及气象指标字段）
+    
+    Returns:
+        DataFrame，timestamp 为小时开始时间
+    """
+    if frame.empty:
+        return pd.DataFrame()
+    
+    frame = frame.sort_values(['city_id', 'timestamp']).assign(
+        timestamp=pd.to_datetime(frame['timestamp']).dt.floor('h')
+    )
+    metrics = [metric for metric in WEATHER_METRICS if metric != 'wind_direction']
+    grouped = frame.groupby(['city_id', 'timestamp'])
+    result = grouped[metrics].mean()
+    result['source_id'] = grouped['source_id'].last()
+    
+    radians = np.deg2rad(frame['wind_direction'].astype('float64'))
+    vectors = pd.DataFrame({'sin': np.sin(radians), 'cos': np.cos(radians)}, index=frame.index)
+    vectors[['city_id', 'timestamp']] = frame[['city_id', 'timestamp']]
+    mean_vector = vectors.groupby(['city_id', 'timestamp'])[['sin', 'cos']].mean()
+    # 先取整再取模，避免 -0.001° 取整后成为 360°
+    result['wind_direction'] = np.rad2deg(np.arctan2(mean_vector['sin'], mean_vector['cos'])).round(WEATHER_METRICS['wind_direction'][1]) % 360
+    
+    result = result.reset_index()
+    for metric, (_, scale, _) in WEATHER_METRICS.items():
+        result[metric] = result[metric].round(scale)
+    return result
+
+class RealtimeRetentionJob:
+    """实时数据保留与降采样任务
+    
+    real_time_weather 只保留最近 REALTIME_RETENTION_HOURS 小时（默认48）的原始观测。
+    更早的观测按城市、时间段（REALTIME_COMPACTION_SLICE_DAYS 天，默认7）读取，聚合为逐小时数据后
+    经 WeatherDataStorage 批量写入 historical_weather（已有的小时不覆盖，汇总表和分区照常维护），
+    全部写入成功（没有被隔离的行）后按时间顺序分批删除读取过的原始观测（每批 REALTIME_DELETE_BATCH 行，默认5000），
+    每批一个短事务，读取之后新写入或被更新的观测不会被删除。
+    
+    任务可重复执行：中途失败时已写入的小时会被跳过，未删除的原始观测在下次运行时继续处理。
+    """
+    
+    def __init__(self, storage=None, retention_hours=None, slice_days=None, delete_batch=None):
+        self.storage = storage or WeatherDataStorage()
+        self.db_manager = self.storage.db_manager
+        self.retention_hours = retention_hours or float(os.getenv('REALTIME_RETENTION_HOURS', 48))
+        self.slice_days = slice_days or int(os.getenv('REALTIME_COMPACTION_SLICE_DAYS', 7))
+        self.delete_batch = delete_batch or int(os.getenv('REALTIME_DELETE_BATCH', 5000))
+    
+    def cutoff(self, now=None):
+        """保留窗口的起点（取整到小时，早于该时间的观测被压缩）"""
+        return pd.Timestamp((now or datetime.now()) - timedelta(hours=self.retention_hours)).floor('h').to_pydatetime()
+    
+    def _oldest_timestamp(self, city_id, cutoff, after=None):
+        """城市早于保留窗口（且不早于 after）的最早观测时间（按 (city_id, timestamp) 索引查找）"""
+        session = self.db_manager.get_session()
+        try:
+            query = select(func.min(RealTimeWeather.timestamp)).where(
+                RealTimeWeather.city_id == city_id, RealTimeWeather.timestamp < cutoff
+            )
+            if after is not None:
+                query = query.where(RealTimeWeather.timestamp >= after)
+            return session.execute(query).scalar()
+        finally:
+            session.close()
+    
+    def _observation_query(self, city_id):
+        """读取一个城市原始观测的查询（存储值整列读取，由 decode_metric_frame 转换）"""
+        return select(
+            RealTimeWeather.city_id, RealTimeWeather.source_id, RealTimeWeather.timestamp,
+            *raw_metric_columns(RealTimeWeather)
+        ).where(RealTimeWeather.city_id == city_id)
+    
+    def _read_slice(self, city_id, start, end):
+        """读取一个城市一个时间段内的原始观测"""
+        session = self.db_manager.get_session()
+        try:
+            result = session.execute(
+                self._observation_query(city_id)
+                .where(RealTimeWeather.timestamp >= start, RealTimeWeather.timestamp < end)
+                .order_by(RealTimeWeather.timestamp)
+            )
+            return decode_metric_frame(pd.DataFrame(result.all(), columns=list(result.keys())), RealTimeWeather)
+        finally:
+            session.close()
+    
+    def _delete_rows(self, city_id, raw):
+        """按时间顺序分批删除已压缩的原始观测，只删除读取并聚合过的键
+        
+        每批一个事务：先重新读取（MySQL下加行锁）本批的键，数据与聚合时读取的一致才删除。
+        读取之后新写入的观测不在键列表中，读取之后被更新的观测与读取时不一致，两者都会保留。
+        
+        Args:
+            city_id: 城市ID
+            raw: 已聚合的原始观测（_read_slice 的结果）
+        
+        Returns:
+            删除的行数
+        """
+        columns = ['source_id', *WEATHER_METRICS]
+        raw = raw.sort_values('timestamp')
+        deleted = 0
+        for start in range(0, len(raw), self.delete_batch):
+            batch = raw.iloc[start:start + self.delete_batch]
+            timestamps = [timestamp.to_pydatetime() for timestamp in pd.to_datetime(batch['timestamp'])]
+            with self.db_manager.engine.begin() as conn:
+                result = conn.execute(
+                    self._observation_query(city_id)
+                    .where(RealTimeWeather.timestamp.in_(timestamps))
+                    .with_for_update()
+                )
+                current = decode_metric_frame(pd.DataFrame(result.all(), columns=list(result.keys())), RealTimeWeather)
+                merged = batch.merge(current, on='timestamp', suffixes=('', '_current'))
+                unchanged = np.ones(len(merged), dtype=bool)
+                for column in columns:
+                    read, now = merged[column], merged[f'{column}_current']
+                    unchanged &= ((read == now) | (read.isna() & now.isna())).to_numpy()
+                
+                keys = [timestamp.to_pydatetime() for timestamp in pd.to_datetime(merged.loc[unchanged, 'timestamp'])]
+                if len(keys) < len(batch):
+                    logger.warning(f"城市 {city_id} 有 {len(batch) - len(keys)} 条原始观测在压缩期间被修改或删除，保留到下次运行")
+                if keys:
+                    result = conn.execute(
+                        delete(RealTimeWeather).where(
+                            RealTimeWeather.city_id == city_id,
+                            RealTimeWeather.timestamp.in_(keys)
+                        )
+                    )
+                    deleted += result.rowcount
+        return deleted
+    
+    def compact_city(self, city_id, cutoff):
+        """压缩一个城市早于保留窗口的原始观测
+        
+        Returns:
+            (原始观测行数, 聚合后的小时数, 写入历史表的行数, 删除的行数)
+        """
+        totals = np.zeros(4, dtype=int)
+        oldest = self._oldest_timestamp(city_id, cutoff)
+        while oldest is not None:
+            # 每个时间段从下一条观测所在的小时开始，跳过没有数据的时间
+            start = pd.Timestamp(oldest).floor('h').to_pydatetime()
+            end = min(start + timedelta(days=self.slice_days), cutoff)
+            raw = self._read_slice(city_id, start, end)
+            if not raw.empty:
+                hourly = hourly_aggregate(raw)
+                success, stored = self.storage.store_historical_weather(hourly)
+                quarantined = self.storage.last_quarantined_count
+                if not success or quarantined:
+                    # 写入失败或有小时数据被隔离时保留原始观测，下次运行重试
+                    logger.error(f"城市 {city_id} {start} ~ {end} 的小时数据写入失败（隔离 {quarantined} 条），保留原始观测")
+                    break
+                deleted = self._delete_rows(city_id, raw)
+                # 已删除的原始观测同时移出热数据窗口
+                hot_window(self.db_manager.engine, RealTimeWeather.__tablename__).discard_before(city_id, end)
+                totals += (len(raw), len(hourly), stored, deleted)
+            oldest = self._oldest_timestamp(city_id, cutoff, after=end)
+        return tuple(totals)
+    
+    def run(self, now=None, city_ids=None):
+        """执行一次压缩
+        
+        Args:
+            now: 当前时间（默认为系统时间）
+            city_ids: 需要处理的城市ID列表，为空时处理所有城市
+        
+        Returns:
+            各项统计的字典
+        """
+        cutoff = self.cutoff(now)
+        if city_ids is None:
+            session = self.db_manager.get_session()
+            try:
+                city_ids = session.execute(select(City.city_id).order_by(City.city_id)).scalars().all()
+            finally:
+                session.close()
+        
+        started = time.perf_counter()
+        summary = {'cutoff': cutoff, 'raw_rows': 0, 'hourly_rows': 0, 'stored': 0, 'deleted': 0}
+        for city_id in city_ids:
+            raw_rows, hourly_rows, stored, deleted = self.compact_city(city_id, cutoff)
+            summary['raw_rows'] += int(raw_rows)
+            summary['hourly_rows'] += int(hourly_rows)
+            summary['stored'] += int(stored)
+            summary['deleted'] += int(deleted)
+            if raw_rows:
+                logger.info(f"城市 {city_id}: 压缩 {raw_rows} 条原始观测为 {hourly_rows} 小时，写入 {stored} 条，删除 {deleted} 条")
+        
+        logger.info(f"实时数据压缩完成（保留 {cutoff} 之后的观测），耗时 {time.perf_counter() - started:.2f}s: {summary}")
+        return summary
+    
+    def close(self):
+        """关闭数据存储"""
+        self.storage.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='实时数据保留与降采样：过期的原始观测聚合为逐小时数据写入历史表后删除')
+    parser.add_argument('--loop', action='store_true', help='持续运行，每隔 --interval 秒执行一次（默认只执行一次，可由cron调度）')
+    parser.add_argument('--interval', type=float, default=float(os.getenv('REALTIME_COMPACTION_INTERVAL', 3600)), help='持续运行时的执行间隔（秒）')
+    args = parser.parse_args()
+    
+    job = RealtimeRetentionJob()
+    try:
+        while True:
+            job.run()
+            if not args.loop:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        logger.info("实时数据压缩任务已停止")
+    finally:
+        job.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import logging
+from sqlalchemy import MetaData, Integer, inspect, text
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing.database_manager import DatabaseManager, RealTimeWeather, HistoricalWeather, WeatherRollup, ScaledInteger, WEATHER_METRICS
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 已被新索引取代、迁移时删除的旧索引
+RETIRED_INDEXES = {
+    'weather_rollups': ['uq_rollup_bucket']
+}
+
+class SchemaMigrator:
+    """按当前模型定义重建已有的表（复制后替换）
+    
+    新表先以临时表名创建，数据通过一条 INSERT ... SELECT 复制（两边都有的字段按名称对应，
+    指标在放大整数与定点数/浮点数之间转换时按旧字段的类型在SQL中换算），行数核对一致后替换旧表，最后按模型重建索引。
+    只有索引不一致时不复制数据，直接创建缺少的索引、删除已废弃的索引。
+    """
+    
+    def __init__(self, db_manager=None):
+        self.db_manager = db_manager or DatabaseManager()
+        self.engine = self.db_manager.engine
+        self.dialect = self.engine.dialect
+    
+    def _quote(self, name):
+        return self.dialect.identifier_preparer.quote(name)
+    
+    def pending_changes(self, model):
+        """对比数据库中的表与模型定义，返回需要变更的说明列表（为空表示无需迁移）"""
+        table = model.__table__
+        inspector = inspect(self.engine)
+        if not inspector.has_table(table.name):
+            return []
+        if table.name in inspector.get_view_names():
+            # SQLite按时间分区后原表名是视图，由分区管理维护各时间段表
+            logger.warning(f"{table.name} 为分区视图，跳过迁移")
+            return []
+        
+        existing = {column['name']: column for column in inspector.get_columns(table.name)}
+        changes = []
+        for column in table.columns:
+            if column.name not in existing:
+                changes.append(f"新增字段 {column.name}")
+                continue
+            # 按类型大类（整数/浮点/定点数等）比较，忽略各数据库反射出的长度写法差异
+            current_type = existing[column.name]['type']
+            if current_type._type_affinity is not column.type._type_affinity:
+                changes.append(f"字段 {column.name}: {current_type} -> {column.type.compile(dialect=self.dialect)}")
+        for name in existing:
+            if name not in table.columns:
+                changes.append(f"删除字段 {name}")
+        
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                changes.append(f"缺少索引 {index.name}")
+        for name in RETIRED_INDEXES.get(table.name, []):
+            if name in existing_indexes:
+                changes.append(f"废弃索引 {name}")
+        
+        primary_key = inspector.get_pk_constraint(table.name).get('constrained_columns', [])
+        if list(primary_key) != [column.name for column in table.primary_key.columns]:
+            changes.append(f"主键: {primary_key} -> {[column.name for column in table.primary_key.columns]}")
+        return changes
+    
+    def _copy_expression(self, column, current_type):
+        """复制数据时读取旧字段的表达式
+        
+        Args:
+            column: 模型中的字段
+            current_type: 数据库中旧字段的类型（反射得到）
+        """
+        name = self._quote(column.name)
+        if column.name not in WEATHER_METRICS:
+            return name
+        # 放大整数的类型大类为整数，按旧字段和新字段是否为整数判断是否需要换算
+        factor = 10 ** WEATHER_METRICS[column.name][1]
+        was_scaled = current_type._type_affinity is Integer
+        if isinstance(column.type, ScaledInteger) and not was_scaled:
+            return f"ROUND({name} * {factor})"
+        if was_scaled and column.type._type_affinity is not Integer:
+            return f"{name} / {factor}.0"
+        return name
+    
+    def rebuild_table(self, model):
+        """按模型定义重建表
+        
+        Returns:
+            复制的行数
+        """
+        table = model.__table__
+        new_name = f"{table.name}_new"
+        old_name = f"{table.name}_old"
+        start = time.perf_counter()
+        
+        existing_columns = {column['name']: column['type'] for column in inspect(self.engine).get_columns(table.name)}
+        copy_columns = [column for column in table.columns if column.name in existing_columns]
+        
+        # 临时表不带索引：SQLite的索引名在整个库内唯一，替换后再按模型建索引
+        metadata = MetaData()
+        # 外键引用的表一并放入临时元数据（只用于解析外键，不会创建）
+        for foreign_key in table.foreign_keys:
+            foreign_key.column.table.to_metadata(metadata)
+        new_table = table.to_metadata(metadata, name=new_name)
+        new_table.indexes.clear()
+        
+        with self.engine.begin() as conn:
+            new_table.drop(conn, checkfirst=True)
+            new_table.create(conn)
+            
+            column_list = ', '.join(self._quote(column.name) for column in copy_columns)
+            select_list = ', '.join(self._copy_expression(column, existing_columns[column.name]) for column in copy_columns)
+            conn.execute(text(
+                f"INSERT INTO {self._quote(new_name)} ({column_list}) "
+                f"SELECT {select_list} FROM {self._quote(table.name)}"
+            ))
+            
+            # 核对行数后再替换
+            old_count = conn.execute(text(f"SELECT COUNT(*) FROM {self._quote(table.name)}")).scalar()
+            new_count = conn.execute(text(f"SELECT COUNT(*) FROM {self._quote(new_name)}")).scalar()
+            if old_count != new_count:
+                raise RuntimeError(f"{table.name} 复制后行数不一致: {old_count} != {new_count}")
+            
+            if self.dialect.name == 'mysql':
+                # MySQL的多表RENAME是原子操作
+                conn.execute(text(
+                    f"RENAME TABLE {self._quote(table.name)} TO {self._quote(old_name)}, "
+                    f"{self._quote(new_name)} TO {self._quote(table.name)}"
+                ))
+            else:
+                conn.execute(text(f"ALTER TABLE {self._quote(table.name)} RENAME TO {self._quote(old_name)}"))
+                conn.execute(text(f"ALTER TABLE {self._quote(new_name)} RENAME TO {self._quote(table.name)}"))
+            conn.execute(text(f"DROP TABLE {self._quote(old_name)}"))
+            
+            for index in table.indexes:
+                index.create(conn)
+        
+        logger.info(f"表 {table.name} 重建完成，复制 {new_count} 行，耗时 {time.perf_counter() - start:.2f}s")
+        return new_count
+    
+    def sync_indexes(self, model):
+        """创建缺少的索引、删除已废弃的索引（不复制数据）
+        
+        Returns:
+            变更的索引数
+        """
+        table = model.__table__
+        existing_indexes = {index['name'] for index in inspect(self.engine).get_indexes(table.name)}
+        changed = 0
+        with self.engine.begin() as conn:
+            # 先建新索引再删旧索引，替换期间查询始终有可用的索引
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    start = time.perf_counter()
+                    index.create(conn)
+                    changed += 1
+                    logger.info(f"表 {table.name} 创建索引 {index.name}，耗时 {time.perf_counter() - start:.2f}s")
+            for name in RETIRED_INDEXES.get(table.name, []):
+                if name in existing_indexes:
+                    if self.dialect.name == 'mysql':
+                        conn.execute(text(f"DROP INDEX {self._quote(name)} ON {self._quote(table.name)}"))
+                    else:
+                        conn.execute(text(f"DROP INDEX {self._quote(name)}"))
+                    changed += 1
+                    logger.info(f"表 {table.name} 删除废弃索引 {name}")
+        return changed
+    
+    def migrate(self, models=(RealTimeWeather, HistoricalWeather, WeatherRollup), dry_run=False):
+        """迁移与模型定义不一致的表
+        
+        Returns:
+            {表名: 变更说明列表}
+        """
+        plan = {}
+        for model in models:
+            changes = self.pending_changes(model)
+            if not changes:
+                logger.info(f"表 {model.__tablename__} 与模型定义一致，无需迁移")
+                continue
+            plan[model.__tablename__] = changes
+            logger.info(f"表 {model.__tablename__} 需要迁移: {'; '.join(changes)}")
+            if dry_run:
+                continue
+            if all(change.startswith(('缺少索引', '废弃索引')) for change in changes):
+                self.sync_indexes(model)
+            else:
+                self.rebuild_table(model)
+        return plan
+    
+    def close(self):
+        self.db_manager.close()
+
+if __name__ == "__main__":
+    # 按当前配置（如 DB_METRIC_STORAGE）迁移气象数据表，加 --dry-run 只输出变更
+    migrator = SchemaMigrator()
+    try:
+        migrator.migrate(dry_run='--dry-run' in sys.argv)
+    finally:
+        migrator.close()
@@ -0,0 +1,262 @@
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, delete, func
+
+from .database_manager import (DatabaseManager, HistoricalWeather, City, WeatherRollup, WEATHER_METRICS,
+                               raw_metric_columns, decode_metric_frame)
+from .city_catalog import city_id_map
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 汇总的时间粒度
+ROLLUP_GRAINS = ('day', 'month')
+
+# 汇总表的唯一键
+ROLLUP_KEY_COLUMNS = ['grain', 'metric', 'city_id', 'bucket_start']
+
+def bucket_start(timestamps, grain):
+    """观测时间所在时间段的开始时间"""
+    day = timestamps.dt.normalize()
+    if grain == 'day':
+        return day
+    elif grain == 'month':
+        return day - pd.to_timedelta(timestamps.dt.day - 1, unit='D')
+    raise ValueError(f"不支持的汇总粒度: {grain}")
+
+def rollup_statistics(df):
+    """由汇总行（read_query 的结果）计算平均值和标准差
+    
+    Returns:
+        DataFrame（city_id、city_name、bucket_start、count、mean、max、min、std），没有汇总数据时为空
+    """
+    if df.empty:
+        return df
+    
+    count = df['value_count'].astype('float64')
+    total = df['value_sum'].astype('float64')
+    # 样本标准差（与 pandas 的 std 一致），单个观测时为空
+    variance = (df['value_sum_sq'].astype('float64') - total ** 2 / count) / (count - 1)
+    return pd.DataFrame({
+        'city_id': df['city_id'],
+        'city_name': df['city_name'],
+        'bucket_start': pd.to_datetime(df['bucket_start']),
+        'count': df['value_count'],
+        'mean': total / count,
+        'max': df['value_max'].astype('float64'),
+        'min': df['value_min'].astype('float64'),
+        'std': np.sqrt(variance.clip(lower=0)).where(count > 1)
+    })
+
+class WeatherRollupManager:
+    """按 城市/指标/天、月 增量维护历史气象数据的汇总
+    
+    每个时间段保存观测数、和、平方和、最小值和最大值，新写入的观测在同一事务中累加到对应时间段
+    （迟到的数据同样累加到它所属的时间段）。平均值和标准差都可以由这些量算出，
+    按天、按月的分析读取汇总行即可，无需扫描逐小时的原始数据。
+    历史数据只插入新观测、不修改已有观测，累加结果与重新全量计算一致。
+    """
+    
+    def __init__(self, db_manager=None):
+        self.db_manager = db_manager or DatabaseManager()
+        self._statement = None
+    
+    @property
+    def statement(self):
+        """累加写入汇总行的语句"""
+        if self._statement is None:
+            self._statement = self.db_manager.accumulate_statement(
+                WeatherRollup, ROLLUP_KEY_COLUMNS,
+                sum_columns=['value_count', 'value_sum', 'value_sum_sq'],
+                min_columns=['value_min'],
+                max_columns=['value_max'],
+                set_columns=['updated_at']
+            )
+        return self._statement
+    
+    def build_rollups(self, frame):
+        """把一批观测汇总为各时间粒度的汇总行
+        
+        Args:
+            frame: 观测数据（包含 city_id、timestamp 及气象指标字段）
+        
+        Returns:
+            DataFrame，字段与 weather_rollups 表一致（不含自增ID和更新时间）
+        """
+        if frame is None or frame.empty:
+            return pd.DataFrame()
+        metrics = [metric for metric in WEATHER_METRICS if metric in frame.columns]
+        if not metrics:
+            return pd.DataFrame()
+        
+        values = frame[['city_id', 'timestamp'] + metrics].melt(
+            id_vars=['city_id', 'timestamp'], var_name='metric', value_name='value'
+        ).dropna(subset=['value'])
+        if values.empty:
+            return pd.DataFrame()
+        
+        values['timestamp'] = pd.to_datetime(values['timestamp'])
+        values['value'] = values['value'].astype('float64')
+        values['value_sq'] = values['value'] ** 2
+        
+        rollups = []
+        for grain in ROLLUP_GRAINS:
+            grouped = values.assign(bucket_start=bucket_start(values['timestamp'], grain)).groupby(
+                ['city_id', 'metric', 'bucket_start']
+            ).agg(
+                value_count=('value', 'size'),
+                value_sum=('value', 'sum'),
+                value_sum_sq=('value_sq', 'sum'),
+                value_min=('value', 'min'),
+                value_max=('value', 'max')
+            ).reset_index()
+            grouped['grain'] = grain
+            rollups.append(grouped)
+        
+        result = pd.concat(rollups, ignore_index=True)
+        result['city_id'] = result['city_id'].astype(int)
+        # 按唯一键排序，并发写入时以相同顺序加锁
+        return result.sort_values(ROLLUP_KEY_COLUMNS).reset_index(drop=True)
+    
+    def apply(self, session, frame):
+        """在调用方的事务中把一批新观测累加到汇总表
+        
+        Returns:
+            写入（新增或累加）的汇总行数
+        """
+        rollups = self.build_rollups(frame)
+        if rollups.empty:
+            return 0
+        
+        records = rollups.astype(object).to_dict('records')
+        now = datetime.now()
+        for record in records:
+            record['bucket_start'] = record['bucket_start'].to_pydatetime()
+            record['updated_at'] = now
+        session.execute(self.statement, records)
+        return len(records)
+    
+    def read_query(self, metric, grain, city_id=None):
+        """读取汇总行的查询（按城市、时间段排序）"""
+        query = select(
+            WeatherRollup.city_id, City.city_name, WeatherRollup.bucket_start,
+            WeatherRollup.value_count, WeatherRollup.value_sum, WeatherRollup.value_sum_sq,
+            WeatherRollup.value_min, WeatherRollup.value_max
+        ).join(
+            City, WeatherRollup.city_id == City.city_id
+        ).where(
+            WeatherRollup.grain == grain, WeatherRollup.metric == metric
+        ).order_by(WeatherRollup.city_id, WeatherRollup.bucket_start)
+        if city_id is not None:
+            query = query.where(WeatherRollup.city_id == city_id)
+        return query
+    
+    def read(self, metric, grain, city_name=None):
+        """读取汇总数据并计算平均值和标准差
+        
+        Args:
+            metric: 指标名称
+            grain: 时间粒度（day/month）
+            city_name: 城市名称，为空时读取所有城市
+        
+        Returns:
+            DataFrame（city_id、city_name、bucket_start、count、mean、max、min、std），没有汇总数据时为空
+        """
+        city_id = None
+        if city_name:
+            city_id = city_id_map(self.db_manager.engine).lookup(city_name)
+            if city_id is None:
+                return pd.DataFrame()
+        
+        with self.db_manager.session_scope(read_only=True) as session:
+            result = session.execute(self.read_query(metric, grain, city_id))
+            df = pd.DataFrame(result.all(), columns=list(result.keys()))
+        
+        return rollup_statistics(df)
+    
+    def incomplete_cities(self):
+        """汇总的观测数与历史数据表不一致的城市ID
+        
+        启用汇总前已入库的数据、直接写入历史数据表（未经 WeatherDataStorage）的数据都不在汇总中。
+        按城市、指标比较历史数据表的非空观测数和按天汇总的观测数之和，两次计数各为一次分组查询。
+        """
+        metrics = list(WEATHER_METRICS)
+        with self.db_manager.engine.connect() as conn:
+            result = conn.execute(
+                select(HistoricalWeather.city_id, *[func.count(getattr(HistoricalWeather, metric)) for metric in metrics])
+                .group_by(HistoricalWeather.city_id)
+            )
+            observed = pd.DataFrame(result.all(), columns=['city_id'] + metrics).melt(
+                id_vars='city_id', var_name='metric', value_name='observed'
+            )
+            result = conn.execute(
+                select(WeatherRollup.city_id, WeatherRollup.metric, func.sum(WeatherRollup.value_count))
+                .where(WeatherRollup.grain == 'day')
+                .group_by(WeatherRollup.city_id, WeatherRollup.metric)
+            )
+            rolled = pd.DataFrame(result.all(), columns=['city_id', 'metric', 'rolled'])
+        
+        merged = observed.merge(rolled, on=['city_id', 'metric'], how='outer')
+        merged = merged.fillna({'observed': 0, 'rolled': 0})
+        mismatched = merged['observed'].astype('int64') != merged['rolled'].astype('int64')
+        return sorted(int(city_id) for city_id in merged.loc[mismatched, 'city_id'].unique())
+    
+    def ensure_complete(self):
+        """重建汇总与历史数据表不一致的城市（应在没有写入时运行，如初始化数据库时）
+        
+        Returns:
+            重建的城市ID列表
+        """
+        city_ids = self.incomplete_cities()
+        if city_ids:
+            logger.info(f"{len(city_ids)} 个城市的汇总与历史数据不一致，开始重建: {city_ids[:10]}")
+            self.rebuild(city_ids)
+        return city_ids
+    
+    def rebuild(self, city_ids=None):
+        """由历史数据表重新计算汇总（用于启用汇总前已存在的数据）
+        
+        Args:
+            city_ids: 需要重建的城市ID列表，为空时重建所有城市
+        
+        Returns:
+            写入的汇总行数
+        """
+        session = self.db_manager.get_session()
+        try:
+            if city_ids is None:
+                city_ids = session.execute(select(HistoricalWeather.city_id).distinct()).scalars().all()
+            
+            written = 0
+            for city_id in city_ids:
+                session.execute(delete(WeatherRollup).where(WeatherRollup.city_id == city_id))
+                result = session.execute(
+                    select(HistoricalWeather.city_id, HistoricalWeather.timestamp, *raw_metric_columns(HistoricalWeather))
+                    .where(HistoricalWeather.city_id == city_id)
+                )
+                frame = decode_metric_frame(pd.DataFrame(result.all(), columns=list(result.keys())), HistoricalWeather)
+                written += self.apply(session, frame)
+                session.commit()
+                logger.info(f"城市 {city_id} 的汇总重建完成，{len(frame)} 条观测")
+            return written
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    
+    def close(self):
+        """关闭数据库连接"""
+        self.db_manager.close()
+
+if __name__ == "__main__":
+    # 由历史数据表重建全部汇总
+    manager = WeatherRollupManager()
+    try:
+        count = manager.rebuild()
+        logger.info(f"汇总重建完成，共写入 {count} 行")
+    finally:
+        manager.close()
@@ -0,0 +1,199 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+
+from .data_storage import WeatherDataStorage
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 队列中的控制消息
+_FLUSH = 'flush'
+_STOP = 'stop'
+
+class GroupCommitWriter:
+    """组提交写入服务：多个生产者通过进程内队列提交数据，由单个写入线程合并后批量入库
+    
+    写入线程从队列取出第一批数据后开始计时，在达到最大行数或最大等待时间前继续合并后续提交的数据，
+    然后按数据类型合并为一次批量写入。每次提交返回一个 Future，数据提交到数据库后才会完成，
+    结果为 (是否成功, 本批已提交的行数, 本批被隔离的行数)。
+    
+    合并后的数据仍按分块逐块提交，写入线程通过存储的提交和隔离监听器按行号把结果归到各批次：
+    后面的分块写入失败时，已全部提交（或隔离）的批次仍然成功，只有包含未处理行的批次失败。
+    历史数据中已存在而跳过的行和被批内后续数据覆盖的实时数据行不计入已提交的行数。
+    """
+    
+    def __init__(self, storage=None, max_rows=None, max_latency_ms=None, queue_size=None):
+        self.storage = storage or WeatherDataStorage()
+        self.max_rows = max_rows or int(os.getenv('WRITER_MAX_ROWS', 5000))
+        self.max_latency = (max_latency_ms or int(os.getenv('WRITER_MAX_LATENCY_MS', 200))) / 1000
+        self.queue = queue.Queue(maxsize=queue_size or int(os.getenv('WRITER_QUEUE_SIZE', 1000)))
+        self.closed = False
+        # 写入线程当前这次写入的已提交、已隔离行号，只在写入线程中访问
+        self._outcome = None
+        self.storage.add_commit_listener(self._on_commit)
+        self.storage.add_quarantine_listener(self._on_quarantine)
+        self.thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+        self.thread.start()
+    
+    def submit(self, data_type, df):
+        """提交一批已预处理的数据
+        
+        Args:
+            data_type: 数据类型 (realtime, historical, extreme)
+            df: 已预处理的数据
+        
+        Returns:
+            Future，数据写入完成后结果为 (是否成功, 本批已提交的行数, 本批被隔离的行数)
+        """
+        if self.closed:
+            raise RuntimeError("写入服务已关闭")
+        
+        future = Future()
+        if df is None or df.empty:
+            future.set_result((True, 0, 0))
+            return future
+        
+        # 队列已满时阻塞生产者（背压）
+        self.queue.put((data_type, df, future))
+        return future
+    
+    def flush(self, timeout=None):
+        """立即写入队列中已提交的数据，并等待写入完成"""
+        future = Future()
+        self.queue.put((_FLUSH, None, future))
+        return future.result(timeout)
+    
+    def close(self, timeout=None):
+        """写入剩余数据后停止写入线程"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put((_STOP, None, None))
+        self.thread.join(timeout)
+    
+    def _collect_group(self, first):
+        """从第一批数据开始合并后续提交，直到达到最大行数或最大等待时间
+        
+        Returns:
+            (合并的批次列表, 控制消息列表)
+        """
+        group = [first]
+        controls = []
+        rows = len(first[1])
+        deadline = time.monotonic() + self.max_latency
+        
+        while rows < self.max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            
+            if item[0] in (_FLUSH, _STOP):
+                # 遇到控制消息时立即写入已合并的数据
+                controls.append(item)
+                break
+            group.append(item)
+            rows += len(item[1])
+        
+        return group, controls
+    
+    def _on_commit(self, target_table, frame):
+        """提交监听器：记录写入线程本次写入中已提交的行号"""
+        if self._outcome is not None and threading.current_thread() is self.thread:
+            self._outcome['committed'].append(frame.index.to_numpy())
+    
+    def _on_quarantine(self, target_table, rows):
+        """隔离监听器：记录写入线程本次写入中被隔离的行号"""
+        if self._outcome is not None and threading.current_thread() is self.thread:
+            self._outcome['quarantined'].append(rows.index.to_numpy())
+    
+    def _batch_results(self, batches, success, outcome):
+        """按行号把一次写入的结果归到各批次
+        
+        合并数据的行号为 0..n-1，各批次依次占用一段连续的行号。分块按行号顺序提交，
+        写入失败时只有最后一个已提交或已隔离的行之前的批次视为成功。
+        
+        Returns:
+            [(是否成功, 已提交的行数, 被隔离的行数)]，与 batches 顺序一致
+        """
+        lengths = [len(df) for df, _ in batches]
+        owners = np.repeat(np.arange(len(batches)), lengths)
+        counts = {}
+        handled_end = 0
+        for key in ('committed', 'quarantined'):
+            labels = np.concatenate(outcome[key]).astype(np.int64) if outcome[key] else np.empty(0, dtype=np.int64)
+            counts[key] = np.bincount(owners[labels], minlength=len(batches))
+            if len(labels):
+                handled_end = max(handled_end, int(labels.max()) + 1)
+        
+        ends = np.cumsum(lengths)
+        return [(bool(success or ends[i] <= handled_end), int(counts['committed'][i]), int(counts['quarantined'][i]))
+                for i in range(len(batches))]
+    
+    def _write_group(self, group):
+        """按数据类型合并一组批次并写入，完成后通知各批次的 Future"""
+        batches_by_type = {}
+        for data_type, df, future in group:
+            batches_by_type.setdefault(data_type, []).append((df, future))
+        
+        for data_type, batches in batches_by_type.items():
+            frames = [df for df, _ in batches]
+            start = time.perf_counter()
+            self._outcome = {'committed': [], 'quarantined': []}
+            try:
+                # 保持提交顺序合并（行号重排为 0..n-1），实时数据同一键以最后一次提交为准
+                combined = pd.concat(frames, ignore_index=True)
+                success, stored, updated = self.storage.store_processed_data(combined, data_type)
+                logger.info(f"组提交写入{data_type}数据完成，合并 {len(batches)} 批共 {len(combined)} 行，"
+                            f"新增: {stored}条，更新: {updated}条，隔离: {self.storage.last_quarantined_count}条，耗时 {time.perf_counter() - start:.3f}s")
+            except Exception as e:
+                logger.error(f"组提交写入{data_type}数据失败: {e}")
+                success = False
+            finally:
+                outcome, self._outcome = self._outcome, None
+            
+            for (_, future), result in zip(batches, self._batch_results(batches, success, outcome)):
+                future.set_result(result)
+    
+    def _run(self):
+        """写入线程主循环"""
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item[0] in (_FLUSH, _STOP):
+                group, controls = [], [item]
+            else:
+                group, controls = self._collect_group(item)
+            
+            if group:
+                self._write_group(group)
+            
+            for control, _, future in controls:
+                if control == _FLUSH:
+                    future.set_result(True)
+                else:
+                    stopping = True
+        
+        # 关闭前写入队列中剩余的数据
+        remaining = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item[0] == _FLUSH:
+                item[2].set_result(True)
+            elif item[0] != _STOP:
+                remaining.append(item)
+        if remaining:
+            self._write_group(remaining)
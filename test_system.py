@@ -1,7 +1,13 @@
 import os
 import sys
 import logging
+import asyncio
+import sqlite3
+import tempfile
+import subprocess
+import threading
 import pandas as pd
+from sqlalchemy import create_engine, event, func, insert, inspect, select, text
 from datetime import datetime, timedelta
 
 # 配置日志
@@ -13,8 +19,26 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # 导入模块
 from processing.data_preprocessor import WeatherDataPreprocessor
-from processing.database_manager import DatabaseManager
-from processing.data_storage import WeatherDataStorage
+from processing.database_manager import (DatabaseManager, QuarantinedRow, RealTimeWeather, HistoricalWeather, ExtremeEvent,
+                                         raw_metric_columns, decode_metric_frame)
+from processing.db_backends import SQLiteBackend
+from processing.engine_registry import TimedQueuePool, registry
+from processing.schema_migration import SchemaMigrator
+from processing.partition_manager import HistoricalPartitionManager
+from processing.weather_rollups import WeatherRollupManager
+from processing.data_storage import WeatherDataStorage, csv_row_offset, iter_csv_chunks
+from processing.write_service import GroupCommitWriter
+from processing.cleaning_log_sink import CleaningLogSink
+from processing.parallel_loader import ParallelCSVLoader
+from processing.ingest_pipeline import WeatherIngestPipeline
+from processing.parquet_lake import ParquetLake
+from processing.extreme_event_loader import ExtremeEventLoader
+from processing.retention import RealtimeRetentionJob
+from processing.hot_window import HotWindow, HOT_WINDOW_ENABLED, hot_window
+from processing.city_catalog import CityIdMap, city_id_map, load_catalog, read_catalog
+from analysis.query_plans import QueryPlanChecker
+from analysis.data_analyzer import WeatherDataAnalyzer
+from analysis.async_data_access import AsyncWeatherDataAccess
 
 def test_data_preprocessing():
     """测试数据预处理功能"""
@@ -86,6 +110,372 @@ def test_database_init():
         logger.error(f"数据库初始化测试失败: {e}", exc_info=True)
         return False, None
 
+def test_sqlite_backend():
+    """测试SQLite后端（WAL模式及连接参数、建表和批量upsert）"""
+    logger.info("=== 开始测试SQLite后端 ===")
+    
+    try:
+        backend = SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))
+        db_manager = DatabaseManager(backend)
+        init_success = db_manager.init_database()
+        
+        with db_manager.engine.connect() as conn:
+            journal_mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+            foreign_keys = conn.execute(text("PRAGMA foreign_keys")).scalar()
+        
+        row = {'city_id': 1, 'source_id': 1, 'timestamp': datetime(2009, 1, 1), 'temperature': 1.0, 'status': 1}
+        stmt = db_manager.upsert_statement(RealTimeWeather, ['city_id', 'timestamp'], ['temperature'])
+        with db_manager.engine.begin() as conn:
+            conn.execute(stmt, [row])
+            conn.execute(stmt, [dict(row, temperature=2.0)])
+            temperature = conn.execute(select(RealTimeWeather.temperature)).scalar()
+        db_manager.close()
+        
+        if init_success and journal_mode == 'wal' and foreign_keys == 1 and float(temperature) == 2.0:
+            logger.info("SQLite后端测试通过")
+            return True
+        else:
+            logger.error(f"SQLite后端结果不符合预期: journal_mode={journal_mode}, foreign_keys={foreign_keys}")
+            return False
+    except Exception as e:
+        logger.error(f"SQLite后端测试失败: {e}", exc_info=True)
+        return False
+
+def test_station_catalog():
+    """测试站点目录批量写入城市表及进程内城市ID映射的刷新"""
+    logger.info("=== 开始测试站点目录与城市ID映射 ===")
+    
+    try:
+        directory = tempfile.mkdtemp()
+        db_manager = DatabaseManager(SQLiteBackend(path=os.path.join(directory, 'weather_data.db')))
+        db_manager.init_database()
+        
+        # 默认目录的城市之外再加入2000个站点
+        stations = pd.DataFrame({
+            'city_id': range(1001, 3001),
+            'city_name': [f'station_{i}' for i in range(1001, 3001)],
+            'city_code': [f'ST{i}' for i in range(1001, 3001)],
+            'latitude': [20 + i / 1000 for i in range(2000)],
+            'longitude': [100 + i / 1000 for i in range(2000)]
+        })
+        catalog = pd.concat([read_catalog(), stations], ignore_index=True)
+        catalog_path = os.path.join(directory, 'stations.csv')
+        catalog.to_csv(catalog_path, index=False)
+        first = load_catalog(db_manager, read_catalog(catalog_path))
+        
+        shared = city_id_map(db_manager.engine)
+        # 其他进程中的映射：只能通过目录版本发现变化
+        standalone = CityIdMap(db_manager.engine, check_seconds=0)
+        encoded = shared.encode(['beijing', 'ST1500', 'SZ', 'unknown']).tolist()
+        standalone.snapshot()
+        
+        # 修改一个站点的坐标并新增一个站点
+        catalog.loc[catalog['city_code'] == 'ST1002', 'latitude'] = 45.0
+        catalog = pd.concat([catalog, pd.DataFrame([{'city_id': 3001, 'city_name': 'station_3001', 'city_code': 'ST3001',
+                                                     'latitude': 30.0, 'longitude': 110.0}])], ignore_index=True)
+        second = load_catalog(db_manager, catalog)
+        third = load_catalog(db_manager, catalog)
+        
+        refreshed = (shared.lookup('station_3001'), standalone.lookup('ST3001'), standalone.coordinates()['station_1002'][0])
+        db_manager.close()
+        
+        if (first == (2000, 0) and second == (1, 1) and third == (0, 0) and encoded[:3] == [1, 1500, 4]
+                and pd.isna(encoded[3]) and refreshed == (3001, 3001, 45.0)):
+            logger.info("站点目录与城市ID映射测试通过")
+            return True
+        else:
+            logger.error(f"站点目录结果不符合预期: 写入 {first} {second} {third}，编码 {encoded}，刷新后 {refreshed}")
+            return False
+    except Exception as e:
+        logger.error(f"站点目录与城市ID映射测试失败: {e}", exc_info=True)
+        return False
+
+def test_engine_registry():
+    """测试进程内共享引擎（同一数据库共用连接池）及连接池指标"""
+    logger.info("=== 开始测试共享引擎注册表 ===")
+    
+    try:
+        backend = SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))
+        first = DatabaseManager(backend)
+        second = DatabaseManager(backend)
+        shared = first.engine is second.engine
+        
+        session = second.get_session()
+        session.execute(text("SELECT 1"))
+        session.close()
+        
+        metrics = [m for m in registry.metrics() if m['url'] == backend.url]
+        first.close()
+        still_open = any(m['url'] == backend.url for m in registry.metrics())
+        second.close()
+        released = not any(m['url'] == backend.url for m in registry.metrics())
+        
+        # 连接池已满时获取连接超时，计入超时次数
+        engine = create_engine(backend.url, poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05)
+        with engine.connect():
+            try:
+                engine.connect()
+            except Exception:
+                pass
+        pool_metrics = engine.pool.metrics()
+        engine.dispose()
+        timed = pool_metrics['checkouts'] == 1 and pool_metrics['timeouts'] == 1
+        
+        if (shared and metrics and metrics[0]['checkouts'] >= 1 and metrics[0]['users'] == 2 and still_open and released
+                and timed):
+            logger.info(f"连接池指标: {metrics[0]}")
+            logger.info("共享引擎注册表测试通过")
+            return True
+        else:
+            logger.error("共享引擎注册表结果不符合预期")
+            return False
+    except Exception as e:
+        logger.error(f"共享引擎注册表测试失败: {e}", exc_info=True)
+        return False
+
+def test_schema_migration():
+    """测试表结构迁移（按当前指标存储方式重建表并保留数据，已放大存储的指标不重复换算）及按列读取气象指标"""
+    logger.info("=== 开始测试表结构迁移 ===")
+    
+    # 旧版表结构：气象指标为REAL且没有索引；或指标已按放大整数存储（如气温-12.34存为-1234），但缺少更新时间字段
+    legacy_tables = {
+        'REAL': ("temperature REAL, pressure REAL, humidity REAL, precipitation REAL, wind_speed REAL, "
+                 "wind_direction REAL, status SMALLINT, created_at DATETIME, updated_at DATETIME",
+                 "-12.34, 1013.25, 55.5, 0.1, 3.33, 359.99"),
+        'INTEGER': ("temperature INTEGER, pressure INTEGER, humidity INTEGER, precipitation INTEGER, wind_speed INTEGER, "
+                    "wind_direction INTEGER, status SMALLINT, created_at DATETIME",
+                    "-1234, 101325, 5550, 10, 333, 35999")
+    }
+    expected = [-12.34, 1013.25, 55.5, 0.1, 3.33, 359.99]
+    model_indexes = {index.name for index in HistoricalWeather.__table__.indexes}
+    
+    try:
+        for legacy_type, (columns, values) in legacy_tables.items():
+            backend = SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))
+            db_manager = DatabaseManager(backend)
+            with db_manager.engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE TABLE historical_weather (id INTEGER PRIMARY KEY, city_id INTEGER NOT NULL, "
+                    f"source_id INTEGER NOT NULL, timestamp DATETIME NOT NULL, {columns})"
+                ))
+            db_manager.init_database()
+            with db_manager.engine.begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO historical_weather (city_id, source_id, timestamp, temperature, pressure, humidity, "
+                    f"precipitation, wind_speed, wind_direction, status) VALUES (1, 1, '2009-01-01 00:00:00', {values}, 1)"
+                ))
+            
+            migrator = SchemaMigrator(db_manager)
+            plan = migrator.migrate(models=(HistoricalWeather,))
+            remaining = migrator.pending_changes(HistoricalWeather)
+            indexes = {index['name'] for index in inspect(db_manager.engine).get_indexes('historical_weather')}
+            
+            session = db_manager.get_session()
+            result = session.execute(select(*raw_metric_columns(HistoricalWeather)))
+            df = decode_metric_frame(pd.DataFrame(result.all(), columns=list(result.keys())), HistoricalWeather)
+            session.close()
+            db_manager.close()
+            
+            if not ('historical_weather' in plan and not remaining and model_indexes <= indexes
+                    and len(df) == 1 and all(abs(v - e) < 1e-4 for v, e in zip(df.iloc[0].tolist(), expected))):
+                logger.error(f"表结构迁移结果不符合预期（旧字段类型 {legacy_type}）: plan={plan}, remaining={remaining}, "
+                             f"indexes={indexes}, rows={df.to_dict('records')}")
+                return False
+        
+        logger.info("表结构迁移测试通过")
+        return True
+    except Exception as e:
+        logger.error(f"表结构迁移测试失败: {e}", exc_info=True)
+        return False
+
+def test_clustered_layout():
+    """测试迁移到聚簇主键布局（在子进程中按 DB_WEATHER_LAYOUT=clustered 运行扫描基准）"""
+    logger.info("=== 开始测试聚簇主键布局迁移 ===")
+    
+    try:
+        db_path = os.path.join(tempfile.mkdtemp(), 'weather_data.db')
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, DB_BACKEND='sqlite', SQLITE_PATH=db_path, DB_WEATHER_LAYOUT='surrogate', HISTORICAL_PARTITIONING='')
+        
+        # 先按自增主键布局建表，再以聚簇布局运行基准（写入、扫描、迁移、再扫描）
+        subprocess.run([sys.executable, '-c', 'from processing.database_manager import DatabaseManager; DatabaseManager().init_database()'],
+                       cwd=base_dir, env=env, check=True, capture_output=True)
+        env['DB_WEATHER_LAYOUT'] = 'clustered'
+        result = subprocess.run([sys.executable, 'benchmark_layout.py', '--migrate', '--hours', '72', '--queries', '5', '--window-days', '1'],
+                                cwd=base_dir, env=env, capture_output=True, text=True)
+        
+        with sqlite3.connect(db_path) as conn:
+            table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'historical_weather'").fetchone()[0]
+        
+        if result.returncode == 0 and 'PRIMARY KEY (city_id, timestamp)' in table_sql and 'WITHOUT ROWID' in table_sql:
+            logger.info("聚簇主键布局迁移测试通过")
+            return True
+        else:
+            logger.error(f"聚簇主键布局迁移结果不符合预期: {result.stdout}{result.stderr}\n{table_sql}")
+            return False
+    except Exception as e:
+        logger.error(f"聚簇主键布局迁移测试失败: {e}", exc_info=True)
+        return False
+
+def test_historical_partitioning():
+    """测试历史天气表按年分区（SQLite时间段表+视图：转换、写入分发、分区裁剪和删除分区，汇总随之重建和扣减）"""
+    logger.info("=== 开始测试历史数据分区 ===")
+    
+    try:
+        backend = SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))
+        db_manager = DatabaseManager(backend)
+        db_manager.init_database()
+        
+        def rows(start, count):
+            return [{'city_id': 1, 'source_id': 1, 'timestamp': start + timedelta(days=i), 'temperature': 1.0, 'status': 1}
+                    for i in range(count)]
+        
+        # 分区前已有2010年的数据
+        with db_manager.engine.begin() as conn:
+            conn.execute(insert(HistoricalWeather.__table__), rows(datetime(2010, 3, 1), 10))
+        
+        manager = HistoricalPartitionManager(db_manager, granularity='year')
+        new_rows = rows(datetime(2012, 6, 1), 5)
+        created = manager.ensure_partitions([row['timestamp'] for row in new_rows])
+        with db_manager.engine.begin() as conn:
+            # 经视图的触发器写入对应的时间段表
+            conn.execute(insert(HistoricalWeather.__table__), new_rows)
+            total = conn.execute(text("SELECT COUNT(*) FROM historical_weather")).scalar()
+            in_2012 = conn.execute(text("SELECT COUNT(*) FROM historical_weather_p2012")).scalar()
+        partitions = manager.list_partitions()
+        
+        # 直接写入历史数据表的观测不在汇总中，再次初始化数据库时按城市重建汇总
+        db_manager.init_database()
+        rollup_counts = "SELECT SUM(value_count) FROM weather_rollups WHERE grain = 'day' AND metric = 'temperature'"
+        with db_manager.engine.connect() as conn:
+            rebuilt = conn.execute(text(rollup_counts)).scalar()
+        
+        # 只查询2012年的分区
+        source = manager.source(datetime(2012, 1, 1), datetime(2012, 12, 31))
+        session = db_manager.get_session()
+        pruned = session.execute(select(source.timestamp).where(source.timestamp >= datetime(2012, 1, 1))).all()
+        session.close()
+        
+        # 删除分区时同时从汇总中减去该时间段
+        dropped = manager.drop_partition('p2010')
+        with db_manager.engine.connect() as conn:
+            remaining = conn.execute(text("SELECT COUNT(*) FROM historical_weather")).scalar()
+            remaining_rollups = conn.execute(text(rollup_counts)).scalar()
+        incomplete = WeatherRollupManager(db_manager).incomplete_cities()
+        db_manager.close()
+        
+        if (created == 1 and partitions == ['p2010', 'p2012'] and total == 15 and in_2012 == 5
+                and len(pruned) == 5 and dropped and remaining == 5 and rebuilt == 15
+                and remaining_rollups == 5 and incomplete == []):
+            logger.info("历史数据分区测试通过")
+            return True
+        else:
+            logger.error(f"历史数据分区结果不符合预期: partitions={partitions}, total={total}, remaining={remaining}, "
+                         f"rollups={rebuilt}/{remaining_rollups}, incomplete={incomplete}")
+            return False
+    except Exception as e:
+        logger.error(f"历史数据分区测试失败: {e}", exc_info=True)
+        return False
+
+def test_read_replicas():
+    """测试读写分离（两个SQLite文件作为主库和只读副本：副本不可用时跳过、延迟超限时读取主库）"""
+    logger.info("=== 开始测试读写分离 ===")
+    
+    try:
+        directory = tempfile.mkdtemp()
+        primary_path = os.path.join(directory, 'primary.db')
+        replica_path = os.path.join(directory, 'replica.db')
+        primary = DatabaseManager(SQLiteBackend(path=primary_path), replicas=[])
+        primary.init_database()
+        
+        def add_row(timestamp):
+            with primary.engine.begin() as conn:
+                conn.execute(insert(HistoricalWeather.__table__),
+                             {'city_id': 1, 'source_id': 1, 'timestamp': timestamp, 'temperature': 20.0, 'status': 1})
+            primary.write_heartbeat()
+        
+        # 副本为主库当前状态的拷贝
+        add_row(datetime(2015, 1, 1))
+        with sqlite3.connect(primary_path) as source, sqlite3.connect(replica_path) as target:
+            source.backup(target)
+        
+        # 第二个副本无法打开（路径是目录），使用时跳过；每次读取都重新检查副本延迟
+        manager = DatabaseManager(SQLiteBackend(path=primary_path),
+                                  replicas=[SQLiteBackend(path=replica_path), SQLiteBackend(path=directory)])
+        manager.replicas.check_seconds = 0
+        routed = {manager.read_engine().url.database for _ in range(2)}
+        fresh_engine = manager.read_engine(max_lag=0)
+        
+        # 主库继续写入后副本落后
+        add_row(datetime(2015, 1, 2))
+        lagging_engine = manager.read_engine(max_lag=0)
+        tolerant_engine = manager.read_engine(max_lag=60)
+        
+        session = manager.get_read_session()
+        replica_count = session.execute(select(func.count()).select_from(HistoricalWeather)).scalar()
+        session.close()
+        session = manager.get_read_session(max_lag=0)
+        primary_count = session.execute(select(func.count()).select_from(HistoricalWeather)).scalar()
+        session.close()
+        status = manager.replica_status()
+        
+        # 缓存时间内复用副本的检查结果，读取不再访问主库和副本（延迟按上次检查的结果计算）
+        manager.replicas.check_seconds = 60
+        manager.read_engine(max_lag=60)
+        queries = []
+        def count_query(conn, cursor, statement, parameters, context, executemany):
+            queries.append(statement)
+        for engine in (manager.engine, manager.replicas.engines[0]):
+            event.listen(engine, 'before_cursor_execute', count_query)
+        cached_engines = [manager.read_engine(max_lag=60) for _ in range(3)] + [manager.read_engine()]
+        for engine in (manager.engine, manager.replicas.engines[0]):
+            event.remove(engine, 'before_cursor_execute', count_query)
+        manager.close()
+        primary.close()
+        cached = not queries and all(engine.url.database == replica_path for engine in cached_engines)
+        
+        if (routed == {replica_path} and fresh_engine.url.database == replica_path
+                and lagging_engine is manager.engine and tolerant_engine.url.database == replica_path
+                and replica_count == 1 and primary_count == 2
+                and [entry['available'] for entry in status] == [True, False] and status[0]['lag_seconds'] > 0 and cached):
+            logger.info("读写分离测试通过")
+            return True
+        else:
+            logger.error(f"读写分离结果不符合预期: routed={routed}, counts={replica_count}/{primary_count}, status={status}")
+            return False
+    except Exception as e:
+        logger.error(f"读写分离测试失败: {e}", exc_info=True)
+        return False
+
+def test_query_plans():
+    """测试典型查询的执行计划检查（种子数据上全部通过，删除索引后能发现退化）"""
+    logger.info("=== 开始测试查询执行计划检查 ===")
+    
+    try:
+        backend = SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))
+        db_manager = DatabaseManager(backend)
+        db_manager.init_database()
+        checker = QueryPlanChecker(db_manager)
+        seeded = checker.seed(hours=24 * 60)
+        report = checker.check()
+        
+        # 删除汇总表的唯一索引后，汇总查询退化为全表扫描和额外排序
+        with db_manager.engine.begin() as conn:
+            conn.execute(text("DROP INDEX uq_rollup_metric_bucket"))
+        regressed = checker.check().set_index('name')
+        db_manager.close()
+        
+        if (seeded > 0 and report['ok'].all() and not regressed.loc['rollup_daily_city', 'ok']
+                and not regressed.loc['rollup_monthly_regional', 'ok'] and regressed.loc['dashboard_city_range', 'ok']):
+            logger.info("查询执行计划检查测试通过")
+            return True
+        else:
+            logger.error(f"查询执行计划检查结果不符合预期:\n{report[['name', 'ok', 'problems']]}")
+            return False
+    except Exception as e:
+        logger.error(f"查询执行计划检查测试失败: {e}", exc_info=True)
+        return False
+
 def test_data_storage():
     """测试数据存储功能"""
     logger.info("=== 开始测试数据存储功能 ===")
@@ -125,6 +515,903 @@ def test_data_storage():
         logger.error(f"数据存储测试失败: {e}", exc_info=True)
         return False, None
 
+def test_bulk_storage():
+    """测试批量入库功能（重复写入同一批数据时应全部去重）"""
+    logger.info("=== 开始测试批量入库功能 ===")
+    
+    try:
+        # 创建示例数据（包含一条批内重复数据）
+        dates = [datetime(2000, 1, 1) + timedelta(hours=i) for i in range(50)]
+        data = {
+            'timestamp': dates + [dates[0]],
+            'city': ['shanghai'] * 51,
+            'temperature': [15 + i * 0.1 for i in range(51)],
+            'pressure': [1010 + i * 0.1 for i in range(51)],
+            'humidity': [70.0] * 51,
+            'precipitation': [0.5] * 51,
+            'wind_speed': [3.0] * 51,
+            'wind_direction': [90.0] * 51,
+            'source': ['Meteostat'] * 51
+        }
+        
+        df = pd.DataFrame(data)
+        # 使用独立的SQLite数据库，测试数据不写入配置的数据库
+        storage = WeatherDataStorage(DatabaseManager(SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))))
+        storage.db_manager.init_database()
+        processed_df = storage.preprocessor.preprocess_data(df, data_type='historical')
+        
+        # 第一次写入
+        first_success, first_stored = storage.store_historical_weather(processed_df)
+        # 第二次写入同一批数据，应全部跳过
+        second_success, second_stored = storage.store_historical_weather(processed_df)
+        
+        # 实时数据批量upsert，第二次写入应全部计为更新
+        rt_success, rt_stored, _ = storage.store_realtime_weather(processed_df)
+        rt_again_success, rt_again_stored, rt_again_updated = storage.store_realtime_weather(processed_df)
+        
+        if (first_success and second_success and second_stored == 0
+                and rt_success and rt_again_success and rt_again_stored == 0 and rt_again_updated == rt_stored + 1):
+            logger.info(f"批量入库成功，历史数据新增: {first_stored}条，实时数据新增: {rt_stored}条")
+            logger.info("批量入库测试通过")
+            return True, storage
+        else:
+            logger.error("批量入库结果不符合预期")
+            return False, None
+    except Exception as e:
+        logger.error(f"批量入库测试失败: {e}", exc_info=True)
+        return False, None
+
+def test_streaming_csv_load():
+    """测试CSV分块流式加载及断点续传功能"""
+    logger.info("=== 开始测试CSV流式加载功能 ===")
+    
+    try:
+        work_dir = tempfile.mkdtemp()
+        csv_path = os.path.join(work_dir, 'historical_weather_guangzhou.csv')
+        
+        # 创建示例CSV文件
+        dates = [datetime(2001, 1, 1) + timedelta(hours=i) for i in range(100)]
+        df = pd.DataFrame({
+            'timestamp': [d.strftime('%Y-%m-%d %H:%M:%S') for d in dates],
+            'city': ['guangzhou'] * 100,
+            'temperature': [25 + (i % 10) * 0.3 for i in range(100)],
+            'pressure': [1008 + (i % 5) * 0.5 for i in range(100)],
+            'humidity': [80.0] * 100,
+            'precipitation': [1.0] * 100,
+            'wind_speed': [2.5] * 100,
+            'wind_direction': [180.0] * 100,
+            'source': ['Meteostat'] * 100
+        })
+        df.to_csv(csv_path, index=False)
+        
+        # 使用独立的SQLite数据库，测试数据不写入配置的数据库
+        storage = WeatherDataStorage(DatabaseManager(SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))))
+        storage.db_manager.init_database()
+        storage.checkpoint_dir = os.path.join(work_dir, 'checkpoints')
+        
+        # 模拟中断：前60行已在上次加载中处理
+        storage._save_checkpoint(csv_path, 'historical', storage._file_state(csv_path), 60, csv_row_offset(csv_path, 60), 0, 0, 0)
+        success, stored, updated, rows_done = storage.stream_csv_to_database(csv_path, 'historical', chunk_size=25)
+        checkpoint_cleared = not os.path.exists(storage._checkpoint_path(csv_path))
+        
+        # 断点之后文件被修改（大小不变）或追加内容时，只有已处理部分未被修改的断点有效
+        storage._save_checkpoint(csv_path, 'historical', storage._file_state(csv_path), 60, csv_row_offset(csv_path, 60), 0, 0, 0)
+        df.iloc[:5].to_csv(csv_path, index=False, header=False, mode='a')
+        appended_valid = storage._load_checkpoint(csv_path, 'historical', storage._file_state(csv_path)) is not None
+        with open(csv_path, 'r+', encoding='utf-8') as f:
+            content = f.read()
+            f.seek(0)
+            f.write(content.replace('180.0', '181.0', 1))
+        modified_valid = storage._load_checkpoint(csv_path, 'historical', storage._file_state(csv_path)) is not None
+        
+        # 引号内的换行不切分记录
+        quoted_path = os.path.join(work_dir, 'quoted.csv')
+        with open(quoted_path, 'w', encoding='utf-8') as f:
+            f.write('city,description\nguangzhou,"line1\nline2"\nshanghai,plain\nbeijing,plain\n')
+        chunks = [chunk for chunk, _ in iter_csv_chunks(quoted_path, chunk_size=2)]
+        resumed = [chunk for chunk, _ in iter_csv_chunks(quoted_path, byte_offset=csv_row_offset(quoted_path, 1))]
+        quoted_ok = ([len(chunk) for chunk in chunks] == [2, 1] and chunks[0]['description'][0] == 'line1\nline2'
+                     and resumed[0]['city'].tolist() == ['shanghai', 'beijing'])
+        
+        if (success and rows_done == 100 and stored <= 40 and checkpoint_cleared and appended_valid and not modified_valid
+                and quoted_ok):
+            logger.info(f"CSV流式加载成功，从断点继续处理到第 {rows_done} 行，新增: {stored}条")
+            logger.info("CSV流式加载测试通过")
+            return True, storage
+        else:
+            logger.error("CSV流式加载结果不符合预期")
+            return False, None
+    except Exception as e:
+        logger.error(f"CSV流式加载测试失败: {e}", exc_info=True)
+        return False, None
+
+def test_ingest_manifest():
+    """测试按文件入库清单增量加载（未变化的文件跳过，追加的内容只加载新增行）"""
+    logger.info("=== 开始测试增量加载功能 ===")
+    
+    try:
+        work_dir = tempfile.mkdtemp()
+        csv_path = os.path.join(work_dir, 'historical_weather_shenzhen.csv')
+        
+        def make_rows(start_hour, count):
+            dates = [datetime(2002, 1, 1) + timedelta(hours=start_hour + i) for i in range(count)]
+            return pd.DataFrame({
+                'timestamp': [d.strftime('%Y-%m-%d %H:%M:%S') for d in dates],
+                'city': ['shenzhen'] * count,
+                'temperature': [22 + (i % 8) * 0.4 for i in range(count)],
+                'pressure': [1009.0] * count,
+                'humidity': [75.0] * count,
+                'precipitation': [0.0] * count,
+                'wind_speed': [3.5] * count,
+                'wind_direction': [135.0] * count,
+                'source': ['Meteostat'] * count
+            })
+        
+        make_rows(0, 30).to_csv(csv_path, index=False)
+        
+        # 使用独立的SQLite数据库，测试数据不写入配置的数据库
+        storage = WeatherDataStorage(DatabaseManager(SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))))
+        storage.db_manager.init_database()
+        if storage.manifest is None:
+            logger.error("入库清单未启用")
+            return False, None
+        
+        # 第一次加载整个文件；起始行由清单决定，遗留的断点不生效
+        storage.checkpoint_dir = os.path.join(work_dir, 'checkpoints')
+        storage._save_checkpoint(csv_path, 'historical', storage._file_state(csv_path), 40, csv_row_offset(csv_path, 40), 0, 0, 0)
+        first_success, _, _ = storage.ingest_csv_file(csv_path, 'historical')
+        first_rows = storage.manifest.get_entry(csv_path).rows_consumed
+        checkpoint_cleared = not os.path.exists(storage._checkpoint_path(csv_path))
+        # 文件未变化，应跳过
+        skip_plan = storage.manifest.plan(csv_path, 'historical')
+        # 追加10行后只加载新增的行
+        make_rows(30, 10).to_csv(csv_path, index=False, header=False, mode='a')
+        append_plan = storage.manifest.plan(csv_path, 'historical')
+        append_success, append_stored, _ = storage.ingest_csv_file(csv_path, 'historical')
+        entry = storage.manifest.get_entry(csv_path)
+        
+        if (first_success and first_rows == 30 and checkpoint_cleared and skip_plan['action'] == 'skip'
+                and append_plan['action'] == 'append' and append_plan['start_row'] == 30
+                and append_success and entry.rows_consumed == 40):
+            logger.info(f"增量加载成功，追加内容新增: {append_stored}条")
+            logger.info("增量加载测试通过")
+            return True, storage
+        else:
+            logger.error("增量加载结果不符合预期")
+            return False, None
+    except Exception as e:
+        logger.error(f"增量加载测试失败: {e}", exc_info=True)
+        return False, None
+
+def test_parallel_loader():
+    """测试多进程并行加载（各文件的行数、写入顺序、城市按数据库映射编码，再次加载时跳过）"""
+    logger.info("=== 开始测试多进程并行加载 ===")
+    
+    try:
+        work_dir = tempfile.mkdtemp()
+        storage = WeatherDataStorage(DatabaseManager(SQLiteBackend(path=os.path.join(work_dir, 'weather_data.db'))))
+        storage.db_manager.init_database()
+        # wuhan 只在数据库中，不在站点目录文件中，子进程需使用数据库映射的快照才能编码
+        load_catalog(storage.db_manager, pd.DataFrame([{'city_name': 'wuhan', 'city_code': 'WH', 'latitude': 30.5928, 'longitude': 114.3055}]))
+        
+        files = []
+        for city, count in [('wuhan', 30), ('chengdu', 12), ('beijing', 21)]:
+            csv_path = os.path.join(work_dir, f'historical_weather_{city}.csv')
+            pd.DataFrame({
+                'timestamp': [(datetime(2004, 3, 1) + timedelta(hours=i)).strftime('%Y-%m-%d %H:%M:%S') for i in range(count)],
+                'city': [city] * count,
+                'temperature': [12.0 + i * 0.1 for i in range(count)],
+                'pressure': [1012.0] * count,
+                'humidity': [55.0] * count,
+                'precipitation': [0.0] * count,
+                'wind_speed': [2.0] * count,
+                'wind_direction': [90.0] * count,
+                'source': ['Meteostat'] * count
+            }).to_csv(csv_path, index=False)
+            files.append((csv_path, 'historical'))
+        
+        loader = ParallelCSVLoader(storage, workers=2, queue_depth=2)
+        success, stored, _, file_stats = loader.load_files(files)
+        quarantined = sum(stat['quarantined'] for stat in file_stats)
+        # 文件未变化，再次加载时全部跳过
+        _, _, _, reload_stats = loader.load_files(files)
+        
+        session = storage.db_manager.get_session()
+        counts = dict(session.execute(
+            select(HistoricalWeather.city_id, func.count()).group_by(HistoricalWeather.city_id)
+        ).all())
+        session.close()
+        expected = {storage.preprocessor.city_ids.lookup(city): count for city, count in [('wuhan', 30), ('chengdu', 12), ('beijing', 21)]}
+        storage.close()
+        
+        if (success and stored == 63 and quarantined == 0
+                and [stat['file_path'] for stat in file_stats] == [path for path, _ in files]
+                and [stat['rows'] for stat in file_stats] == [30, 12, 21]
+                and counts == expected and reload_stats == []):
+            logger.info("多进程并行加载测试通过")
+            return True
+        else:
+            logger.error(f"多进程并行加载结果不符合预期: stored={stored}, stats={file_stats}, counts={counts}, expected={expected}")
+            return False
+    except Exception as e:
+        logger.error(f"多进程并行加载测试失败: {e}", exc_info=True)
+        return False
+
+def test_quarantine():
+    """测试分块提交时隔离问题数据行（单个坏行不影响其他数据入库）"""
+    logger.info("=== 开始测试问题数据隔离功能 ===")
+    
+    try:
+        # 使用独立的SQLite数据库，测试数据不写入配置的数据库
+        storage = WeatherDataStorage(DatabaseManager(SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))))
+        storage.db_manager.init_database()
+        
+        count = 20
+        df = pd.DataFrame({
+            'city_id': [1.0] * count,
+            'source_id': [1] * count,
+            'timestamp': [datetime(2003, 1, 1) + timedelta(hours=i) for i in range(count)],
+            'temperature': [10.0] * count,
+            'pressure': [1020.0] * count,
+            'humidity': [40.0] * count,
+            'precipitation': [0.0] * count,
+            'wind_speed': [2.0] * count,
+            'wind_direction': [0.0] * count
+        })
+        # 城市ID缺失的行违反非空约束，应被隔离
+        df.loc[7, 'city_id'] = None
+        
+        session = storage.db_manager.get_session()
+        before = session.query(QuarantinedRow).count()
+        session.close()
+        
+        success, stored = storage.store_historical_weather(df, bulk=True)
+        returned_quarantined = storage.last_quarantined_count
+        
+        session = storage.db_manager.get_session()
+        quarantined = session.query(QuarantinedRow).count() - before
+        session.close()
+        
+        if success and quarantined == 1 and returned_quarantined == 1:
+            logger.info(f"问题数据隔离成功，新增: {stored}条，隔离: {quarantined}条")
+            logger.info("问题数据隔离测试通过")
+            return True, storage
+        else:
+            logger.error("问题数据隔离结果不符合预期")
+            return False, None
+    except Exception as e:
+        logger.error(f"问题数据隔离测试失败: {e}", exc_info=True)
+        return False, None
+
+def test_weather_rollups():
+    """测试历史数据入库时增量维护按天/按月汇总（含迟到数据和重复数据）"""
+    logger.info("=== 开始测试汇总表增量维护 ===")
+    
+    try:
+        # 使用独立的SQLite数据库，测试数据不写入配置的数据库
+        storage = WeatherDataStorage(DatabaseManager(SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))))
+        storage.db_manager.init_database()
+        
+        count = 72
+        timestamps = [datetime(2006, 1, 1) + timedelta(hours=i) for i in range(count)]
+        df = pd.DataFrame({
+            'city_id': [1] * count,
+            'source_id': [1] * count,
+            'timestamp': timestamps,
+            'temperature': [float(i % 24) for i in range(count)],
+            'pressure': [1010.0] * count,
+            'humidity': [50.0] * count,
+            'precipitation': [0.5] * count,
+            'wind_speed': [3.0] * count,
+            'wind_direction': [90.0] * count
+        })
+        # 先写入大部分数据，再写入迟到的数据，最后重复写入一次
+        late = df.index % 5 == 0
+        storage.store_historical_weather(df[~late])
+        storage.store_historical_weather(df[late])
+        storage.store_historical_weather(df)
+        
+        rollups = storage.rollups.read('temperature', 'day', 'beijing')
+        rollups = rollups[(rollups['bucket_start'] >= timestamps[0]) & (rollups['bucket_start'] <= timestamps[-1])]
+        
+        expected = df.set_index('timestamp').resample('D')['temperature'].agg(['count', 'mean', 'max', 'min', 'std'])
+        actual = rollups.set_index('bucket_start')[['count', 'mean', 'max', 'min', 'std']]
+        
+        if len(actual) == 3 and (actual - expected).abs().max().max() < 1e-6:
+            logger.info("汇总表增量维护测试通过")
+            return True, storage
+        else:
+            logger.error(f"汇总结果不符合预期: {actual.to_dict('records')}")
+            return False, None
+    except Exception as e:
+        logger.error(f"汇总表增量维护测试失败: {e}", exc_info=True)
+        return False, None
+
+def test_realtime_retention():
+    """测试过期实时数据按小时聚合写入历史表后分批删除"""
+    logger.info("=== 开始测试实时数据保留与压缩 ===")
+    
+    try:
+        # 使用独立的SQLite数据库，压缩会删除原始观测，不能在配置的数据库上执行
+        storage = WeatherDataStorage(DatabaseManager(SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))))
+        storage.db_manager.init_database()
+        
+        count = 24
+        now = datetime.now().replace(microsecond=0)
+        timestamps = [datetime(2003, 1, 1) + timedelta(minutes=10 * i) for i in range(count)] + [now - timedelta(hours=1)]
+        df = pd.DataFrame({
+            'city_id': [5] * (count + 1),
+            'source_id': [1] * (count + 1),
+            'timestamp': timestamps,
+            'temperature': [float(i) for i in range(count + 1)],
+            'pressure': [1010.0] * (count + 1),
+            'humidity': [50.0] * (count + 1),
+            'precipitation': [0.0] * (count + 1),
+            'wind_speed': [3.0] * (count + 1),
+            'wind_direction': [350.0 if i % 2 else 10.0 for i in range(count + 1)]
+        })
+        storage.store_realtime_weather(df)
+        
+        job = RealtimeRetentionJob(storage, slice_days=1, delete_batch=5)
+        summary = job.run(now=now, city_ids=[5])
+        
+        session = storage.db_manager.get_session()
+        try:
+            hourly = session.execute(
+                select(HistoricalWeather).where(HistoricalWeather.city_id == 5, HistoricalWeather.timestamp < datetime(2004, 1, 1))
+                .order_by(HistoricalWeather.timestamp)
+            ).scalars().all()
+            expired = session.execute(
+                select(func.count()).select_from(RealTimeWeather)
+                .where(RealTimeWeather.city_id == 5, RealTimeWeather.timestamp < summary['cutoff'])
+            ).scalar()
+            recent = session.execute(
+                select(func.count()).select_from(RealTimeWeather)
+                .where(RealTimeWeather.city_id == 5, RealTimeWeather.timestamp == timestamps[-1])
+            ).scalar()
+        finally:
+            session.close()
+        
+        # 读取之后被更新的观测和新写入的观测不应被删除
+        storage.store_realtime_weather(df.iloc[:4])
+        raw = job._read_slice(5, datetime(2003, 1, 1), datetime(2003, 1, 2))
+        storage.store_realtime_weather(df.iloc[[0]].assign(temperature=99.0))
+        storage.store_realtime_weather(df.iloc[[4]])
+        deleted = job._delete_rows(5, raw)
+        session = storage.db_manager.get_session()
+        try:
+            kept = session.execute(
+                select(RealTimeWeather.timestamp)
+                .where(RealTimeWeather.city_id == 5, RealTimeWeather.timestamp < datetime(2004, 1, 1))
+                .order_by(RealTimeWeather.timestamp)
+            ).scalars().all()
+        finally:
+            session.close()
+        
+        temperatures = [float(row.temperature) for row in hourly]
+        directions = {float(row.wind_direction) for row in hourly}
+        if (temperatures == [2.5, 8.5, 14.5, 20.5] and directions == {0.0} and expired == 0 and recent == 1
+                and len(raw) == 4 and deleted == 3 and kept == [timestamps[0], timestamps[4]]):
+            logger.info(f"实时数据保留与压缩测试通过: {summary}")
+            return True, storage
+        else:
+            logger.error(f"压缩结果不符合预期: 小时温度 {temperatures}，风向 {directions}，剩余过期观测 {expired}，"
+                         f"保留的近期观测 {recent}，按键删除 {deleted} 条，保留 {kept}")
+            return False, None
+    except Exception as e:
+        logger.error(f"实时数据保留与压缩测试失败: {e}", exc_info=True)
+        return False, None
+
+def test_async_data_access():
+    """测试异步数据访问层（结果与同步查询一致，多个查询并发执行）"""
+    logger.info("=== 开始测试异步数据访问层 ===")
+    
+    backend = SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))
+    try:
+        access = AsyncWeatherDataAccess(backend)
+    except ImportError as e:
+        # 异步访问是可选功能，需要 greenlet 和异步驱动（aiosqlite/aiomysql）
+        logger.warning(f"未安装异步数据库驱动，跳过异步数据访问测试: {e}")
+        return True
+    
+    try:
+        # 独立数据库中写入北京2006年1月前5天的逐小时观测（汇总表随之更新）
+        storage = WeatherDataStorage(DatabaseManager(backend))
+        storage.db_manager.init_database()
+        count = 24 * 5
+        storage.store_historical_weather(pd.DataFrame({
+            'city_id': [1] * count,
+            'source_id': [2] * count,
+            'timestamp': [datetime(2006, 1, 1) + timedelta(hours=i) for i in range(count)],
+            'temperature': [-5 + (i % 24) * 0.5 for i in range(count)],
+            'pressure': [1030.0] * count,
+            'humidity': [30.0] * count,
+            'precipitation': [0.0] * count,
+            'wind_speed': [3.0] * count,
+            'wind_direction': [315.0] * count
+        }))
+        storage.close()
+        
+        analyzer = WeatherDataAnalyzer(DatabaseManager(backend))
+        expected_history = analyzer.get_historical_data('beijing', datetime(2006, 1, 1), datetime(2006, 1, 4))
+        expected_rollups = analyzer.rollups.read('temperature', 'day', 'beijing')
+        analyzer.close()
+        
+        async def run():
+            try:
+                history, rollups = await asyncio.gather(
+                    access.get_historical_data('beijing', datetime(2006, 1, 1), datetime(2006, 1, 4)),
+                    access.read_rollups('temperature', 'day', 'beijing')
+                )
+                concurrent = await asyncio.gather(*[
+                    access.get_historical_data('beijing', datetime(2006, 1, 1), datetime(2006, 1, 4)) for _ in range(10)
+                ])
+                alerts = await access.check_weather_alerts('beijing', {'temperature': {'operator': '>', 'threshold': 100}})
+                return history, rollups, concurrent, alerts
+            finally:
+                await access.close()
+        
+        history, rollups, concurrent, alerts = asyncio.run(run())
+        
+        if (not history.empty and history.equals(expected_history) and rollups.equals(expected_rollups)
+                and all(frame.equals(history) for frame in concurrent) and alerts == []):
+            logger.info(f"异步数据访问层测试通过: {len(history)} 行历史数据，{len(rollups)} 行汇总数据")
+            return True
+        else:
+            logger.error(f"异步查询结果与同步查询不一致: 历史数据 {len(history)}/{len(expected_history)} 行，汇总 {len(rollups)}/{len(expected_rollups)} 行")
+            return False
+    except Exception as e:
+        logger.error(f"异步数据访问层测试失败: {e}", exc_info=True)
+        return False
+
+def test_concurrent_sessions():
+    """测试多线程共用一个分析器（每次查询使用独立会话，结果与串行查询一致）"""
+    logger.info("=== 开始测试多线程会话管理 ===")
+    
+    analyzer = None
+    try:
+        # 独立数据库中写入北京2006年1月前10天的逐小时观测
+        backend = SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))
+        storage = WeatherDataStorage(DatabaseManager(backend))
+        storage.db_manager.init_database()
+        count = 24 * 10
+        storage.store_historical_weather(pd.DataFrame({
+            'city_id': [1] * count,
+            'source_id': [2] * count,
+            'timestamp': [datetime(2006, 1, 1) + timedelta(hours=i) for i in range(count)],
+            'temperature': [-3 + (i % 24) * 0.4 for i in range(count)],
+            'pressure': [1028.0] * count,
+            'humidity': [35.0] * count,
+            'precipitation': [0.0] * count,
+            'wind_speed': [2.0] * count,
+            'wind_direction': [0.0] * count
+        }))
+        storage.close()
+        
+        analyzer = WeatherDataAnalyzer(DatabaseManager(backend))
+        
+        windows = [(datetime(2006, 1, 1) + timedelta(days=day), datetime(2006, 1, 3) + timedelta(days=day)) for day in range(8)]
+        expected = [analyzer.get_historical_data('beijing', start, end) for start, end in windows]
+        
+        results = [None] * len(windows)
+        def query(i):
+            start, end = windows[i]
+            results[i] = analyzer.get_historical_data('beijing', start, end)
+        
+        threads = [threading.Thread(target=query, args=(i,)) for i in range(len(windows))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        # 会话中出现异常时回滚并关闭，不影响后续查询
+        rolled_back = False
+        try:
+            with analyzer.db_manager.session_scope() as session:
+                session.execute(text("SELECT * FROM no_such_table"))
+        except Exception:
+            rolled_back = True
+        after = analyzer.get_historical_data('beijing', *windows[0])
+        
+        if (not expected[0].empty and all(result is not None and result.equals(frame) for result, frame in zip(results, expected))
+                and rolled_back and after.equals(expected[0])):
+            logger.info(f"多线程会话管理测试通过: {len(windows)} 个线程并发查询，结果与串行查询一致")
+            return True
+        else:
+            logger.error("多线程查询结果与串行查询不一致或会话异常未正确处理")
+            return False
+    except Exception as e:
+        logger.error(f"多线程会话管理测试失败: {e}", exc_info=True)
+        return False
+    finally:
+        if analyzer is not None:
+            analyzer.close()
+
+def test_hot_window():
+    """测试热数据窗口（提交后写入内存，最新值、最近数据和统计值与数据库查询一致，未预热时回退到数据库并预热，到期后重新加载）"""
+    logger.info("=== 开始测试热数据窗口 ===")
+    
+    # 使用独立的SQLite数据库，写入的近期观测不进入配置的数据库
+    backend = SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))
+    storage = WeatherDataStorage(DatabaseManager(backend))
+    storage.db_manager.init_database()
+    analyzer = WeatherDataAnalyzer(DatabaseManager(backend))
+    try:
+        # 热数据窗口默认关闭，测试中显式开启（写入和读取在同一进程，且只有本进程写入该数据库）
+        if not HOT_WINDOW_ENABLED:
+            storage.add_commit_listener(storage._feed_hot_window)
+            analyzer.hot_window = hot_window(analyzer.db_manager.engine)
+        
+        # 最近30小时的逐小时观测（与整点小时错开半小时，查询边界随当前时间移动时不会跨过观测）
+        now = datetime.now().replace(microsecond=0)
+        count = 30
+        df = pd.DataFrame({
+            'city_id': [4] * count,
+            'source_id': [1] * count,
+            'timestamp': [now - timedelta(hours=i, minutes=30) for i in range(count)][::-1],
+            'temperature': [20 + i * 0.37 for i in range(count)],
+            'pressure': [1008.123] * count,
+            'humidity': [60.0 + i for i in range(count)],
+            'precipitation': [0.0] * count,
+            'wind_speed': [2.5] * count,
+            'wind_direction': [180.0] * count
+        })
+        success, _ = storage.store_historical_weather(df)
+        
+        thresholds = {'temperature': {'operator': '>', 'threshold': 25}}
+        hot = (analyzer.get_recent_data('shenzhen'), analyzer.get_latest_observation('shenzhen'),
+               analyzer.recent_statistics('shenzhen'), analyzer.check_weather_alerts('shenzhen', thresholds))
+        warm = analyzer.hot_window.frame(4, now - timedelta(hours=24), now) is not None
+        
+        # 关闭热数据窗口，同样的调用全部查询数据库
+        window, analyzer.hot_window = analyzer.hot_window, None
+        expected = (analyzer.get_recent_data('shenzhen'), analyzer.get_latest_observation('shenzhen'),
+                    analyzer.recent_statistics('shenzhen'), analyzer.check_weather_alerts('shenzhen', thresholds))
+        analyzer.hot_window = window
+        
+        # 清空后窗口未预热，读取回退到数据库，并用查询结果预热窗口
+        window.invalidate(4)
+        cold = analyzer.get_recent_data('shenzhen')
+        primed = window.frame(4, datetime.now() - timedelta(hours=23), datetime.now()) is not None
+        primed_again = analyzer.get_recent_data('shenzhen')
+        
+        # 只读进程的窗口（收不到提交）：首次读取时预热；其他进程新写入的观测在到达刷新间隔、重新加载后可见
+        reader_window = HotWindow(round_values=window.round_values, refresh_seconds=60)
+        analyzer.hot_window = reader_window
+        reader_cold = analyzer.get_latest_observation('shenzhen')
+        reader_warm = reader_window.latest(4, now - timedelta(hours=24), datetime.now()) is not None
+        storage.store_historical_weather(df.iloc[-1:].assign(timestamp=[now - timedelta(minutes=10)], temperature=[40.0]))
+        before_refresh = analyzer.get_latest_observation('shenzhen')
+        reader_window.buffers[4].loaded_at -= 120
+        after_refresh = analyzer.get_latest_observation('shenzhen')
+        analyzer.hot_window = window
+        reader_success = (reader_warm and reader_cold.equals(expected[1]) and before_refresh.equals(expected[1])
+                          and after_refresh['temperature'] == 40.0)
+        
+        # 环形缓冲区：超出容量和时间窗口的观测被移除，迟到的数据按时间合并（同一时间以新数据为准）
+        ring = HotWindow(hours=2, capacity=5)
+        base = datetime(2024, 1, 1)
+        ring.append(df.assign(timestamp=[base + timedelta(minutes=30 * i) for i in range(count)]))
+        ring.append(df.iloc[:1].assign(timestamp=[base + timedelta(hours=13)], temperature=[99.0]))
+        kept = ring.frame(4, base + timedelta(hours=12, minutes=30), base + timedelta(hours=15))
+        ring_success = (kept is not None and len(kept) == 5 and kept.loc[base + timedelta(hours=13), 'temperature'] == 99.0
+                        and ring.frame(4, base + timedelta(hours=12), base + timedelta(hours=15)) is None)
+        
+        if (success and warm and ring_success and len(hot[0]) == 24 and hot[0].equals(expected[0]) and hot[1].equals(expected[1])
+                and hot[1].name == expected[1].name and hot[2].equals(expected[2]) and hot[3] == expected[3]
+                and len(hot[3]) == 1 and cold.equals(expected[0]) and primed and primed_again.equals(expected[0]) and reader_success):
+            logger.info(f"热数据窗口测试通过: 最近24小时 {len(hot[0])} 条观测，最新气温 {hot[1]['temperature']}")
+            return True
+        else:
+            logger.error(f"热数据窗口读取结果与数据库不一致: 写入 {success}，预热 {warm}，环形缓冲区 {ring_success}，只读进程 {reader_success}，"
+                         f"内存 {len(hot[0])} 条，数据库 {len(expected[0])} 条，"
+                         f"最新观测 {hot[1].to_dict() if hot[1] is not None else None} / {expected[1].to_dict() if expected[1] is not None else None}")
+            return False
+    except Exception as e:
+        logger.error(f"热数据窗口测试失败: {e}", exc_info=True)
+        return False
+    finally:
+        analyzer.close()
+        storage.close()
+
+def test_group_commit_writer():
+    """测试组提交写入服务（多个生产者并发提交的数据合并写入，各批次分别得到自己的提交和隔离结果）"""
+    logger.info("=== 开始测试组提交写入服务 ===")
+    
+    try:
+        # 使用独立的SQLite数据库，测试数据不写入配置的数据库
+        storage = WeatherDataStorage(DatabaseManager(SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))))
+        storage.db_manager.init_database()
+        writer = GroupCommitWriter(storage, max_rows=1000, max_latency_ms=100)
+        
+        def make_batch(city_id, minute, day=1):
+            return pd.DataFrame({
+                'city_id': [city_id],
+                'source_id': [1],
+                'timestamp': [datetime(2004, 1, day) + timedelta(minutes=minute)],
+                'temperature': [5.0],
+                'pressure': [1025.0],
+                'humidity': [30.0],
+                'precipitation': [0.0],
+                'wind_speed': [4.0],
+                'wind_direction': [270.0]
+            })
+        
+        futures = []
+        def produce(city_id):
+            for minute in range(10):
+                futures.append(writer.submit('realtime', make_batch(city_id, minute)))
+        
+        producers = [threading.Thread(target=produce, args=(city_id,)) for city_id in range(1, 4)]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        
+        results = [future.result(timeout=30) for future in futures]
+        writer.close()
+        
+        # 问题行只计入所在批次；第一个分块提交后数据表不可用，后续分块写入失败
+        storage.chunk_size = 2
+        isolated_writer = GroupCommitWriter(storage, max_rows=1000, max_latency_ms=1000)
+        bad_batch = pd.concat([make_batch(1, 0, 2), make_batch(None, 1, 2)], ignore_index=True)
+        quarantine_futures = [isolated_writer.submit('historical', bad_batch),
+                              isolated_writer.submit('historical', make_batch(1, 2, 2))]
+        isolated_writer.flush(timeout=30)
+        quarantine_results = [future.result(timeout=30) for future in quarantine_futures]
+        
+        def break_table(target_table, frame):
+            with storage.db_manager.engine.begin() as conn:
+                conn.execute(text("ALTER TABLE real_time_weather RENAME TO real_time_weather_offline"))
+            storage.commit_listeners.remove(break_table)
+        storage.add_commit_listener(break_table)
+        failure_futures = [isolated_writer.submit('realtime', make_batch(1, minute, 3)) for minute in range(4)]
+        isolated_writer.flush(timeout=30)
+        failure_results = [future.result(timeout=30) for future in failure_futures]
+        isolated_writer.close()
+        
+        if (len(results) == 30 and all(success and committed == 1 for success, committed, _ in results)
+                and quarantine_results == [(True, 1, 1), (True, 1, 0)]
+                and failure_results == [(True, 1, 0), (True, 1, 0), (False, 0, 0), (False, 0, 0)]):
+            logger.info(f"组提交写入成功，共 {sum(committed for _, committed, _ in results)} 行")
+            logger.info("组提交写入服务测试通过")
+            return True, storage
+        else:
+            logger.error(f"组提交写入结果不符合预期: 隔离 {quarantine_results}，部分失败 {failure_results}")
+            return False, None
+    except Exception as e:
+        logger.error(f"组提交写入服务测试失败: {e}", exc_info=True)
+        return False, None
+
+def test_cleaning_log_sink():
+    """测试清洗日志后台批量写入（提交不等待落库，写入失败的日志放回缓冲区重试，关闭时写入剩余日志）"""
+    logger.info("=== 开始测试清洗日志批量写入 ===")
+    
+    try:
+        # 使用独立的SQLite数据库，测试数据不写入配置的数据库
+        storage = WeatherDataStorage(DatabaseManager(SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))))
+        storage.db_manager.init_database()
+        
+        logs = [{
+            'process_time': datetime.now(),
+            'data_source': 'test',
+            'field_name': 'temperature',
+            'process_type': '异常值检测',
+            'process_method': 'median',
+            'before_count': 100,
+            'after_count': 99,
+            'affected_count': 1,
+            'description': f"测试日志{i}"
+        } for i in range(5)]
+        
+        accepted = storage.cleaning_log_sink.submit(logs)
+        success, written = storage.cleaning_log_sink.flush()
+        
+        # 数据库暂时不可用，写入期间又提交了3条：失败的5条放回新日志之前，超出缓冲区上限的2条计入丢弃数
+        outage = {'down': True, 'written': []}
+        def write_logs(batch):
+            if outage['down']:
+                sink.submit(logs[:3])
+                return False, 0
+            outage['written'].extend(batch)
+            return True, len(batch)
+        sink = CleaningLogSink(write_logs, buffer_size=6, batch_size=100, flush_interval=60)
+        sink.submit(logs)
+        failed = sink.flush()
+        outage['down'] = False
+        recovered = sink.flush()
+        sink.close()
+        retry_success = (failed == (False, 0) and recovered == (True, 6) and sink.dropped_count == 2
+                         and [log['description'] for log in outage['written']] == [log['description'] for log in logs[:3] * 2])
+        
+        if accepted == 5 and success and written == 5 and retry_success:
+            logger.info(f"清洗日志批量写入成功，写入: {written}条")
+            logger.info("清洗日志批量写入测试通过")
+            return True, storage
+        else:
+            logger.error(f"清洗日志批量写入结果不符合预期: 写入 {written}条，重试 {retry_success}")
+            return False, None
+    except Exception as e:
+        logger.error(f"清洗日志批量写入测试失败: {e}", exc_info=True)
+        return False, None
+
+def test_ingest_pipeline():
+    """测试采集数据在内存中验证、预处理后直接入库（不经过文件中转）"""
+    logger.info("=== 开始测试内存入库流水线 ===")
+    
+    try:
+        # 使用独立的SQLite数据库，测试数据不写入配置的数据库
+        storage = WeatherDataStorage(DatabaseManager(SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))))
+        storage.db_manager.init_database()
+        pipeline = WeatherIngestPipeline(storage=storage, archive=False)
+        
+        realtime_data = {
+            'timestamp': '2005-06-01 12:00:00',
+            'city': 'chengdu',
+            'temperature': 28.5,
+            'pressure': 1005.0,
+            'humidity': 70.0,
+            'precipitation': 0.0,
+            'wind_speed': 2.0,
+            'wind_direction': 90.0,
+            'source': 'OpenWeatherMap'
+        }
+        realtime_success, _, _ = pipeline.ingest(realtime_data, 'realtime')
+        
+        dates = [datetime(2005, 6, 1) + timedelta(hours=i) for i in range(24)]
+        historical_data = pd.DataFrame({
+            'timestamp': [d.strftime('%Y-%m-%d %H:%M:%S') for d in dates],
+            'city': ['chengdu'] * 24,
+            'temperature': [24 + (i % 6) for i in range(24)],
+            'pressure': [1006.0] * 24,
+            'humidity': [65.0] * 24,
+            'precipitation': [0.0] * 24,
+            'wind_speed': [1.5] * 24,
+            'wind_direction': [180.0] * 24,
+            'source': ['Meteostat'] * 24
+        })
+        historical_success, _, _ = pipeline.ingest(historical_data, 'historical')
+        
+        if realtime_success and historical_success:
+            logger.info("内存入库流水线测试通过")
+            return True, pipeline
+        else:
+            logger.error("内存入库流水线结果不符合预期")
+            return False, None
+    except Exception as e:
+        logger.error(f"内存入库流水线测试失败: {e}", exc_info=True)
+        return False, None
+
+def test_parquet_lake():
+    """测试Parquet数据湖的分区写入、合并与读取"""
+    logger.info("=== 开始测试Parquet数据湖 ===")
+    
+    try:
+        lake = ParquetLake(root=tempfile.mkdtemp(), compact_threshold=100)
+        
+        def make_batch(temperature):
+            timestamps = pd.date_range('2007-01-31 20:00:00', periods=8, freq='h')
+            return pd.DataFrame({
+                'city_id': [1] * 8,
+                'source_id': [2] * 8,
+                'timestamp': timestamps,
+                'temperature': [temperature] * 8,
+                'pressure': [1010.0] * 8,
+                'humidity': [60.0] * 8,
+                'precipitation': [0.0] * 8,
+                'wind_speed': [3.0] * 8,
+                'wind_direction': [45.0] * 8,
+                'status': [1] * 8
+            })
+        
+        # 跨月的数据写入两个分区；同一观测再次写入后读取时以最后一次为准
+        lake.append('real_time_weather', make_batch(1.0))
+        lake.append('real_time_weather', make_batch(2.0))
+        compacted = lake.compact('real_time_weather')
+        all_rows = lake.read('real_time_weather')
+        february = lake.read('real_time_weather', city_ids=[1], start_date='2007-02-01')
+        
+        if (compacted == 2 and len(all_rows) == 8 and (all_rows['temperature'] == 2.0).all()
+                and len(february) == 4):
+            logger.info("Parquet数据湖测试通过")
+            return True
+        else:
+            logger.error("Parquet数据湖读写结果不符合预期")
+            return False
+    except Exception as e:
+        logger.error(f"Parquet数据湖测试失败: {e}", exc_info=True)
+        return False
+
+def test_extreme_event_key():
+    """测试极端事件唯一事件键（旧表去重后建唯一索引，批量插入跳过已存在和批内重复的事件）"""
+    logger.info("=== 开始测试极端事件唯一事件键 ===")
+    
+    try:
+        backend = SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))
+        db_manager = DatabaseManager(backend)
+        db_manager.init_database()
+        
+        def event(day, event_type='高温'):
+            return {'city_id': 1, 'source_id': 3, 'event_type': event_type, 'event_level': 2,
+                    'start_time': datetime(2011, 7, day), 'end_time': datetime(2011, 7, day, 6), 'status': 1}
+        
+        # 模拟旧版本的表：只有非唯一的 idx_city_event 索引，存在重复事件
+        table = ExtremeEvent.__table__
+        with db_manager.engine.begin() as conn:
+            next(index for index in table.indexes if index.name == 'uq_city_event_time').drop(conn)
+            conn.execute(text("CREATE INDEX idx_city_event ON extreme_events (city_id)"))
+            conn.execute(insert(table), [event(1), event(1), event(2)])
+        
+        key_success = db_manager.ensure_extreme_event_key()
+        index_names = {index['name'] for index in inspect(db_manager.engine).get_indexes(table.name)}
+        
+        # 两个已存在的事件、一个新事件及其批内重复，第二次加载全部跳过
+        storage = WeatherDataStorage(db_manager)
+        events = pd.DataFrame([event(1), event(2), event(3), event(3)])
+        first_success, first_stored = storage.store_extreme_events(events)
+        second_success, second_stored = storage.store_extreme_events(events)
+        with db_manager.engine.connect() as conn:
+            total = conn.execute(select(func.count()).select_from(table)).scalar()
+        storage.close()
+        
+        # 模型的表定义不应多出旧索引（否则之后的建表和迁移会重新创建它）
+        model_indexes = {index.name for index in table.indexes}
+        
+        if (key_success and 'uq_city_event_time' in index_names and 'idx_city_event' not in index_names
+                and 'idx_city_event' not in model_indexes
+                and first_success and first_stored == 1 and second_success and second_stored == 0 and total == 3):
+            logger.info("极端事件唯一事件键测试通过")
+            return True
+        else:
+            logger.error(f"极端事件唯一事件键结果不符合预期: indexes={index_names}, model_indexes={model_indexes}, "
+                         f"stored={first_stored}/{second_stored}, total={total}")
+            return False
+    except Exception as e:
+        logger.error(f"极端事件唯一事件键测试失败: {e}", exc_info=True)
+        return False
+
+def test_extreme_event_loader():
+    """测试由逐条观测构建极端事件（连续超阈值的观测合并为一个事件）"""
+    logger.info("=== 开始测试极端事件构建 ===")
+    
+    try:
+        # 使用独立的SQLite数据库，测试数据不写入配置的数据库
+        storage = WeatherDataStorage(DatabaseManager(SQLiteBackend(path=os.path.join(tempfile.mkdtemp(), 'weather_data.db'))))
+        storage.db_manager.init_database()
+        loader = ExtremeEventLoader(storage, max_gap_hours=3)
+        
+        dates = [datetime(2008, 7, 1) + timedelta(hours=i) for i in range(12)]
+        # 第2-4小时、第8-9小时两段高温
+        temperatures = [30, 30, 36, 38, 40, 30, 30, 30, 37, 36, 30, 30]
+        df = pd.DataFrame({
+            'timestamp': dates,
+            'city': ['guangzhou'] * 12,
+            'temperature': temperatures,
+            'pressure': [1002.0] * 12,
+            'humidity': [70.0] * 12,
+            'precipitation': [0.0] * 12,
+            'wind_speed': [2.0] * 12,
+            'wind_direction': [200.0] * 12,
+            'source': ['Kaggle'] * 12
+        })
+        
+        events = loader.build_events(df)
+        success, stored = loader.load_dataframe(df)
+        # 无法确定城市的数据返回失败而不是抛出异常
+        no_city_result = loader.load_dataframe(df.drop(columns=['city']))
+        
+        if (len(events) == 2 and events['start_time'].tolist() == [dates[2], dates[8]]
+                and events['max_temperature'].tolist() == [40, 37] and success and no_city_result == (False, 0)):
+            logger.info(f"极端事件构建成功，新增: {stored}个")
+            logger.info("极端事件构建测试通过")
+            return True, loader
+        else:
+            logger.error("极端事件构建结果不符合预期")
+            return False, None
+    except Exception as e:
+        logger.error(f"极端事件构建测试失败: {e}", exc_info=True)
+        return False, None
+
 def main():
     """主测试函数"""
     logger.info("=== 开始系统测试 ===")
@@ -135,22 +1422,142 @@ def main():
     # 测试数据库初始化
     db_success, db_manager = test_database_init()
     
+    # 测试SQLite后端
+    sqlite_success = test_sqlite_backend()
+    
+    # 测试共享引擎注册表
+    registry_success = test_engine_registry()
+    
+    # 测试站点目录与城市ID映射
+    catalog_success = test_station_catalog()
+    
+    # 测试表结构迁移
+    migration_success = test_schema_migration()
+    
+    # 测试聚簇主键布局迁移
+    layout_success = test_clustered_layout()
+    
+    # 测试历史数据分区
+    partition_success = test_historical_partitioning()
+    
+    # 测试查询执行计划检查
+    plan_success = test_query_plans()
+    
+    # 测试读写分离
+    replica_success = test_read_replicas()
+    
     # 测试数据存储
     storage_success, storage = test_data_storage()
     
+    # 测试批量入库
+    bulk_success, bulk_storage = test_bulk_storage()
+    
+    # 测试CSV流式加载
+    streaming_success, streaming_storage = test_streaming_csv_load()
+    
+    # 测试增量加载
+    manifest_success, manifest_storage = test_ingest_manifest()
+    
+    # 测试多进程并行加载
+    parallel_success = test_parallel_loader()
+    
+    # 测试问题数据隔离
+    quarantine_success, quarantine_storage = test_quarantine()
+    
+    # 测试汇总表增量维护
+    rollup_success, rollup_storage = test_weather_rollups()
+    
+    # 测试实时数据保留与压缩
+    retention_success, retention_storage = test_realtime_retention()
+    
+    # 测试异步数据访问层
+    async_success = test_async_data_access()
+    
+    # 测试多线程会话管理
+    threaded_success = test_concurrent_sessions()
+    
+    # 测试热数据窗口
+    hot_window_success = test_hot_window()
+    
+    # 测试组提交写入服务
+    writer_success, writer_storage = test_group_commit_writer()
+    
+    # 测试清洗日志批量写入
+    sink_success, sink_storage = test_cleaning_log_sink()
+    
+    # 测试内存入库流水线
+    pipeline_success, pipeline = test_ingest_pipeline()
+    
+    # 测试Parquet数据湖
+    lake_success = test_parquet_lake()
+    
+    # 测试极端事件唯一事件键
+    event_key_success = test_extreme_event_key()
+    
+    # 测试极端事件构建
+    event_success, event_loader = test_extreme_event_loader()
+    
     # 关闭资源
     if 'db_manager' in locals() and db_manager:
         db_manager.close()
     if 'storage' in locals() and storage:
         storage.close()
+    if bulk_storage:
+        bulk_storage.close()
+    if streaming_storage:
+        streaming_storage.close()
+    if manifest_storage:
+        manifest_storage.close()
+    if quarantine_storage:
+        quarantine_storage.close()
+    if rollup_storage:
+        rollup_storage.close()
+    if retention_storage:
+        retention_storage.close()
+    if writer_storage:
+        writer_storage.close()
+    if sink_storage:
+        sink_storage.close()
+    if pipeline:
+        pipeline.close()
+    if event_loader:
+        event_loader.close()
     
     # 输出测试结果
     logger.info("=== 系统测试结果 ===")
     logger.info(f"数据预处理测试: {'通过' if preprocess_success else '失败'}")
     logger.info(f"数据库初始化测试: {'通过' if db_success else '失败'}")
+    logger.info(f"SQLite后端测试: {'通过' if sqlite_success else '失败'}")
+    logger.info(f"共享引擎注册表测试: {'通过' if registry_success else '失败'}")
+    logger.info(f"站点目录与城市ID映射测试: {'通过' if catalog_success else '失败'}")
+    logger.info(f"表结构迁移测试: {'通过' if migration_success else '失败'}")
+    logger.info(f"聚簇主键布局迁移测试: {'通过' if layout_success else '失败'}")
+    logger.info(f"历史数据分区测试: {'通过' if partition_success else '失败'}")
+    logger.info(f"查询执行计划检查测试: {'通过' if plan_success else '失败'}")
+    logger.info(f"读写分离测试: {'通过' if replica_success else '失败'}")
     logger.info(f"数据存储测试: {'通过' if storage_success else '失败'}")
+    logger.info(f"批量入库测试: {'通过' if bulk_success else '失败'}")
+    logger.info(f"CSV流式加载测试: {'通过' if streaming_success else '失败'}")
+    logger.info(f"增量加载测试: {'通过' if manifest_success else '失败'}")
+    logger.info(f"多进程并行加载测试: {'通过' if parallel_success else '失败'}")
+    logger.info(f"问题数据隔离测试: {'通过' if quarantine_success else '失败'}")
+    logger.info(f"汇总表增量维护测试: {'通过' if rollup_success else '失败'}")
+    logger.info(f"实时数据保留与压缩测试: {'通过' if retention_success else '失败'}")
+    logger.info(f"异步数据访问层测试: {'通过' if async_success else '失败'}")
+    logger.info(f"多线程会话管理测试: {'通过' if threaded_success else '失败'}")
+    logger.info(f"热数据窗口测试: {'通过' if hot_window_success else '失败'}")
+    logger.info(f"组提交写入服务测试: {'通过' if writer_success else '失败'}")
+    logger.info(f"清洗日志批量写入测试: {'通过' if sink_success else '失败'}")
+    logger.info(f"内存入库流水线测试: {'通过' if pipeline_success else '失败'}")
+    logger.info(f"Parquet数据湖测试: {'通过' if lake_success else '失败'}")
+    logger.info(f"极端事件唯一事件键测试: {'通过' if event_key_success else '失败'}")
+    logger.info(f"极端事件构建测试: {'通过' if event_success else '失败'}")
     
-    if preprocess_success and db_success and storage_success:
+    if (preprocess_success and db_success and sqlite_success and registry_success and catalog_success and migration_success
+            and layout_success and partition_success and plan_success and replica_success and storage_success and bulk_success
+            and streaming_success and manifest_success and parallel_success and quarantine_success
+            and rollup_success and retention_success and async_success and threaded_success and hot_window_success and writer_success and sink_success and pipeline_success and lake_success
+            and event_key_success and event_success):
         logger.info("所有测试通过，系统功能正常")
         return 0
     else:
@@ -31,13 +31,13 @@ def view_table_data(session, table_name, limit=10):
             data = session.query(HistoricalWeather).order_by(HistoricalWeather.timestamp.desc()).limit(limit).all()
             print(f"\n=== 历史天气数据表数据 (前{limit}条，按时间倒序) ===")
             for weather in data:
-                print(f"ID: {weather.id}, 城市ID: {weather.city_id}, 数据源ID: {weather.source_id}, 时间: {weather.timestamp}, 温度: {weather.temperature}°C, 湿度: {weather.humidity}%, 风速: {weather.wind_speed}m/s")
+                print(f"ID: {getattr(weather, 'id', '-')}, 城市ID: {weather.city_id}, 数据源ID: {weather.source_id}, 时间: {weather.timestamp}, 温度: {weather.temperature}°C, 湿度: {weather.humidity}%, 风速: {weather.wind_speed}m/s")
         
         elif table_name == 'real_time_weather':
             data = session.query(RealTimeWeather).order_by(RealTimeWeather.timestamp.desc()).limit(limit).all()
             print(f"\n=== 实时天气数据表数据 (前{limit}条，按时间倒序) ===")
             for weather in data:
-                print(f"ID: {weather.id}, 城市ID: {weather.city_id}, 数据源ID: {weather.source_id}, 时间: {weather.timestamp}, 温度: {weather.temperature}°C, 湿度: {weather.humidity}%, 风速: {weather.wind_speed}m/s")
+                print(f"ID: {getattr(weather, 'id', '-')}, 城市ID: {weather.city_id}, 数据源ID: {weather.source_id}, 时间: {weather.timestamp}, 温度: {weather.temperature}°C, 湿度: {weather.humidity}%, 风速: {weather.wind_speed}m/s")
         
         elif table_name == 'extreme_events':
             data = session.query(ExtremeEvent).order_by(ExtremeEvent.start_time.desc()).limit(limit).all()
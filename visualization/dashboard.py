@@ -9,6 +9,7 @@ load_dotenv()
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import dash
+from flask import jsonify
 from dash import dcc, html, Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
@@ -19,17 +20,28 @@ from datetime import datetime, timedelta
 # 导入自定义模块
 from analysis.data_analyzer import WeatherDataAnalyzer
 from visualization.charts import WeatherCharts
+from processing.engine_registry import registry
 
 # 初始化Dash应用
 app = dash.Dash(__name__, title='气象数据分析与可视化系统', suppress_callback_exceptions=True)
 server = app.server
 
-# 初始化分析器和图表生成器
+# 初始化分析器和图表生成器（分析器不保存会话，所有回调线程共用一个实例）
 analyzer = WeatherDataAnalyzer()
 charts = WeatherCharts()
 
-# 城市列表
-CITIES = ['beijing', 'shanghai', 'guangzhou', 'shenzhen', 'chengdu']
+@server.route('/metrics/db-pool')
+def db_pool_metrics():
+    """数据库连接池指标（连接池大小、已借出和溢出连接数、获取连接的等待时间）"""
+    return jsonify(registry.metrics())
+
+@server.route('/metrics/db-replicas')
+def db_replica_metrics():
+    """只读副本的可用状态和复制延迟（秒）"""
+    return jsonify(analyzer.db_manager.replica_status())
+
+# 城市列表（站点目录中的城市）
+CITIES = sorted(analyzer.city_ids.coordinates())
 
 # 指标列表
 METRICS = [
@@ -897,5 +909,7 @@ if __name__ == '__main__':
     host = os.getenv('DASH_HOST', '0.0.0.0')
     port = int(os.getenv('DASH_PORT', 8050))
     debug = os.getenv('DASH_DEBUG', 'True').lower() == 'true'
+    # 回调按请求使用独立的数据库会话，可以在多个线程中并发执行；并发线程数较多时相应调大 DB_POOL_SIZE
+    threaded = os.getenv('DASH_THREADED', 'True').lower() == 'true'
     
-    app.run(debug=debug, host=host, port=port)
+    app.run(debug=debug, host=host, port=port, threaded=threaded)